@@ -0,0 +1,138 @@
+import math
+import queue
+import threading
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# ==============================================================================
+# BATCHED AUGMENTATION ON THE TRAINING DEVICE
+# ==============================================================================
+# Status crops stay uint8 until they reach the training device; augmentation then
+# runs on the whole batch there. It draws from the same distribution as the PIL
+# pipeline it replaces:
+#   RandomHorizontalFlip(0.5), RandomRotation(10) (nearest, black fill),
+#   ColorJitter(brightness=0.2, contrast=0.2) (factors in [0.8, 1.2], random order),
+#   ToTensor + Normalize.
+# Crops are already 224x224, so the old Resize((224, 224)) was a no-op.
+# All random draws come from seeded generators, so a run is reproducible.
+
+GRAY_WEIGHTS = torch.tensor([0.2989, 0.587, 0.114])  # as torchvision rgb_to_grayscale
+
+
+class BatchAugment:
+    """Augment and normalize a uint8 NHWC batch on its device; returns float NCHW."""
+
+    def __init__(self, device, mean, std, flip_p=0.5, degrees=10.0, brightness=0.2, contrast=0.2, seed=0):
+        self.device = torch.device(device)
+        self.mean = torch.tensor(mean, device=self.device).view(1, 3, 1, 1)
+        self.std = torch.tensor(std, device=self.device).view(1, 3, 1, 1)
+        self.flip_p = flip_p
+        self.degrees = degrees
+        self.brightness = brightness
+        self.contrast = contrast
+        self.generator = torch.Generator(device=self.device).manual_seed(seed)
+
+    def _uniform(self, n, low, high):
+        return low + (high - low) * torch.rand(n, device=self.device, generator=self.generator)
+
+    def _rotate(self, x):
+        """Rotate each image by its own angle about the center, nearest neighbour, zero fill."""
+        n, _, h, w = x.shape
+        angles = self._uniform(n, -self.degrees, self.degrees) * (math.pi / 180)
+        cos, sin = torch.cos(angles), torch.sin(angles)
+        # Output -> input sampling matrix in normalized coordinates; positive angles turn
+        # the image counter-clockwise, as in torchvision's rotate.
+        theta = torch.zeros(n, 2, 3, device=self.device)
+        theta[:, 0, 0] = cos
+        theta[:, 0, 1] = -sin * h / w
+        theta[:, 1, 0] = sin * w / h
+        theta[:, 1, 1] = cos
+        grid = F.affine_grid(theta, list(x.shape), align_corners=False)
+        return F.grid_sample(x, grid, mode="nearest", padding_mode="zeros", align_corners=False)
+
+    def _color_jitter(self, x):
+        """Brightness and contrast jitter in place, each image in its own random order."""
+        n = x.shape[0]
+        b = self._uniform(n, 1 - self.brightness, 1 + self.brightness).view(n, 1, 1, 1)
+        c = self._uniform(n, 1 - self.contrast, 1 + self.contrast).view(n, 1, 1, 1)
+        brightness_first = torch.rand(n, device=self.device, generator=self.generator) < 0.5
+
+        def brightness(img, idx):
+            return img.mul_(b[idx]).clamp_(0, 1)
+
+        def contrast(img, idx):
+            # Mean of the grayscale image == gray weights applied to the per-channel means
+            mean = (img.mean(dim=(2, 3)) * GRAY_WEIGHTS.to(img.device)).sum(1).view(-1, 1, 1, 1)
+            return img.mul_(c[idx]).add_((1 - c[idx]) * mean).clamp_(0, 1)
+
+        for first, idx in ((True, brightness_first), (False, ~brightness_first)):
+            if idx.any():
+                part = x[idx]
+                x[idx] = contrast(brightness(part, idx), idx) if first else brightness(contrast(part, idx), idx)
+        return x
+
+    def __call__(self, batch, train=True):
+        x = batch.permute(0, 3, 1, 2).float().div_(255)
+        if train:
+            n = x.shape[0]
+            flip = torch.rand(n, device=self.device, generator=self.generator) < self.flip_p
+            x[flip] = x[flip].flip(-1)
+            x = self._rotate(x)
+            x = self._color_jitter(x)
+        return x.sub_(self.mean).div_(self.std)
+
+
+class ArrayBatchLoader:
+    """
+    Batches from a uint8 (N, H, W, 3) array (in RAM or memory-mapped) and its labels.
+    A background thread gathers and pins the next batches while the device trains on
+    the current one. Yields (uint8 NHWC images, int64 labels) already on `device`.
+    """
+
+    def __init__(self, images, labels, batch_size, device, shuffle=False, seed=0, prefetch=2):
+        self.images = images
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.prefetch = prefetch
+
+    def __len__(self):
+        return (len(self.labels) + self.batch_size - 1) // self.batch_size
+
+    def _batches(self, order):
+        pin = self.device.type == "cuda"
+        for start in range(0, len(order), self.batch_size):
+            # Sorted indices read the memmap in file order; the order inside a batch does not matter
+            idx = np.sort(order[start:start + self.batch_size])
+            images = torch.from_numpy(np.ascontiguousarray(self.images[idx]))
+            labels = torch.from_numpy(self.labels[idx])
+            if pin:
+                images, labels = images.pin_memory(), labels.pin_memory()
+            yield images, labels
+
+    def __iter__(self):
+        order = self.rng.permutation(len(self.labels)) if self.shuffle else np.arange(len(self.labels))
+        batches = queue.Queue(maxsize=self.prefetch)
+        done = object()
+
+        def produce():
+            try:
+                for item in self._batches(order):
+                    batches.put(item)
+            except BaseException as e:  # surface loader errors in the training thread
+                batches.put(e)
+            batches.put(done)
+
+        threading.Thread(target=produce, daemon=True).start()
+        while True:
+            item = batches.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            images, labels = item
+            yield images.to(self.device, non_blocking=True), labels.to(self.device, non_blocking=True)
@@ -0,0 +1,1200 @@
+import os
+import time
+
+# ==============================================================================
+# LOCAL CPU BENCHMARKS
+# ==============================================================================
+# Micro-benchmarks for the inference and data-prep hot paths.
+# They run locally on CPU with randomly initialized weights:
+#   python modal-pipeline/models/benchmarks.py status crops batch overlap align onnx precision dataset packed augment stages hotpaths enhance decode devicecrops pipeline cascade reinfer
+#   python modal-pipeline/models/benchmarks.py hotpaths --save-baseline baseline.json
+#   python modal-pipeline/models/benchmarks.py --compare baseline.json
+
+SAMPLE_LABELME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataset", "newdataset.json")
+
+
+def _timeit(fn, repeats):
+    """Return the median wall time of fn() in seconds over `repeats` runs."""
+    import statistics
+
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def _peak_memory(fn):
+    """Return (result, peak traced allocation in bytes) for one call of fn()."""
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def _sample_polygons(width, height):
+    """Tooth polygons from the bundled Labelme sample, rescaled to width x height."""
+    import json
+
+    with open(SAMPLE_LABELME_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    sx = width / data["imageWidth"]
+    sy = height / data["imageHeight"]
+    return [
+        [[x * sx, y * sy] for x, y in shape["points"]]
+        for shape in data["shapes"]
+        if shape.get("shape_type") == "polygon" and len(shape.get("points", [])) >= 3
+    ]
+
+
+def _synthetic_panoramic(width=3000, height=1500, seed=0):
+    """Grayscale-looking BGR panoramic: smooth gradient plus noise."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 200, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+    noise = rng.normal(0, 20, (height, width)).astype(np.float32)
+    gray = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+def _random_status_model(seed=0):
+    """ResNet18 status classifier with random weights (no checkpoint needed)."""
+    import torch
+    from torchvision import models
+
+    from inference import NUM_STATUS_CLASSES
+
+    torch.manual_seed(seed)
+    model = models.resnet18(weights=None)
+    model.fc = torch.nn.Linear(model.fc.in_features, NUM_STATUS_CLASSES)
+    model.eval()
+    return model
+
+
+def _random_crops(n, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (224, 224, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def bench_status_batching(n_teeth=30, repeats=5, batch_size=32, threads=None):
+    """Per-tooth status loop vs one batched forward pass, on CPU."""
+    import torch
+
+    from inference import _predict_status, _predict_status_batch, _status_transform
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    model = _random_status_model()
+    transform = _status_transform()
+    crops = _random_crops(n_teeth)
+
+    def per_tooth():
+        return [_predict_status(crop, model, transform) for crop in crops]
+
+    def batched():
+        return _predict_status_batch(crops, model, batch_size)
+
+    reference = per_tooth()
+    candidate = batched()
+    same_ids = all(a["status_id"] == b["status_id"] for a, b in zip(reference, candidate))
+    max_conf_diff = max(abs(a["confidence"] - b["confidence"]) for a, b in zip(reference, candidate))
+
+    per_tooth_s = _timeit(per_tooth, repeats)
+    batched_s = _timeit(batched, repeats)
+
+    return {
+        "n_teeth": n_teeth,
+        "batch_size": batch_size,
+        "per_tooth_s": per_tooth_s,
+        "batched_s": batched_s,
+        "speedup": per_tooth_s / batched_s if batched_s > 0 else float("inf"),
+        "same_status_ids": same_ids,
+        "max_confidence_diff": max_conf_diff,
+    }
+
+
+def bench_crops(width=3000, height=1500, repeats=5):
+    """Full-frame vs ROI-local masked crops: time and peak memory per image."""
+    import numpy as np
+
+    from crops import masked_tooth_crop, masked_tooth_crop_full_frame
+
+    image = _synthetic_panoramic(width, height)
+    polygons = _sample_polygons(width, height)
+
+    def run(crop_fn):
+        return lambda: [crop_fn(image, points) for points in polygons]
+
+    reference, full_frame_peak = _peak_memory(run(masked_tooth_crop_full_frame))
+    candidate, roi_peak = _peak_memory(run(masked_tooth_crop))
+    identical = all(
+        (a is None and b is None) or (a is not None and b is not None and np.array_equal(a, b))
+        for a, b in zip(reference, candidate)
+    )
+
+    full_frame_s = _timeit(run(masked_tooth_crop_full_frame), repeats)
+    roi_s = _timeit(run(masked_tooth_crop), repeats)
+
+    return {
+        "image_size": [width, height],
+        "teeth": len(polygons),
+        "full_frame_s_per_image": full_frame_s,
+        "roi_s_per_image": roi_s,
+        "speedup": full_frame_s / roi_s if roi_s > 0 else float("inf"),
+        "full_frame_peak_mb": full_frame_peak / 1e6,
+        "roi_peak_mb": roi_peak / 1e6,
+        "pixel_identical": identical,
+    }
+
+
+def _random_predictor(fdi_model_cfg="yolo11n-seg.yaml"):
+    """DentalPredictor with a randomly initialized YOLO (from its yaml) and status model."""
+    from inference import DentalPredictor
+
+    predictor = DentalPredictor(fdi_model_path=fdi_model_cfg, status_model_path="", warmup=False)
+    predictor.status_model = _random_status_model()
+    return predictor
+
+
+def bench_batch_prediction(n_images=8, batch_size=8, repeats=3, seed=0):
+    """
+    Sequential single-image prediction vs multi-image batch prediction (scans/sec) on
+    2:1 scans of four resolutions, which share YOLO calls, and whether both give the
+    same teeth: labels, and boxes (sorted, as teeth level in x may come out in another
+    order) within a pixel.
+    """
+    import tempfile
+
+    import numpy as np
+
+    from inference import DentalPredictor, _run_batch_prediction_core, _run_prediction_core
+
+    tmp_dir = tempfile.mkdtemp(prefix="batch-bench-")
+    fdi_path = _random_fdi_checkpoint(os.path.join(tmp_dir, "fdi.pt"), seed=seed)
+    predictor = DentalPredictor(fdi_model_path=fdi_path, status_model_path="", warmup=False)
+    predictor.status_model = _random_status_model(seed)
+    sizes = [(1600, 800), (1400, 700), (1200, 600), (1000, 500)]
+    images = [_synthetic_panoramic(*sizes[i % len(sizes)], seed=i) for i in range(n_images)]
+
+    def sequential():
+        return [_run_prediction_core(img, predictor=predictor) for img in images]
+
+    def batched():
+        return _run_batch_prediction_core(images, predictor=predictor, batch_size=batch_size)
+
+    batched()  # warmup
+    sequential_s = _timeit(sequential, repeats)
+    batched_s = _timeit(batched, repeats)
+
+    single, batch = sequential(), batched()
+    same_labels = all(
+        sorted(t["fdi"] for t in a["teeth"]) == sorted(t["fdi"] for t in b["teeth"]) for a, b in zip(single, batch)
+    )
+    bbox_diffs = [
+        float(np.abs(np.subtract(sorted(t["bbox"] for t in a["teeth"]), sorted(t["bbox"] for t in b["teeth"]))).max())
+        for a, b in zip(single, batch) if a["count"] == b["count"] and a["count"]
+    ]
+    return {
+        "n_images": n_images,
+        "batch_size": batch_size,
+        "teeth_per_scan": sum(r["count"] for r in single) / n_images,
+        "sequential_scans_per_s": n_images / sequential_s,
+        "batched_scans_per_s": n_images / batched_s,
+        "speedup": sequential_s / batched_s if batched_s > 0 else float("inf"),
+        "same_counts": all(a["count"] == b["count"] for a, b in zip(single, batch)),
+        "same_labels": same_labels,
+        "max_bbox_diff_px": max(bbox_diffs) if bbox_diffs else 0.0,
+    }
+
+
+def _random_detections(n, rng, width=3000, height=1500):
+    """Random tooth-like detections with clustered boxes, so duplicates actually occur."""
+    detections = []
+    for _ in range(n):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        bw, bh = rng.uniform(40, 160), rng.uniform(120, 400)
+        if detections and rng.random() < 0.4:
+            # Jitter an existing box to create a near-duplicate
+            base = detections[rng.integers(len(detections))]["bbox"]
+            cx = (base[0] + base[2]) / 2 + rng.normal(0, 10)
+            cy = (base[1] + base[3]) / 2 + rng.normal(0, 10)
+        bbox = [cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2]
+        contour = [[bbox[0], bbox[1]], [bbox[2], bbox[1]], [bbox[2], bbox[3]], [bbox[0], bbox[3]]]
+        detections.append({
+            "fdi": str(rng.choice(["11", "21", "31", "41"])),
+            # Coarse confidences so ties are exercised too
+            "confidence_fdi": float(round(rng.uniform(0.2, 1.0), 2)),
+            "bbox": bbox,
+            "contour": contour,
+        })
+    return detections
+
+
+def bench_overlap(n_detections=40, trials=500, repeats=20, seed=0):
+    """Vectorized _remove_overlapping vs the pure-Python reference: parity and speed."""
+    import numpy as np
+
+    from inference import _remove_overlapping, _remove_overlapping_reference
+
+    rng = np.random.default_rng(seed)
+    mismatches = 0
+    for _ in range(trials):
+        dets = _random_detections(int(rng.integers(0, n_detections + 1)), rng)
+        threshold = float(rng.choice([0.3, 0.5, 0.65]))
+        expected = _remove_overlapping_reference(dets, threshold)
+        actual = _remove_overlapping(dets, threshold)
+        if [id(d) for d in expected] != [id(d) for d in actual]:
+            mismatches += 1
+
+    dets = _random_detections(n_detections, rng)
+    reference_s = _timeit(lambda: _remove_overlapping_reference(dets), repeats)
+    vectorized_s = _timeit(lambda: _remove_overlapping(dets), repeats)
+    mask_s = _timeit(lambda: _remove_overlapping(dets, mode="mask"), repeats)
+
+    return {
+        "n_detections": n_detections,
+        "parity_trials": trials,
+        "parity_mismatches": mismatches,
+        "reference_s": reference_s,
+        "vectorized_s": vectorized_s,
+        "mask_mode_s": mask_s,
+        "speedup": reference_s / vectorized_s if vectorized_s > 0 else float("inf"),
+    }
+
+
+def _synthetic_jaw(expected, rng, drop_rate=0.15, swap_rate=0.2):
+    """Detections for one jaw: some teeth missing, some labels wrong."""
+    jaw = []
+    for label in expected:
+        if rng.random() < drop_rate:
+            continue
+        if rng.random() < swap_rate:
+            label = str(rng.choice(expected))
+        jaw.append({"fdi": label, "confidence_fdi": float(rng.uniform(0.3, 1.0))})
+    return jaw
+
+
+def bench_align(n_jaws=5000, seed=0):
+    """Batched NumPy aligner vs the cell-by-cell reference over synthetic jaws."""
+    import numpy as np
+
+    from inference import LOWER_EXPECTED, UPPER_EXPECTED, _align_jaws, _match_to_expected_reference
+
+    rng = np.random.default_rng(seed)
+    sequences = [UPPER_EXPECTED if k % 2 == 0 else LOWER_EXPECTED for k in range(n_jaws)]
+    jaws = [_synthetic_jaw(seq, rng) for seq in sequences]
+
+    t0 = time.perf_counter()
+    expected = [_match_to_expected_reference(jaw, seq) for jaw, seq in zip(jaws, sequences)]
+    reference_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    actual = _align_jaws(jaws, sequences)
+    batched_s = time.perf_counter() - t0
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+
+    return {
+        "n_jaws": n_jaws,
+        "parity_mismatches": mismatches,
+        "reference_s": reference_s,
+        "batched_s": batched_s,
+        "jaws_per_s": n_jaws / batched_s if batched_s > 0 else float("inf"),
+        "speedup": reference_s / batched_s if batched_s > 0 else float("inf"),
+    }
+
+
+def _random_fdi_checkpoint(path, seed=0, cfg="yolo11n-seg.yaml"):
+    """Save a random YOLO11-seg checkpoint (default n) whose class biases are raised so it actually detects."""
+    import torch
+    from ultralytics import YOLO
+
+    torch.manual_seed(seed)
+    model = YOLO(cfg)
+    generator = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for branch in model.model.model[-1].cv3:
+            bias = branch[-1].bias
+            bias.copy_(torch.randn(bias.shape, generator=generator) * 2 - 4)
+    model.save(path)
+    return path
+
+
+def bench_onnx(width=1600, height=800, repeats=3, threads=4):
+    """PyTorch vs ONNX Runtime on CPU: end-to-end latency and output parity."""
+    import tempfile
+
+    import numpy as np
+    import torch
+
+    from export_onnx import export_fdi_model, export_status_classifier
+    from inference import DentalPredictor, _run_prediction_core
+
+    tmp_dir = tempfile.mkdtemp(prefix="onnx-bench-")
+    fdi_path = _random_fdi_checkpoint(os.path.join(tmp_dir, "fdi.pt"))
+    fdi_onnx = export_fdi_model(fdi_path)
+    status_model = _random_status_model()
+    status_path = os.path.join(tmp_dir, "status.pt")
+    torch.save(status_model.state_dict(), status_path)
+    status_onnx = export_status_classifier(status_model, os.path.join(tmp_dir, "status.onnx"))
+
+    torch_predictor = DentalPredictor(fdi_model_path=fdi_path, status_model_path=status_path, threads=threads)
+    onnx_predictor = DentalPredictor(
+        fdi_model_path=fdi_onnx, status_model_path=status_onnx, backend="onnx", threads=threads
+    )
+    image = _synthetic_panoramic(width, height)
+
+    def run(predictor):
+        return _run_prediction_core(image, use_heuristic=False, predictor=predictor)
+
+    expected, actual = run(torch_predictor), run(onnx_predictor)
+    torch_s = _timeit(lambda: run(torch_predictor), repeats)
+    onnx_s = _timeit(lambda: run(onnx_predictor), repeats)
+
+    same = len(expected["teeth"]) == len(actual["teeth"]) and all(
+        a["fdi"] == b["fdi"] and a["status"]["status_id"] == b["status"]["status_id"]
+        for a, b in zip(expected["teeth"], actual["teeth"])
+    )
+    bbox_diff = conf_diff = None
+    if same and expected["teeth"]:
+        bbox_diff = float(max(np.abs(np.subtract(a["bbox"], b["bbox"])).max()
+                              for a, b in zip(expected["teeth"], actual["teeth"])))
+        conf_diff = float(max(abs(a["confidence_fdi"] - b["confidence_fdi"])
+                              for a, b in zip(expected["teeth"], actual["teeth"])))
+
+    return {
+        "image": [width, height],
+        "threads": threads,
+        "n_teeth": len(expected["teeth"]),
+        "labels_and_status_match": same,
+        "max_bbox_diff_px": bbox_diff,
+        "max_confidence_diff": conf_diff,
+        "torch_s": torch_s,
+        "onnx_s": onnx_s,
+        "speedup": torch_s / onnx_s if onnx_s > 0 else float("inf"),
+    }
+
+
+def bench_precision(n_crops=256, n_calibration=64, threads=4):
+    """Status classifier precision modes on CPU: agreement with fp32 and per-crop latency."""
+    import torch
+
+    from evaluate_precision import evaluate_modes
+    from inference import _classify_crops
+    from precision import PRECISIONS
+
+    torch.set_num_threads(threads)
+    model = _random_status_model()
+    crops = _random_crops(n_crops, seed=1)
+    labels, _ = _classify_crops(crops, model)  # random weights: score against the fp32 output
+    calibration = _random_crops(n_calibration, seed=2)
+
+    return {"n_crops": n_crops, "threads": threads, "modes": evaluate_modes(model, crops, labels, PRECISIONS, calibration)}
+
+
+def _tree_digest(root, exclude=()):
+    """sha256 over relative paths and contents of every file under root."""
+    import hashlib
+
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in sorted(os.walk(root)):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name in exclude:
+                continue
+            path = os.path.join(dirpath, name)
+            digest.update(os.path.relpath(path, root).encode("utf-8"))
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _write_labelme_sample(images_dir, labels_dir, stem, sample, seed, status_shift=0):
+    import json
+
+    import cv2
+
+    image = _synthetic_panoramic(sample["imageWidth"], sample["imageHeight"], seed=seed)
+    cv2.imwrite(str(images_dir / f"{stem}.png"), image)
+    shapes = [
+        dict(shape, group_id=(int(shape.get("group_id") or 0) + status_shift) % 7 or None)
+        for shape in sample["shapes"]
+    ]
+    with open(labels_dir / f"{stem}.json", "w", encoding="utf-8") as f:
+        json.dump(dict(sample, imagePath=f"{stem}.png", shapes=shapes), f)
+
+
+def _synthetic_labelme_dataset(root, n_samples):
+    """images1/ + labels/ with n copies of the bundled Labelme sample on synthetic images."""
+    import json
+    from pathlib import Path
+
+    with open(SAMPLE_LABELME_PATH, "r", encoding="utf-8") as f:
+        sample = json.load(f)
+    sample.pop("imageData", None)
+    images_dir, labels_dir = Path(root, "images1"), Path(root, "labels")
+    images_dir.mkdir(parents=True)
+    labels_dir.mkdir(parents=True)
+    for i in range(n_samples):
+        _write_labelme_sample(images_dir, labels_dir, f"{i:04d}", sample, seed=i)
+    return images_dir, labels_dir, sample
+
+
+def bench_dataset(n_samples=48, workers=4, n_edits=2, n_added=2, n_removed=1):
+    """
+    Serial vs process-pool dataset build (throughput, byte-identical output), then an
+    incremental rebuild after a few annotation edits vs a fresh full build, and a
+    rebuild after a build that failed after moving re-split samples (crash recovery).
+    """
+    import tempfile
+
+    import crop_store
+    from data_preparation import _build_datasets
+
+    root = tempfile.mkdtemp(prefix="dataset-bench-")
+    images_dir, labels_dir, sample = _synthetic_labelme_dataset(os.path.join(root, "raw"), n_samples)
+    # data.yaml and the manifest embed the output path, so compare everything else
+    exclude = ("data.yaml", "manifest.json")
+
+    def build(name, **kwargs):
+        out = os.path.join(root, name)
+        stats = _build_datasets(
+            images_dir=images_dir,
+            labels_dir=labels_dir,
+            yolo_dir=f"{out}/yolo",
+            status_dir=f"{out}/status",
+            manifest_path=f"{out}/manifest.json",
+            **kwargs,
+        )
+        return stats, _tree_digest(out, exclude)
+
+    serial, serial_digest = build("serial", workers=1)
+    parallel, parallel_digest = build("parallel", workers=workers)
+
+    # Annotation fixes: relabel a few samples, add some, remove one
+    for i in range(n_edits):
+        _write_labelme_sample(images_dir, labels_dir, f"{i:04d}", sample, seed=i, status_shift=1)
+    for i in range(n_samples, n_samples + n_added):
+        _write_labelme_sample(images_dir, labels_dir, f"{i:04d}", sample, seed=i)
+    for i in range(n_samples - n_removed, n_samples):
+        os.remove(labels_dir / f"{i:04d}.json")
+
+    incremental, incremental_digest = build("parallel", workers=workers)
+    up_to_date, _ = build("parallel", workers=workers)
+    full, full_digest = build("reference", workers=workers)
+
+    # More samples re-shuffle the splits; fail the build after the moves, then resume
+    for i in range(n_samples + n_added, n_samples + 2 * n_added):
+        _write_labelme_sample(images_dir, labels_dir, f"{i:04d}", sample, seed=i)
+    pack_split = crop_store.pack_split
+
+    def failing_pack_split(*args, **kwargs):
+        raise RuntimeError("simulated failure")
+
+    crop_store.pack_split = failing_pack_split
+    try:
+        build("parallel", workers=workers)
+    except RuntimeError:
+        pass
+    finally:
+        crop_store.pack_split = pack_split
+    resumed, resumed_digest = build("parallel", workers=workers)
+    _, fresh_digest = build("reference-resumed", workers=workers)
+
+    return {
+        "n_samples": n_samples,
+        "workers": workers,
+        "serial_samples_per_s": serial["conversion"]["samples_per_s"],
+        "parallel_samples_per_s": parallel["conversion"]["samples_per_s"],
+        "parallel_speedup": serial["conversion"]["elapsed_s"] / parallel["conversion"]["elapsed_s"],
+        "parallel_byte_identical": serial_digest == parallel_digest,
+        "incremental_changes": incremental["changes"],
+        "incremental_s": incremental["conversion"]["elapsed_s"],
+        "full_rebuild_s": full["conversion"]["elapsed_s"],
+        "incremental_byte_identical": incremental_digest == full_digest,
+        "up_to_date_dirty": up_to_date["dirty"],
+        "resumed_changes": resumed["changes"],
+        "resumed_byte_identical": resumed_digest == fresh_digest,
+    }
+
+
+def bench_packed(n_samples=24, split="train"):
+    """PNG tree decoded into RAM (InMemoryImageDataset) vs memory-mapped packed crops: startup and parity."""
+    import tempfile
+
+    import numpy as np
+    import torchvision.datasets as datasets
+    from PIL import Image
+
+    from crop_store import PackedCropDataset
+    from data_preparation import _build_datasets
+
+    root = tempfile.mkdtemp(prefix="packed-bench-")
+    images_dir, labels_dir, _ = _synthetic_labelme_dataset(os.path.join(root, "raw"), n_samples)
+    status_dir = f"{root}/out/status"
+    _build_datasets(
+        workers=1,
+        images_dir=images_dir,
+        labels_dir=labels_dir,
+        yolo_dir=f"{root}/out/yolo",
+        status_dir=status_dir,
+        manifest_path=f"{root}/out/manifest.json",
+    )
+
+    def load_png():
+        # Same work as train_status.InMemoryImageDataset
+        folder = datasets.ImageFolder(os.path.join(status_dir, split), allow_empty=True)
+        return [Image.open(path).convert("RGB") for path, _ in folder.samples], folder.targets
+
+    t0 = time.perf_counter()
+    png_images, png_targets = load_png()
+    png_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    packed = PackedCropDataset(status_dir, split)
+    packed_s = time.perf_counter() - t0
+
+    identical = packed.targets == png_targets and all(
+        np.array_equal(np.asarray(packed[i][0]), np.asarray(img)) for i, img in enumerate(png_images)
+    )
+    return {
+        "n_crops": len(packed),
+        "png_startup_s": png_s,
+        "packed_startup_s": packed_s,
+        "packed_mb": packed.images.nbytes / 1e6,
+        "identical": identical,
+    }
+
+
+def bench_augment(n_crops=256, batch_size=64, repeats=3, seed=0):
+    """Per-image PIL augmentation (old train transforms) vs batched tensor augmentation, images/s on CPU."""
+    import numpy as np
+    import torch
+    from PIL import Image
+    from torchvision import transforms
+
+    from batch_augment import BatchAugment
+    from train_status import STATUS_MEAN, STATUS_STD
+
+    crops = np.stack(_random_crops(n_crops, seed=seed))
+    pil_images = [Image.fromarray(crop) for crop in crops]
+    pil_transform = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.RandomHorizontalFlip(),
+        transforms.RandomRotation(10),
+        transforms.ColorJitter(brightness=0.2, contrast=0.2),
+        transforms.ToTensor(),
+        transforms.Normalize(STATUS_MEAN, STATUS_STD),
+    ])
+    augment = BatchAugment("cpu", STATUS_MEAN, STATUS_STD, seed=seed)
+    batch = torch.from_numpy(crops)
+
+    def pil():
+        return [torch.stack([pil_transform(img) for img in pil_images[i:i + batch_size]])
+                for i in range(0, n_crops, batch_size)]
+
+    def batched():
+        return [augment(batch[i:i + batch_size]) for i in range(0, n_crops, batch_size)]
+
+    pil_s = _timeit(pil, repeats)
+    batched_s = _timeit(batched, repeats)
+    return {
+        "n_crops": n_crops,
+        "batch_size": batch_size,
+        "pil_images_per_s": n_crops / pil_s,
+        "batched_images_per_s": n_crops / batched_s,
+        "speedup": pil_s / batched_s if batched_s > 0 else float("inf"),
+    }
+
+
+def bench_stages(width=1600, height=800, n_requests=5, seed=0):
+    """Per-stage latency breakdown of single-image prediction and the Prometheus rendering."""
+    import tempfile
+
+    from inference import DentalPredictor
+    from latency_metrics import prometheus_text, summarize
+
+    tmp_dir = tempfile.mkdtemp(prefix="stages-bench-")
+    fdi_path = _random_fdi_checkpoint(os.path.join(tmp_dir, "fdi.pt"), seed=seed)
+    predictor = DentalPredictor(fdi_model_path=fdi_path, status_model_path="", warmup=False)
+    predictor.status_model = _random_status_model()
+
+    last = None
+    for i in range(n_requests):
+        last = predictor.predict(_synthetic_panoramic(width, height, seed=i), debug=True)
+    snapshot = predictor.latency.snapshot()
+    summary = summarize(snapshot)
+    text = prometheus_text(snapshot)
+    return {
+        "n_requests": n_requests,
+        "last_request_ms": last["timings"]["stages_ms"],
+        "p50_ms": {series: 1000 * s["p50"] for series, s in summary.items() if series != "teeth_per_scan"},
+        "counters": snapshot["counters"],
+        "prometheus_lines": len(text.splitlines()),
+    }
+
+
+def bench_hotpaths(width=3000, height=1500, n_detections=40, n_crops=32, repeats=10, seed=0):
+    """
+    Median wall time (ms) of each inference and data-prep hot path on one synthetic
+    panoramic and the bundled Labelme sample. This is the benchmark to keep a baseline for.
+    """
+    import tempfile
+
+    import numpy as np
+    import torch
+
+    from data_preparation import _convert_single_label
+    from inference import (
+        LOWER_EXPECTED, UPPER_EXPECTED, _masked_crop_from_points, _match_to_expected, _predict_status_batch,
+        _remove_overlapping,
+    )
+    from preprocessing import apply_dental_enhancement, preprocess_for_inference
+
+    rng = np.random.default_rng(seed)
+    image = _synthetic_panoramic(width, height, seed=seed)
+    polygons = [np.asarray(p, dtype=np.float32) for p in _sample_polygons(width, height)]
+    detections = _random_detections(n_detections, rng, width, height)
+    jaws = [(_synthetic_jaw(seq, rng), seq) for seq in (UPPER_EXPECTED, LOWER_EXPECTED)]
+    status_model = _random_status_model(seed)
+    crops = _random_crops(n_crops, seed)
+
+    root = tempfile.mkdtemp(prefix="hotpaths-bench-")
+    images_dir, labels_dir, _ = _synthetic_labelme_dataset(os.path.join(root, "raw"), 1)
+    label_path = next(labels_dir.glob("*.json"))
+
+    cases = {
+        "preprocess_for_inference": lambda: preprocess_for_inference(image),
+        "apply_dental_enhancement": lambda: apply_dental_enhancement(image),
+        "masked_crops": lambda: [_masked_crop_from_points(image, p) for p in polygons],
+        "remove_overlapping": lambda: _remove_overlapping(detections),
+        "match_to_expected": lambda: [_match_to_expected(jaw, seq) for jaw, seq in jaws],
+        "convert_single_label": lambda: _convert_single_label(label_path, images_dir, None, None),
+        "status_classification": lambda: _predict_status_batch(crops, status_model),
+    }
+    timings_ms = {}
+    with torch.inference_mode():
+        for name, fn in cases.items():
+            fn()  # warmup
+            timings_ms[name] = 1000 * _timeit(fn, repeats)
+
+    return {
+        "image": f"{width}x{height}",
+        "n_teeth": len(polygons),
+        "n_detections": n_detections,
+        "n_crops": n_crops,
+        "repeats": repeats,
+        "timings_ms": timings_ms,
+    }
+
+
+def bench_enhance(n_images=8, width=3000, height=1500, repeats=3, workers=4):
+    """
+    Step-by-step reference vs DentalEnhancer: bit-identical output on BGR and grayscale
+    inputs (with and without the 640x640 resize), per-image time and threaded batch time.
+    """
+    import numpy as np
+
+    from preprocessing import DentalEnhancer, _enhance_reference
+
+    rng = np.random.default_rng(0)
+    images = [_synthetic_panoramic(width, height, seed=i) for i in range(n_images)]
+    # Full 0..255 range, so saturation and rounding of the brightness step are exercised
+    images[0] = rng.integers(0, 256, images[0].shape, dtype=np.uint8)
+    gray = images[1][:, :, 0].copy()
+
+    enhancer = DentalEnhancer(workers=1)
+    threaded = DentalEnhancer(workers=workers)
+    identical = all(
+        np.array_equal(_enhance_reference(img, size), enhancer.enhance(img, size))
+        for img in images[:3] + [gray]
+        for size in (None, (640, 640))
+    )
+    identical = identical and all(
+        np.array_equal(a, _enhance_reference(img)) for a, img in zip(threaded.enhance_batch(images), images)
+    )
+
+    reference_s = _timeit(lambda: [_enhance_reference(img) for img in images], repeats)
+    enhancer_s = _timeit(lambda: [enhancer.enhance(img) for img in images], repeats)
+    threaded_s = _timeit(lambda: threaded.enhance_batch(images), repeats)
+    return {
+        "n_images": n_images,
+        "image": f"{width}x{height}",
+        "workers": workers,
+        "cpu_count": os.cpu_count(),
+        "bit_identical": identical,
+        "reference_ms_per_image": 1000 * reference_s / n_images,
+        "enhancer_ms_per_image": 1000 * enhancer_s / n_images,
+        "threaded_ms_per_image": 1000 * threaded_s / n_images,
+        "enhancer_speedup": reference_s / enhancer_s,
+        "threaded_speedup": reference_s / threaded_s,
+    }
+
+
+def bench_decode(width=3000, height=1500, repeats=5, seed=0):
+    """
+    Full-resolution BGR decode vs image_io ingestion (single channel for grayscale
+    files, reduced copy for YOLO) for a grayscale PNG and a color JPEG: decode time,
+    peak traced memory, array bytes, YOLO time (letterbox included) and detection count.
+    """
+    import tempfile
+
+    import cv2
+    import numpy as np
+
+    from image_io import decode_image
+    from inference import FDI_CONF, FDI_IMGSZ, DentalPredictor, _run_prediction_core
+
+    tmp_dir = tempfile.mkdtemp(prefix="decode-bench-")
+    predictor = DentalPredictor(
+        fdi_model_path=_random_fdi_checkpoint(os.path.join(tmp_dir, "fdi.pt"), seed=seed),
+        status_model_path="", warmup=False,
+    )
+    predictor.status_model = _random_status_model(seed)
+
+    image = _synthetic_panoramic(width, height, seed=seed)
+    sources = {
+        "png_gray": cv2.imencode(".png", image[:, :, 0])[1].tobytes(),
+        "jpeg_color": cv2.imencode(".jpg", image)[1].tobytes(),
+    }
+
+    def legacy_decode(data):
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+    def yolo(source):
+        return predictor.fdi_model.predict(source, conf=FDI_CONF, verbose=False, imgsz=FDI_IMGSZ)
+
+    results = {}
+    for name, data in sources.items():
+        legacy, legacy_peak = _peak_memory(lambda: legacy_decode(data))
+        ingested, ingest_peak = _peak_memory(lambda: decode_image(data, FDI_IMGSZ))
+        legacy_result = _run_prediction_core(legacy, predictor=predictor)
+        ingested_result = _run_prediction_core(ingested, predictor=predictor)
+        results[name] = {
+            "file_bytes": len(data),
+            "grayscale": ingested.stats["grayscale"],
+            "inference_shape": ingested.stats["inference_shape"],
+            "legacy_decode_ms": 1000 * _timeit(lambda: legacy_decode(data), repeats),
+            "ingest_decode_ms": 1000 * _timeit(lambda: decode_image(data, FDI_IMGSZ), repeats),
+            "legacy_peak_mb": legacy_peak / 2**20,
+            "ingest_peak_mb": ingest_peak / 2**20,
+            "legacy_array_mb": legacy.nbytes / 2**20,
+            "ingest_arrays_mb": (ingested.full.nbytes + ingested.inference.nbytes) / 2**20,
+            "legacy_yolo_ms": 1000 * _timeit(lambda: yolo(legacy), repeats),
+            "ingest_yolo_ms": 1000 * _timeit(lambda: yolo(ingested.inference), repeats),
+            "legacy_count": legacy_result["count"],
+            "ingest_count": ingested_result["count"],
+            "ingest_contours_in_bounds": all(
+                0 <= x <= width and 0 <= y <= height
+                for tooth in ingested_result["teeth"] for x, y in tooth["contour"]
+            ),
+        }
+    return results
+
+
+def bench_devicecrops(width=1600, height=800, repeats=3, seed=0):
+    """
+    Polygon crops (cv2, per tooth) vs device crops (batched, from YOLO's mask tensor) on
+    a BGR array and a grayscale IngestedImage: time, mask IoU (crops of a white image),
+    mean abs pixel difference on the noisy synthetic image and on a smoothed copy, and
+    agreement of a random status classifier. A device-crop predictor (classifier on
+    CUDA when available) then runs its warmup, a prediction and a re-inference, whose
+    NumPy crops must follow the classifier to its device.
+    """
+    import tempfile
+
+    import cv2
+    import numpy as np
+    import torch
+    from ultralytics import YOLO
+
+    from image_io import ingest_array
+    from inference import FDI_CONF, FDI_IMGSZ, DentalPredictor, _classify_crops, _detections_from_result
+
+    tmp_dir = tempfile.mkdtemp(prefix="devicecrops-bench-")
+    fdi_path = _random_fdi_checkpoint(os.path.join(tmp_dir, "fdi.pt"), seed=seed)
+    fdi_model = YOLO(fdi_path)
+    status_model = _random_status_model(seed)
+
+    image = _synthetic_panoramic(width, height, seed=seed)
+    gray = image[:, :, 0].copy()
+    ingested = ingest_array(gray, FDI_IMGSZ)
+    sources = {
+        "bgr_array": (image, image, (1.0, 1.0)),
+        "gray_ingested": (ingested.inference, ingested.full, ingested.scale),
+    }
+
+    def crops(result, full, scale, engine):
+        return _detections_from_result(result, full, scale=scale, crop_engine=engine)[1]
+
+    def as_array(crop):
+        return crop.permute(1, 2, 0).cpu().numpy() if crop is not None else None
+
+    results = {}
+    for name, (yolo_input, full, scale) in sources.items():
+        result = fdi_model.predict(yolo_input, conf=FDI_CONF, verbose=False, imgsz=FDI_IMGSZ)[0]
+        polygon = crops(result, full, scale, "polygon")
+        device = crops(result, full, scale, "device")
+        pairs = [(p, as_array(d)) for p, d in zip(polygon, device) if p is not None and d is not None]
+
+        white = np.full_like(full, 255)
+        ious = []
+        for p, d in zip(crops(result, white, scale, "polygon"), crops(result, white, scale, "device")):
+            if p is None or d is None:
+                continue
+            p, d = p[:, :, 0] > 0, d[0].cpu().numpy() > 0
+            union = (p | d).sum()
+            ious.append((p & d).sum() / union if union else 1.0)
+
+        smooth = cv2.GaussianBlur(full, (0, 0), 3)
+        smooth_pairs = [
+            (p, as_array(d))
+            for p, d in zip(crops(result, smooth, scale, "polygon"), crops(result, smooth, scale, "device"))
+            if p is not None and d is not None
+        ]
+
+        def mean_abs(crop_pairs):
+            return [float(np.abs(p.astype(np.float32) - d).mean()) for p, d in crop_pairs]
+
+        noisy_diff, smooth_diff = mean_abs(pairs), mean_abs(smooth_pairs)
+        polygon_ids, _ = _classify_crops([p for p, _ in pairs], status_model) if pairs else ([], [])
+        device_ids, _ = _classify_crops([torch.from_numpy(d).permute(2, 0, 1) for _, d in pairs], status_model) \
+            if pairs else ([], [])
+        results[name] = {
+            "teeth": len(polygon),
+            "none_mismatches": sum((p is None) != (d is None) for p, d in zip(polygon, device)),
+            "polygon_crops_ms": 1000 * _timeit(lambda: crops(result, full, scale, "polygon"), repeats),
+            "device_crops_ms": 1000 * _timeit(lambda: crops(result, full, scale, "device"), repeats),
+            "mask_iou_mean": float(np.mean(ious)) if ious else float("nan"),
+            "mask_iou_min": float(np.min(ious)) if ious else float("nan"),
+            "noisy_mean_abs_diff": float(np.mean(noisy_diff)) if noisy_diff else float("nan"),
+            "smooth_mean_abs_diff": float(np.mean(smooth_diff)) if smooth_diff else float("nan"),
+            "smooth_p95_abs_diff": float(np.percentile(smooth_diff, 95)) if smooth_diff else float("nan"),
+            "status_agreement": float(np.mean(np.asarray(polygon_ids) == np.asarray(device_ids)))
+            if pairs else float("nan"),
+        }
+
+    predictor = DentalPredictor(fdi_model_path=fdi_path, status_model_path="", warmup=False, crop_engine="device")
+    predictor.status_model = status_model.to("cuda" if torch.cuda.is_available() else "cpu")
+    predictor._warmup()
+    chart = predictor.predict(image)
+    edited = [dict(tooth, edited=["contour"]) for tooth in chart["teeth"][:2]] + chart["teeth"][2:]
+    merged = predictor.reinfer(edited, image)
+    results["device_predictor"] = {
+        "classifier_device": str(next(status_model.parameters()).device),
+        "teeth": chart["count"],
+        "reclassified": merged["reinference"]["reclassified"],
+    }
+    return results
+
+
+def bench_pipeline(n_images=6, width=1200, height=600, seed=0):
+    """
+    Directory prediction: decode + predict one file after the other vs the staged
+    pipeline (pipeline.py). Images/s, identical results and per-stage utilization and
+    queue depth. On a single CPU the stages mostly compete for the same core; the
+    overlap pays off when YOLO and the classifier run on a GPU.
+    """
+    import tempfile
+
+    import cv2
+
+    from inference import DentalPredictor, _decode_image, _list_images, _predict_directory
+
+    tmp_dir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    image_dir = os.path.join(tmp_dir, "images")
+    os.makedirs(image_dir)
+    for i in range(n_images):
+        image = _synthetic_panoramic(width, height, seed=seed + i)
+        cv2.imwrite(os.path.join(image_dir, f"scan_{i:03d}.png"), image[:, :, 0])
+
+    predictor = DentalPredictor(
+        fdi_model_path=_random_fdi_checkpoint(os.path.join(tmp_dir, "fdi.pt"), seed=seed),
+        status_model_path="", warmup=False,
+    )
+    predictor.status_model = _random_status_model(seed)
+
+    def sequential():
+        results = []
+        for path in _list_images(image_dir):
+            with open(path, "rb") as f:
+                results.append(predictor.predict(_decode_image(f.read())))
+        return results
+
+    t0 = time.perf_counter()
+    reference = sequential()
+    sequential_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    pipelined = _predict_directory(image_dir, predictor=predictor)
+    pipelined_s = time.perf_counter() - t0
+
+    return {
+        "n_images": n_images,
+        "sequential_images_per_s": n_images / sequential_s,
+        "pipelined_images_per_s": n_images / pipelined_s,
+        "speedup": sequential_s / pipelined_s if pipelined_s > 0 else float("inf"),
+        "same_results": all(a["teeth"] == b["teeth"] for a, b in zip(reference, pipelined["results"])),
+        "in_order": [r["file"] for r in pipelined["results"]] == [os.path.basename(p) for p in _list_images(image_dir)],
+        "stages": pipelined["pipeline"]["stages"],
+    }
+
+
+def bench_cascade(n_images=4, width=1600, height=800, seed=0):
+    """
+    Model cascade (cascade.py) with a random YOLO11n as fast tier and a random YOLO11s
+    as full model: segmentation time per scan (YOLO, contours and the cascade gate) of
+    the full model alone, of the cascade when every scan is accepted and when every
+    scan is escalated, and whether escalated scans return exactly the full model's
+    result. Random models detect different numbers of teeth, so the status stage is
+    left out of the comparison.
+    """
+    import tempfile
+
+    from inference import DentalPredictor, _run_batch_prediction_core, _run_prediction_core
+    from latency_metrics import StageTimer
+
+    tmp_dir = tempfile.mkdtemp(prefix="cascade-bench-")
+    # seed + 1: with seed 0 the random YOLO11s detects nothing on the synthetic scan
+    full_path = _random_fdi_checkpoint(os.path.join(tmp_dir, "full.pt"), seed=seed + 1, cfg="yolo11s-seg.yaml")
+    fast_path = _random_fdi_checkpoint(os.path.join(tmp_dir, "fast.pt"), seed=seed)
+    images = [_synthetic_panoramic(width, height, seed=seed + i) for i in range(n_images)]
+    accept_all = {"min_mean_confidence": 0.0, "min_teeth": 0, "few_teeth_min_confidence": 0.0, "max_teeth": 10**6, "max_corrections": 10**6}
+    escalate_all = {"min_mean_confidence": 1.1}
+
+    def predictor(**kwargs):
+        p = DentalPredictor(fdi_model_path=full_path, fast_fdi_model_path=fast_path, status_model_path="",
+                            warmup=False, **kwargs)
+        p.status_model = _random_status_model(seed)
+        return p
+
+    def run(p):
+        timer = StageTimer()
+        results = [_run_prediction_core(image, predictor=p, timer=timer) for image in images]
+        segmentation_s = sum(timer.stages[s] for s in ("yolo_predict", "mask_to_contour", "cascade_gate"))
+        return results, segmentation_s / n_images
+
+    full_predictor = predictor()
+    accepting = predictor(cascade=True, cascade_bounds=accept_all)
+    escalating = predictor(cascade=True, cascade_bounds=escalate_all)
+    run(full_predictor)  # warmup
+    full, full_s = run(full_predictor)
+    accepted, accepted_s = run(accepting)
+    escalated, escalated_s = run(escalating)
+    batched = _run_batch_prediction_core(images, predictor=escalating)
+
+    return {
+        "n_images": n_images,
+        "full_segmentation_ms": 1000 * full_s,
+        "accepted_segmentation_ms": 1000 * accepted_s,
+        "escalated_segmentation_ms": 1000 * escalated_s,
+        "full_teeth_per_scan": sum(r["count"] for r in full) / n_images,
+        "fast_teeth_per_scan": sum(r["count"] for r in accepted) / n_images,
+        "accepted_tiers": sorted({r["cascade"]["tier"] for r in accepted}),
+        "escalated_tiers": sorted({r["cascade"]["tier"] for r in escalated}),
+        "escalated_same_as_full": all(a["teeth"] == b["teeth"] for a, b in zip(full, escalated)),
+        "batch_same_as_single": all(a["teeth"] == b["teeth"] for a, b in zip(escalated, batched)),
+    }
+
+
+def bench_reinfer(width=1600, height=800, repeats=5, seed=0):
+    """
+    Clinician edits (edits.py): latency of a full prediction against a re-inference
+    with one reshaped and one relabelled tooth, and with a relabel only (no image
+    needed). Checks that untouched teeth keep their status and that the clinician's
+    label survives the heuristic.
+    """
+    import tempfile
+
+    from inference import DentalPredictor
+
+    tmp_dir = tempfile.mkdtemp(prefix="reinfer-bench-")
+    fdi_path = _random_fdi_checkpoint(os.path.join(tmp_dir, "fdi.pt"), seed=seed)
+    predictor = DentalPredictor(fdi_model_path=fdi_path, status_model_path="", warmup=False)
+    predictor.status_model = _random_status_model(seed)
+    image = _synthetic_panoramic(width, height, seed=seed)
+
+    chart = predictor.predict(image)
+    if chart["count"] < 2:
+        return {"teeth": chart["count"], "skipped": "the random model detected fewer than 2 teeth"}
+    reshaped = dict(chart["teeth"][0], edited=["contour"])
+    reshaped["contour"] = [[x + 2.0, y] for x, y in reshaped["contour"]]
+    relabel = "91" if chart["teeth"][1]["fdi"] != "91" else "18"
+    relabelled = dict(chart["teeth"][1], fdi=relabel, edited=["fdi"])
+    both = [reshaped, relabelled] + chart["teeth"][2:]
+    label_only = [dict(chart["teeth"][0])] + [relabelled] + chart["teeth"][2:]
+
+    full_s = _timeit(lambda: predictor.predict(image), repeats)
+    reinfer_s = _timeit(lambda: predictor.reinfer(both, image), repeats)
+    label_only_s = _timeit(lambda: predictor.reinfer(label_only, lambda: None), repeats)
+
+    merged = predictor.reinfer(both, image)
+    untouched = {str(t["contour"]): t["status"] for t in chart["teeth"][2:]}
+    kept = [t for t in merged["teeth"] if str(t["contour"]) in untouched]
+    return {
+        "teeth": chart["count"],
+        "full_predict_ms": 1000 * full_s,
+        "reinfer_ms": 1000 * reinfer_s,
+        "reinfer_label_only_ms": 1000 * label_only_s,
+        "reinfer_fraction": reinfer_s / full_s,
+        "reinference": merged["reinference"],
+        "untouched_teeth_compared": len(kept),
+        "untouched_status_kept": all(t["status"] == untouched[str(t["contour"])] for t in kept),
+        "locked_label_kept": any(t["fdi"] == relabel and t.get("edited") == ["fdi"] for t in merged["teeth"]),
+    }
+
+
+BENCHMARKS = {
+    "status": bench_status_batching,
+    "crops": bench_crops,
+    "batch": bench_batch_prediction,
+    "overlap": bench_overlap,
+    "align": bench_align,
+    "onnx": bench_onnx,
+    "precision": bench_precision,
+    "dataset": bench_dataset,
+    "packed": bench_packed,
+    "augment": bench_augment,
+    "stages": bench_stages,
+    "hotpaths": bench_hotpaths,
+    "enhance": bench_enhance,
+    "decode": bench_decode,
+    "devicecrops": bench_devicecrops,
+    "pipeline": bench_pipeline,
+    "cascade": bench_cascade,
+    "reinfer": bench_reinfer,
+}
+
+# ==============================================================================
+# BASELINES
+# ==============================================================================
+# --save-baseline writes the results to JSON; --compare reruns the same benchmarks and
+# flags every timing that got worse than the baseline by more than --threshold (relative).
+# Keys ending in _ms or _s are timings (lower is better), keys ending in _per_s are
+# throughputs (higher is better); other numbers are reported but never compared.
+# Timings depend on the machine, so only compare baselines recorded on the same one.
+
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+
+
+def _flatten_metrics(result, prefix=""):
+    """{"a.b": number} for every numeric leaf of a (nested) benchmark result."""
+    metrics = {}
+    for key, value in result.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(_flatten_metrics(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[path] = value
+    return metrics
+
+
+def _metric_direction(path):
+    """+1 if higher is better, -1 if lower is better, 0 if the metric is not compared."""
+    if path.endswith("_per_s"):
+        return 1
+    if path.endswith("_ms") or path.endswith("_s") or ".timings_ms." in f".{path}":
+        return -1
+    return 0
+
+
+def _machine_info():
+    import platform
+
+    import torch
+
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def compare_to_baseline(results, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Compare benchmark results with a saved baseline.
+    Returns one row per compared metric: name, baseline, current, relative change
+    (positive = worse) and whether it is a regression beyond `threshold`.
+    """
+    rows = []
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            continue
+        before = _flatten_metrics(baseline["results"][name])
+        for path, current in _flatten_metrics(result).items():
+            direction = _metric_direction(path)
+            if direction == 0 or path not in before or before[path] <= 0:
+                continue
+            change = -direction * (current - before[path]) / before[path]
+            rows.append({
+                "metric": f"{name}.{path}",
+                "baseline": before[path],
+                "current": current,
+                "change": change,
+                "regression": change > threshold,
+            })
+    return rows
+
+
+def main():
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Run local CPU benchmarks.")
+    parser.add_argument(
+        "names", nargs="*",
+        help=f"Any of: {', '.join(BENCHMARKS)} (default: all, or those in the --compare baseline)",
+    )
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results to a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare with a JSON baseline; exit 1 on regressions")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+        help="Relative slowdown that counts as a regression (default %(default)s)",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    names = args.names or list(BENCHMARKS)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        names = args.names or [name for name in baseline["results"] if name in BENCHMARKS]
+
+    results = {}
+    for name in names:
+        print(f"Running benchmark: {name}")
+        results[name] = BENCHMARKS[name]()
+        print(json.dumps(results[name], indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": _machine_info(), "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if baseline is not None:
+        if baseline.get("machine") != _machine_info():
+            print(f"Warning: baseline was recorded on a different setup: {baseline.get('machine')}")
+        rows = compare_to_baseline(results, baseline, args.threshold)
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else "ok"
+            print(f"{flag:>10}  {row['metric']}: {row['baseline']:.4g} -> {row['current']:.4g} ({row['change']:+.1%})")
+        regressions = [row for row in rows if row["regression"]]
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%} in {len(rows)} compared metrics")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import numpy as np
+
+# ==============================================================================
+# CONFIDENCE-GATED MODEL CASCADE
+# ==============================================================================
+# Most clean panoramics are segmented and numbered just as well by a small YOLO11
+# backbone (n/s) as by the x model. In cascade mode (DentalPredictor(cascade=True))
+# the fast model answers first; the scan is escalated to the full model only when
+# its result looks doubtful:
+#   - mean FDI confidence below min_mean_confidence,
+#   - fewer than min_teeth teeth (after the heuristic's duplicate removal) with a mean
+#     FDI confidence below few_teeth_min_confidence,
+#   - more than max_teeth teeth,
+#   - more than max_corrections labels changed by the FDI heuristic.
+# A low tooth count alone does not escalate: partially edentulous adults commonly
+# have fewer than 20 teeth, and the fast model numbers a confident sparse chart as
+# well as the x model. Missed teeth on a poor scan still escalate, since they come
+# with a lower confidence.
+# The status classifier only runs for the tier that answers. evaluate_cascade.py
+# reports the escalation rate and the latency saved on the test split.
+
+CASCADE_BOUNDS = {
+    "min_mean_confidence": 0.6,
+    "min_teeth": 20,
+    "few_teeth_min_confidence": 0.8,
+    "max_teeth": 32,
+    "max_corrections": 2,
+}
+
+
+def resolve_bounds(bounds=None):
+    """CASCADE_BOUNDS updated with `bounds`; unknown keys raise ValueError."""
+    bounds = dict(bounds or {})
+    unknown = sorted(set(bounds) - set(CASCADE_BOUNDS))
+    if unknown:
+        raise ValueError(f"Unknown cascade bounds: {unknown}. Expected any of {sorted(CASCADE_BOUNDS)}.")
+    return {**CASCADE_BOUNDS, **bounds}
+
+
+def scan_summary(detections):
+    """Teeth, mean FDI confidence and heuristic corrections of one scan's detections."""
+    confidences = [d["confidence_fdi"] for d in detections]
+    return {
+        "teeth": len(detections),
+        "mean_confidence": float(np.mean(confidences)) if confidences else 0.0,
+        "corrections": sum(1 for d in detections if d.get("corrected_by_heuristic")),
+    }
+
+
+def escalation_reasons(summary, bounds):
+    """Names of the bounds a scan summary falls outside of; empty when the fast tier may answer."""
+    reasons = []
+    if summary["mean_confidence"] < bounds["min_mean_confidence"]:
+        reasons.append("mean_confidence")
+    if (
+        summary["teeth"] < bounds["min_teeth"]
+        and summary["mean_confidence"] < bounds["few_teeth_min_confidence"]
+    ):
+        reasons.append("few_teeth_low_confidence")
+    if summary["teeth"] > bounds["max_teeth"]:
+        reasons.append("too_many_teeth")
+    if summary["corrections"] > bounds["max_corrections"]:
+        reasons.append("corrections")
+    return reasons
+
+
+def read_yolo_labels(label_path, width, height):
+    """Ground-truth (class ids, xyxy boxes in pixels) from a YOLO segmentation label file."""
+    classes, boxes = [], []
+    with open(label_path, "r", encoding="utf-8") as f:
+        for line in f:
+            values = line.split()
+            if len(values) < 7:
+                continue
+            points = np.asarray(values[1:], dtype=np.float64).reshape(-1, 2) * (width, height)
+            classes.append(int(values[0]))
+            boxes.append([*points.min(axis=0), *points.max(axis=0)])
+    return np.asarray(classes, dtype=np.int64), np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def label_accuracy(detections, gt_labels, gt_boxes, fdi_labels, iou_threshold=0.5):
+    """
+    Fraction of ground-truth teeth matched (greedy, by box IoU) by a detection with
+    the same FDI label.
+    """
+    if len(gt_boxes) == 0:
+        return 1.0
+    if not detections:
+        return 0.0
+    boxes = np.asarray([d["bbox"] for d in detections], dtype=np.float64)
+    x1 = np.maximum(gt_boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(gt_boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(gt_boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(gt_boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_gt = (gt_boxes[:, 2] - gt_boxes[:, 0]) * (gt_boxes[:, 3] - gt_boxes[:, 1])
+    area_det = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    iou = inter / np.maximum(area_gt[:, None] + area_det[None, :] - inter, 1e-9)
+
+    correct = 0
+    used = np.zeros(len(detections), dtype=bool)
+    for i in np.argsort(-iou.max(axis=1)):
+        candidates = np.where(~used & (iou[i] >= iou_threshold))[0]
+        if len(candidates) == 0:
+            continue
+        j = candidates[np.argmax(iou[i, candidates])]
+        used[j] = True
+        correct += detections[j]["fdi"] == fdi_labels[gt_labels[i]]
+    return correct / len(gt_boxes)
+
+
+def cascade_report(records):
+    """
+    Aggregate per-scan records {"tier", "reasons", "cascade_s", "full_s"[, "cascade_accuracy",
+    "full_accuracy"]}: escalation rate, reasons, mean latencies and the saving, and the
+    label accuracy over the scans that have ground truth.
+    """
+    n = len(records)
+    if n == 0:
+        return {"scans": 0}
+    escalated = [r for r in records if r["tier"] == "full"]
+    reasons = {}
+    for r in escalated:
+        for reason in r["reasons"]:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    cascade_s = float(np.mean([r["cascade_s"] for r in records]))
+    full_s = float(np.mean([r["full_s"] for r in records]))
+    report = {
+        "scans": n,
+        "escalated": len(escalated),
+        "escalation_rate": len(escalated) / n,
+        "reasons": reasons,
+        "mean_full_ms": 1000 * full_s,
+        "mean_cascade_ms": 1000 * cascade_s,
+        "mean_fast_answer_ms": 1000 * float(np.mean([r["cascade_s"] for r in records if r["tier"] == "fast"]))
+        if len(escalated) < n else float("nan"),
+        "mean_escalated_ms": 1000 * float(np.mean([r["cascade_s"] for r in escalated])) if escalated else float("nan"),
+        "latency_saving": 1 - cascade_s / full_s if full_s > 0 else 0.0,
+    }
+    labelled = [r for r in records if "full_accuracy" in r]
+    if labelled:
+        report["labelled_scans"] = len(labelled)
+        report["full_accuracy"] = float(np.mean([r["full_accuracy"] for r in labelled]))
+        report["cascade_accuracy"] = float(np.mean([r["cascade_accuracy"] for r in labelled]))
+        report["accuracy_delta"] = report["cascade_accuracy"] - report["full_accuracy"]
+    return report
@@ -18,9 +18,12 @@ dental_image = (
         "pillow",
         "pyyaml",
         "fastapi",
+        "python-multipart",    # Multipart uploads for the batch endpoint
         "kaggle",              # Download Kaggle datasets
         "torch",               # PyTorch for status classifier
         "torchvision",
+        "onnx",                # ONNX export of both models
+        "onnxruntime",         # CPU inference backend
     )
     # Automatically include all code files in this folder in the container image.
     # This is preferred over explicit mounts.
@@ -34,6 +37,9 @@ app = modal.App("dental-tooth-segmentation")
 # Mounted at /data inside the container
 volume = modal.Volume.from_name("dental-data-storage", create_if_missing=True)
 
+# Shared store for the per-container inference latency snapshots (see latency_metrics.py)
+metrics_store = modal.Dict.from_name("dental-inference-metrics", create_if_missing=True)
+
 # Secret for Kaggle credentials (KAGGLE_USERNAME, KAGGLE_KEY)
 kaggle_secret = modal.Secret.from_name("kaggle-creds", required_keys=["KAGGLE_USERNAME", "KAGGLE_KEY"])
 
@@ -0,0 +1,126 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# ==============================================================================
+# PACKED STATUS CROP STORE
+# ==============================================================================
+# Each split of the status dataset is also stored as one uint8 array of RGB crops
+# (N x 224 x 224 x 3, .npy), an int64 labels array and a JSON index of the source
+# PNG paths. Training memory-maps the array, so startup does not decode any PNG and
+# the pages are shared by DataLoader workers and by concurrent jobs on the machine.
+# Samples are in torchvision ImageFolder order (class folder, then file name), so
+# index i is the same crop as ImageFolder(<split>).samples[i].
+
+PACKED_DIRNAME = "packed"
+
+
+def packed_paths(status_dir, split):
+    base = os.path.join(status_dir, PACKED_DIRNAME, split)
+    return {
+        "images": f"{base}_images.npy",
+        "labels": f"{base}_labels.npy",
+        "index": f"{base}_index.json",
+    }
+
+
+def has_packed_split(status_dir, split):
+    return all(os.path.exists(p) for p in packed_paths(status_dir, split).values())
+
+
+def _list_split(split_dir):
+    """(relative path, label) pairs in ImageFolder order; class folders are status ids."""
+    entries = []
+    for status in sorted(e.name for e in os.scandir(split_dir) if e.is_dir()):
+        for name in sorted(e.name for e in os.scandir(os.path.join(split_dir, status))):
+            if name.endswith(".png"):
+                entries.append((f"{status}/{name}", int(status)))
+    return entries
+
+
+def _pack_images(split_dir, entries, path, shape, workers):
+    """Decode the entries' PNGs into a new .npy memmap at `path`; raises RuntimeError naming unreadable files."""
+    crop_size = shape[1]
+    images = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=shape)
+
+    def load(i):
+        crop = cv2.imread(os.path.join(split_dir, entries[i][0]), cv2.IMREAD_COLOR)
+        if crop is None:
+            return entries[i][0]
+        if crop.shape[:2] != (crop_size, crop_size):
+            crop = cv2.resize(crop, (crop_size, crop_size), interpolation=cv2.INTER_AREA)
+        images[i] = crop[..., ::-1]
+        return None
+
+    # cv2 releases the GIL while decoding, so threads are enough here
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        unreadable = [name for name in executor.map(load, range(len(entries))) if name is not None]
+    images.flush()
+    del images
+    if unreadable:
+        raise RuntimeError(
+            f"{len(unreadable)} unreadable crop(s) in {split_dir}, e.g. {unreadable[:5]}. "
+            "Rebuild the dataset with `modal run models/data_preparation.py --rebuild true`."
+        )
+
+
+def pack_split(status_dir, split, crop_size=224, workers=8):
+    """Pack <status_dir>/<split>/<status>/*.png into the memory-mappable store; returns the crop count."""
+    split_dir = os.path.join(status_dir, split)
+    entries = _list_split(split_dir)
+    paths = packed_paths(status_dir, split)
+    os.makedirs(os.path.dirname(paths["images"]), exist_ok=True)
+
+    tmp = {key: f"{path}.tmp" for key, path in paths.items()}
+    shape = (len(entries), crop_size, crop_size, 3)
+    try:
+        if entries:
+            _pack_images(split_dir, entries, tmp["images"], shape, workers)
+        else:
+            with open(tmp["images"], "wb") as f:
+                np.save(f, np.zeros(shape, dtype=np.uint8))
+
+        with open(tmp["labels"], "wb") as f:
+            np.save(f, np.array([label for _, label in entries], dtype=np.int64))
+        with open(tmp["index"], "w", encoding="utf-8") as f:
+            json.dump({"split": split, "crop_size": crop_size, "files": [path for path, _ in entries]}, f)
+    except BaseException:
+        for path in tmp.values():
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    # Move the finished files into place
+    for key in ("images", "labels", "index"):
+        os.replace(tmp[key], paths[key])
+    return len(entries)
+
+
+class PackedCropDataset:
+    """
+    Map-style dataset over a packed split. Returns (PIL RGB image, label) so the
+    usual torchvision transforms apply; `targets` holds the labels as ints.
+    """
+
+    def __init__(self, status_dir, split, transform=None):
+        paths = packed_paths(status_dir, split)
+        self.transform = transform
+        self.images = np.load(paths["images"], mmap_mode="r")
+        self.targets = np.load(paths["labels"]).tolist()
+        with open(paths["index"], "r", encoding="utf-8") as f:
+            self.files = json.load(f)["files"]
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, idx):
+        from PIL import Image
+
+        img = Image.fromarray(np.asarray(self.images[idx]))
+        label = self.targets[idx]
+        if self.transform:
+            img = self.transform(img)
+        return img, label
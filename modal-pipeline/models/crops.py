@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+
+# ==============================================================================
+# TOOTH CROPS
+# ==============================================================================
+# Shared by inference (status prediction) and data preparation (status dataset).
+# A tooth crop is a square region around the polygon, padded by `padding_ratio`,
+# with every pixel outside the polygon set to black, resized to 224x224.
+
+CROP_SIZE = 224
+
+
+def _crop_window(points, h, w, padding_ratio):
+    """Return the padded square window (x1, y1, x2, y2) around a polygon, clipped to the image."""
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    x1, y1, x2, y2 = min(xs), min(ys), max(xs), max(ys)
+
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    size = max(x2 - x1, y2 - y1) * (1 + padding_ratio)
+
+    nx1 = max(0, int(cx - size / 2))
+    ny1 = max(0, int(cy - size / 2))
+    nx2 = min(w, int(cx + size / 2))
+    ny2 = min(h, int(cy + size / 2))
+    return nx1, ny1, nx2, ny2
+
+
+def masked_tooth_crop(image, points, padding_ratio=0.15, crop_size=CROP_SIZE):
+    """
+    Masked square crop of one tooth.
+    The polygon is rasterized only inside the crop window, so no full-frame
+    mask is allocated. Pixel-identical to masked_tooth_crop_full_frame.
+    """
+    h, w = image.shape[:2]
+    nx1, ny1, nx2, ny2 = _crop_window(points, h, w, padding_ratio)
+
+    roi = image[ny1:ny2, nx1:nx2]
+    if roi.size == 0:
+        return None
+
+    # Integer translation keeps the rasterization identical to a full-frame fillPoly.
+    pts = np.array(points, dtype=np.int32) - np.array([nx1, ny1], dtype=np.int32)
+    mask = np.zeros(roi.shape[:2], dtype=np.uint8)
+    cv2.fillPoly(mask, [pts], 255)
+    masked = cv2.bitwise_and(roi, roi, mask=mask)
+
+    return cv2.resize(masked, (crop_size, crop_size), interpolation=cv2.INTER_AREA)
+
+
+def masked_tooth_crop_full_frame(image, points, padding_ratio=0.15, crop_size=CROP_SIZE):
+    """Reference implementation: masks the whole image before cropping."""
+    h, w = image.shape[:2]
+    pts = np.array(points, dtype=np.int32)
+
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.fillPoly(mask, [pts], 255)
+    masked = cv2.bitwise_and(image, image, mask=mask)
+
+    nx1, ny1, nx2, ny2 = _crop_window(points, h, w, padding_ratio)
+    crop = masked[ny1:ny2, nx1:nx2]
+    if crop.size == 0:
+        return None
+    return cv2.resize(crop, (crop_size, crop_size), interpolation=cv2.INTER_AREA)
@@ -1,5 +1,6 @@
 import os
 import json
+import hashlib
 import shutil
 import random
 from pathlib import Path
@@ -28,6 +29,12 @@ from config import (
 
 RAW_DATASET_DIR = f"{DATASET_PATH}/raw"
 KAGGLE_DATASET = "zwbzwb12341234/a-dual-labeled-dataset"
+DEFAULT_WORKERS = 8     # conversion processes; matches the cpu request of prepare_dataset
+PROGRESS_EVERY = 50     # samples between progress lines
+CROP_PADDING_RATIO = 0.15
+MANIFEST_PATH = f"{DATASET_PATH}/manifest.json"
+MANIFEST_VERSION = 1    # bump when the conversion output changes for the same inputs
+SPLITS = ("train", "val", "test")
 
 
 def _ensure_dir(path: str):
@@ -92,50 +99,10 @@ def _find_images_and_labels_dirs():
     return images_dir, labels_dir
 
 
-def _polygon_to_bbox(points):
-    """Return bounding box [x1, y1, x2, y2] for a polygon."""
-    xs = [p[0] for p in points]
-    ys = [p[1] for p in points]
-    return [min(xs), min(ys), max(xs), max(ys)]
-
-
-def _crop_tooth(image, points, padding_ratio=0.15):
-    """Extract a square crop of a tooth with padding."""
-    import cv2
-
-    h, w = image.shape[:2]
-    bbox = _polygon_to_bbox(points)
-    x1, y1, x2, y2 = bbox
-
-    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-    bw, bh = x2 - x1, y2 - y1
-    size = max(bw, bh) * (1 + padding_ratio)
-
-    nx1 = max(0, int(cx - size / 2))
-    ny1 = max(0, int(cy - size / 2))
-    nx2 = min(w, int(cx + size / 2))
-    ny2 = min(h, int(cy + size / 2))
-
-    crop = image[ny1:ny2, nx1:nx2]
-    if crop.size == 0:
-        return None
-
-    crop = cv2.resize(crop, (224, 224), interpolation=cv2.INTER_AREA)
-    return crop
-
-
-def _masked_crop(image, points, padding_ratio=0.15):
+def _masked_crop(image, points, padding_ratio=CROP_PADDING_RATIO):
     """Crop with mask applied: background outside the polygon becomes black."""
-    import cv2
-    import numpy as np
-
-    h, w = image.shape[:2]
-    mask = np.zeros((h, w), dtype=np.uint8)
-    pts = np.array(points, dtype=np.int32)
-    cv2.fillPoly(mask, [pts], 255)
-
-    masked = cv2.bitwise_and(image, image, mask=mask)
-    return _crop_tooth(masked, points, padding_ratio)
+    from crops import masked_tooth_crop
+    return masked_tooth_crop(image, points, padding_ratio)
 
 
 def _convert_single_label(label_path: Path, images_dir: Path, yolo_out_dir: Path, status_out_dir: Path):
@@ -213,11 +180,229 @@ def _convert_single_label(label_path: Path, images_dir: Path, yolo_out_dir: Path
     }
 
 
-def _build_datasets(split_ratios=(0.8, 0.1, 0.1), seed=42):
-    """Build YOLO and status datasets."""
+def _init_worker():
+    """Keep each worker process on one OpenCV thread; the pool provides the parallelism."""
     import cv2
+    cv2.setNumThreads(1)
+
+
+def _process_sample(task):
+    """
+    Convert one sample and write its YOLO image/label and status crops.
+    Output names depend only on the sample, so workers never touch each other's files.
+    Returns the status of each crop written (in crop index order), or None if the sample was skipped.
+    """
+    import cv2
+
+    split, lf, img_path, images_dir, yolo_dir, status_dir = task
+    result = _convert_single_label(lf, images_dir, yolo_dir, status_dir)
+    if result is None:
+        return None
+
+    # Copy image into YOLO structure
+    dst_img = f"{yolo_dir}/images/{split}/{img_path.name}"
+    shutil.copy(str(img_path), dst_img)
+
+    # Write YOLO label file
+    dst_label = f"{yolo_dir}/labels/{split}/{img_path.stem}.txt"
+    with open(dst_label, "w", encoding="utf-8") as f:
+        f.write("\n".join(result["yolo_lines"]))
+
+    # Save status crops
+    for idx, (status, crop) in enumerate(result["status_crops"]):
+        crop_path = f"{status_dir}/{split}/{status}/{img_path.stem}_{idx}.png"
+        cv2.imwrite(crop_path, crop)
+    return [status for status, _ in result["status_crops"]]
+
+
+def _run_tasks(tasks, workers, progress_every=PROGRESS_EVERY):
+    """
+    Run _process_sample over tasks (serially when workers <= 1) with progress and throughput.
+    Returns (stats, per-task results in task order).
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    t0 = time.perf_counter()
+    converted, skipped, n_crops = 0, 0, 0
+    outputs = []
+
+    def report(done):
+        elapsed = time.perf_counter() - t0
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"  {done}/{len(tasks)} samples, {n_crops} crops, {rate:.1f} samples/s")
+
+    if workers <= 1:
+        results = map(_process_sample, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        results = executor.map(_process_sample, tasks, chunksize=4)
+
+    try:
+        for done, crop_statuses in enumerate(results, start=1):
+            outputs.append(crop_statuses)
+            if crop_statuses is None:
+                skipped += 1
+            else:
+                converted += 1
+                n_crops += len(crop_statuses)
+            if done % progress_every == 0 or done == len(tasks):
+                report(done)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "converted": converted,
+        "skipped": skipped,
+        "crops": n_crops,
+        "workers": workers,
+        "elapsed_s": elapsed,
+        "samples_per_s": len(tasks) / elapsed if elapsed > 0 else 0.0,
+    }
+    return stats, outputs
+
+
+# ==============================================================================
+# INCREMENTAL BUILD MANIFEST
+# ==============================================================================
+# The manifest records, per sample (label file stem): the hashes of its label JSON
+# and image, its split and the status of every crop it produced. A later build only
+# converts samples that were added or whose inputs changed, moves the outputs of
+# samples whose split changed, and deletes the outputs of removed samples. The
+# result is byte-identical to a full build. Image hashes are reused while the
+# file size and mtime are unchanged, so an up-to-date check reads only the labels.
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _sample_fingerprint(lf, img_path, previous=None):
+    """Input hashes of one sample; reuses the previous image hash when size and mtime match."""
+    st = os.stat(img_path)
+    image_stat = [st.st_size, st.st_mtime_ns]
+    if previous and previous.get("image_name") == img_path.name and previous.get("image_stat") == image_stat:
+        image_sha = previous["image_sha"]
+    else:
+        image_sha = _file_sha256(img_path)
+    return {
+        "label_sha": _file_sha256(lf),
+        "image_name": img_path.name,
+        "image_sha": image_sha,
+        "image_stat": image_stat,
+    }
+
+
+def _same_inputs(a, b):
+    return all(a.get(k) == b.get(k) for k in ("label_sha", "image_name", "image_sha"))
+
+
+def _sample_outputs(entry, split, yolo_dir, status_dir):
+    """Paths written for a manifest entry if it is placed in `split`."""
+    if entry.get("crop_statuses") is None:
+        return []
+    stem = Path(entry["image_name"]).stem
+    paths = [
+        f"{yolo_dir}/images/{split}/{entry['image_name']}",
+        f"{yolo_dir}/labels/{split}/{stem}.txt",
+    ]
+    paths += [f"{status_dir}/{split}/{status}/{stem}_{idx}.png" for idx, status in enumerate(entry["crop_statuses"])]
+    return paths
+
+
+def _build_params(yolo_dir, status_dir):
+    """Everything besides the sample inputs that changes the conversion output."""
+    from crops import CROP_SIZE
+
+    return {
+        "version": MANIFEST_VERSION,
+        "crop_size": CROP_SIZE,
+        "padding_ratio": CROP_PADDING_RATIO,
+        "fdi_labels": FDI_LABELS,
+        "yolo_dir": str(yolo_dir),
+        "status_dir": str(status_dir),
+    }
+
+
+def _load_manifest(path):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"Warning: unreadable manifest {path}. Rebuilding everything.")
+        return None
 
-    images_dir, labels_dir = _find_images_and_labels_dirs()
+
+def _write_if_changed(path, text):
+    """Write text to path unless it already has exactly that content; returns True if written."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == text:
+                return False
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _move_outputs(old, entry, yolo_dir, status_dir):
+    """
+    Move a re-split sample's outputs to its new split. The manifest is only written at
+    the end of a build, so after an interrupted one some outputs may already be at their
+    destination; those count as moved. Returns False, moving nothing, if an output is in
+    neither place (the sample has to be converted again).
+    """
+    pairs = list(zip(
+        _sample_outputs(old, old["split"], yolo_dir, status_dir),
+        _sample_outputs(entry, entry["split"], yolo_dir, status_dir),
+    ))
+    if not all(os.path.exists(src) or os.path.exists(dst) for src, dst in pairs):
+        return False
+    for src, dst in pairs:
+        if os.path.exists(src):
+            os.replace(src, dst)
+    return True
+
+
+def _build_datasets(
+    split_ratios=(0.8, 0.1, 0.1),
+    seed=42,
+    workers=DEFAULT_WORKERS,
+    images_dir=None,
+    labels_dir=None,
+    yolo_dir=YOLO_DATASET_PATH,
+    status_dir=STATUS_DATASET_PATH,
+    manifest_path=MANIFEST_PATH,
+    rebuild=False,
+    pack_crops=True,
+):
+    """
+    Build YOLO and status datasets.
+    Only samples that are new or changed since the manifest was written are converted
+    (everything when rebuild=True or without a manifest). Conversion runs in a process
+    pool of `workers` processes; the split is drawn before any work starts and every
+    output name depends only on its sample, so the result is byte-identical to a
+    serial full build. With pack_crops, each split whose crops changed is also packed
+    into one memory-mappable array (crop_store.py).
+    """
+    if images_dir is None or labels_dir is None:
+        images_dir, labels_dir = _find_images_and_labels_dirs()
 
     # List all JSON labels that have a corresponding image
     label_files = sorted(labels_dir.glob("*.json"))
@@ -244,56 +429,114 @@ def _build_datasets(split_ratios=(0.8, 0.1, 0.1), seed=42):
         "test": valid_samples[n_train + n_val :],
     }
 
+    # Compare against the previous build
+    params = _build_params(yolo_dir, status_dir)
+    manifest = _load_manifest(manifest_path)
+    reuse = manifest is not None and not rebuild and manifest.get("params") == params
+    if manifest is not None and not reuse:
+        # Outputs of the old build are not reused, so remove them first
+        print("Rebuild requested or build parameters changed. Converting every sample.")
+        old_params = manifest.get("params", {})
+        for entry in manifest.get("samples", {}).values():
+            _remove_files(_sample_outputs(
+                entry, entry["split"], old_params.get("yolo_dir", yolo_dir), old_params.get("status_dir", status_dir)
+            ))
+    previous = manifest["samples"] if reuse else {}
+
     # Create directory structure
-    for split in ["train", "val", "test"]:
-        _ensure_dir(f"{YOLO_DATASET_PATH}/images/{split}")
-        _ensure_dir(f"{YOLO_DATASET_PATH}/labels/{split}")
+    for split in SPLITS:
+        _ensure_dir(f"{yolo_dir}/images/{split}")
+        _ensure_dir(f"{yolo_dir}/labels/{split}")
         for s in STATUS_LABELS:
-            _ensure_dir(f"{STATUS_DATASET_PATH}/{split}/{s}")
-
-    for split, samples in splits.items():
-        print(f"Processing {split}: {len(samples)} samples")
-        for lf, img_path in samples:
-            result = _convert_single_label(
-                lf, images_dir, YOLO_DATASET_PATH, STATUS_DATASET_PATH
-            )
-            if result is None:
-                continue
-
-            # Copy image into YOLO structure
-            dst_img = f"{YOLO_DATASET_PATH}/images/{split}/{img_path.name}"
-            shutil.copy(str(img_path), dst_img)
-
-            # Write YOLO label file
-            dst_label = f"{YOLO_DATASET_PATH}/labels/{split}/{img_path.stem}.txt"
-            with open(dst_label, "w", encoding="utf-8") as f:
-                f.write("\n".join(result["yolo_lines"]))
-
-            # Save status crops
-            for idx, (status, crop) in enumerate(result["status_crops"]):
-                crop_path = f"{STATUS_DATASET_PATH}/{split}/{status}/{img_path.stem}_{idx}.png"
-                cv2.imwrite(crop_path, crop)
+            _ensure_dir(f"{status_dir}/{split}/{s}")
+
+    samples = {}
+    tasks = []
+    changes = {"added": 0, "changed": 0, "moved": 0, "removed": 0, "unchanged": 0}
+    touched_splits = set()
+    for split, split_samples in splits.items():
+        print(f"{split}: {len(split_samples)} samples")
+        for lf, img_path in split_samples:
+            old = previous.get(lf.stem)
+            entry = dict(_sample_fingerprint(lf, img_path, old), split=split)
+            if old is not None and _same_inputs(old, entry):
+                entry["crop_statuses"] = old.get("crop_statuses")
+                if old["split"] == split:
+                    changes["unchanged"] += 1
+                elif _move_outputs(old, entry, yolo_dir, status_dir):
+                    changes["moved"] += 1
+                    touched_splits.update((old["split"], split))
+                else:
+                    # An interrupted build left the outputs incomplete; convert the sample again
+                    _remove_files([p for other in SPLITS for p in _sample_outputs(old, other, yolo_dir, status_dir)])
+                    touched_splits.update(SPLITS)
+                    changes["changed"] += 1
+                    tasks.append((split, lf, img_path, images_dir, yolo_dir, status_dir))
+            else:
+                if old is not None:
+                    _remove_files(_sample_outputs(old, old["split"], yolo_dir, status_dir))
+                    touched_splits.add(old["split"])
+                touched_splits.add(split)
+                changes["changed" if old is not None else "added"] += 1
+                tasks.append((split, lf, img_path, images_dir, yolo_dir, status_dir))
+            samples[lf.stem] = entry
+
+    for key, old in previous.items():
+        if key not in samples:
+            _remove_files(_sample_outputs(old, old["split"], yolo_dir, status_dir))
+            touched_splits.add(old["split"])
+            changes["removed"] += 1
+
+    print(
+        f"Changes since the last build: {changes['added']} added, {changes['changed']} changed, "
+        f"{changes['moved']} moved between splits, {changes['removed']} removed, {changes['unchanged']} unchanged"
+    )
+    print(f"Converting {len(tasks)} samples with {workers} worker(s)...")
+    conversion, crop_statuses = _run_tasks(tasks, workers)
+    for task, statuses in zip(tasks, crop_statuses):
+        samples[task[1].stem]["crop_statuses"] = statuses
+    print(
+        f"Converted {conversion['converted']} samples ({conversion['skipped']} skipped, "
+        f"{conversion['crops']} crops) in {conversion['elapsed_s']:.1f}s, "
+        f"{conversion['samples_per_s']:.1f} samples/s"
+    )
 
     # Generate data.yaml for YOLO
-    data_yaml = f"""path: {YOLO_DATASET_PATH}
+    data_yaml = f"""path: {yolo_dir}
 train: images/train
 val: images/val
 test: images/test
 nc: {len(FDI_LABELS)}
 names: {FDI_LABELS}
 """
-    yaml_path = f"{YOLO_DATASET_PATH}/data.yaml"
-    with open(yaml_path, "w", encoding="utf-8") as f:
-        f.write(data_yaml)
+    yaml_path = f"{yolo_dir}/data.yaml"
+    _write_if_changed(yaml_path, data_yaml)
 
-    print(f"YOLO dataset saved to: {YOLO_DATASET_PATH}")
-    print(f"Status dataset saved to: {STATUS_DATASET_PATH}")
+    # Packed status crops for memory-mapped training (crop_store.py)
+    packed = {}
+    if pack_crops:
+        from crop_store import has_packed_split, pack_split
+
+        for split in SPLITS:
+            if split in touched_splits or not has_packed_split(status_dir, split):
+                packed[split] = pack_split(status_dir, split, workers=max(workers, 1))
+                print(f"Packed {packed[split]} {split} crops.")
+
+    manifest = {"params": params, "seed": seed, "split_ratios": list(split_ratios), "samples": samples}
+    dirty = _write_if_changed(manifest_path, json.dumps(manifest, indent=1, sort_keys=True))
+
+    print(f"YOLO dataset saved to: {yolo_dir}")
+    print(f"Status dataset saved to: {status_dir}")
     print(f"{yaml_path} generated.")
 
     return {
         "train": len(splits["train"]),
         "val": len(splits["val"]),
         "test": len(splits["test"]),
+        "changes": changes,
+        "conversion": conversion,
+        "packed": packed,
+        "dirty": dirty or bool(packed),
     }
 
 
@@ -301,25 +544,37 @@ names: {FDI_LABELS}
     image=dental_image,
     volumes={"/data": volume},
     secrets=[kaggle_secret],
+    cpu=DEFAULT_WORKERS,
     timeout=3600,
 )
-def prepare_dataset(force_download: bool = False, split_ratios=(0.8, 0.1, 0.1)):
+def prepare_dataset(
+    force_download: bool = False,
+    split_ratios=(0.8, 0.1, 0.1),
+    workers: int = DEFAULT_WORKERS,
+    rebuild: bool = False,
+):
     """
     Download the Kaggle dataset, convert Labelme JSON to YOLO segmentation format,
     and build the status classification dataset.
+    `workers` sets the number of conversion processes (1 = serial). Only samples that
+    changed since the last build are converted unless rebuild=true.
     """
     raw_marker = Path(RAW_DATASET_DIR) / ".download_complete"
 
-    if force_download or not raw_marker.exists():
+    downloaded = force_download or not raw_marker.exists()
+    if downloaded:
         _download_kaggle_dataset()
         raw_marker.touch()
     else:
         print(f"Dataset already downloaded at {RAW_DATASET_DIR}. Skipping download.")
 
-    stats = _build_datasets(split_ratios=split_ratios)
+    stats = _build_datasets(split_ratios=split_ratios, workers=workers, rebuild=rebuild)
 
-    # Commit changes to the persistent volume
-    volume.commit()
+    # Commit changes to the persistent volume (nothing to commit when the dataset is up to date)
+    if downloaded or stats["dirty"]:
+        volume.commit()
+    else:
+        print("Dataset is up to date. Skipping volume commit.")
 
     return {
         "status": "done",
@@ -330,9 +585,9 @@ def prepare_dataset(force_download: bool = False, split_ratios=(0.8, 0.1, 0.1)):
 
 
 @app.local_entrypoint()
-def main():
+def main(force_download: bool = False, workers: int = DEFAULT_WORKERS, rebuild: bool = False):
     print("Starting dataset preparation in the cloud...")
-    result = prepare_dataset.remote()
+    result = prepare_dataset.remote(force_download=force_download, workers=workers, rebuild=rebuild)
     print(f"Result: {result}")
 
 
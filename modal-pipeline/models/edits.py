@@ -0,0 +1,212 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from image_io import decode_full
+from result_cache import prune_disk_dir
+
+# ==============================================================================
+# CLINICIAN EDITS (PARTIAL RE-INFERENCE)
+# ==============================================================================
+# When a clinician corrects a chart, only the parts that depend on the edit are
+# recomputed (api_reinfer in inference.py); YOLO does not run again:
+#   - teeth marked "edited" with "contour" (reshaped or drawn), or without a status
+#     (new), get a fresh masked crop and status classification;
+#   - teeth marked "edited" with "fdi" keep the clinician's label: their confidence
+#     becomes CLINICIAN_CONFIDENCE, so the heuristic neither relabels nor suppresses
+#     them, and they anchor the sequence alignment of their neighbours;
+#   - all other teeth keep their status; earlier heuristic corrections are undone and
+#     the FDI heuristic runs again over the edited chart.
+# api_predict returns an X-Image-Id for each upload and keeps the decoded scan in the
+# container's UploadStore (memory LRU), so an edit can refer to the scan instead of
+# uploading it again. With ?keep=1 the upload bytes are also written to the volume
+# (off the request path), where other containers find them; that tier is bounded by
+# a TTL and byte/entry caps (prune_disk).
+
+UPLOAD_MEMORY_BYTES = 512 * 1024 * 1024
+UPLOAD_DISK_MAX_BYTES = 2 * 1024 * 1024 * 1024
+UPLOAD_DISK_MAX_ENTRIES = 20_000
+UPLOAD_DISK_TTL_S = 7 * 24 * 3600
+UPLOAD_ID_LENGTH = 32
+CLINICIAN_CONFIDENCE = 1.0
+EDIT_KINDS = ("fdi", "contour")
+
+
+def upload_id(data):
+    """Content address of uploaded image bytes."""
+    return hashlib.blake2b(data, digest_size=UPLOAD_ID_LENGTH // 2).hexdigest()
+
+
+def is_upload_id(value):
+    """True for strings shaped like an upload_id (lowercase hex of the digest length)."""
+    return (
+        isinstance(value, str)
+        and len(value) == UPLOAD_ID_LENGTH
+        and all(c in "0123456789abcdef" for c in value)
+    )
+
+
+class UploadStore:
+    """
+    Thread-safe store of uploaded scans by upload_id: decoded full-resolution arrays
+    in an in-memory LRU bounded by size, and, on request, the upload bytes in a
+    bounded directory. Disk writes run on a background thread.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes=UPLOAD_MEMORY_BYTES,
+        disk_dir=None,
+        disk_max_bytes=UPLOAD_DISK_MAX_BYTES,
+        disk_max_entries=UPLOAD_DISK_MAX_ENTRIES,
+        disk_ttl_s=UPLOAD_DISK_TTL_S,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_max_entries = disk_max_entries
+        self.disk_ttl_s = disk_ttl_s
+        self._images = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._writer = None
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-writer")
+
+    def _disk_path(self, image_id):
+        return os.path.join(self.disk_dir, image_id[:2], image_id)
+
+    def _remember(self, image_id, image):
+        if image.nbytes > self.max_memory_bytes:
+            return
+        if image_id in self._images:
+            self._memory_bytes -= self._images.pop(image_id).nbytes
+        self._images[image_id] = image
+        self._memory_bytes += image.nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _write(self, image_id, data):
+        path = self._disk_path(image_id)
+        if os.path.exists(path):
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, image_id, image, data=None):
+        """
+        Keep a decoded upload in memory; with its bytes (`data`) and a disk directory,
+        also queue a write to disk. Returns the write's Future, or None.
+        """
+        if image is not None:
+            with self._lock:
+                self._remember(image_id, image)
+        if data is not None and self._writer is not None:
+            return self._writer.submit(self._write, image_id, data)
+        return None
+
+    def get(self, image_id):
+        """Decoded full-resolution array of an upload, or None when it is unknown here."""
+        if not is_upload_id(image_id):
+            return None
+        with self._lock:
+            image = self._images.get(image_id)
+            if image is not None:
+                self._images.move_to_end(image_id)
+                return image
+
+        if self.disk_dir:
+            path = self._disk_path(image_id)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)  # recently used, for prune_disk
+            except OSError:
+                return None
+            image = decode_full(data)
+            if image is not None:
+                with self._lock:
+                    self._remember(image_id, image)
+            return image
+        return None
+
+    def prune_disk(self):
+        """Bound the disk tier (TTL, then byte and entry caps); returns the number of uploads removed."""
+        if not self.disk_dir:
+            return 0
+        return prune_disk_dir(self.disk_dir, self.disk_max_bytes, self.disk_max_entries, self.disk_ttl_s)
+
+
+def edit_kinds(tooth):
+    """What the clinician changed on a tooth: "edited" may be true (everything) or a list of EDIT_KINDS."""
+    edited = tooth.get("edited")
+    if edited is True:
+        return set(EDIT_KINDS)
+    if not edited:
+        return set()
+    kinds = {edited} if isinstance(edited, str) else set(edited)
+    unknown = sorted(kinds - set(EDIT_KINDS))
+    if unknown:
+        raise ValueError(f"Unknown edit kinds: {unknown}. Expected any of {list(EDIT_KINDS)}.")
+    return kinds
+
+
+def bbox_from_contour(contour):
+    points = np.asarray(contour, dtype=np.float64).reshape(-1, 2)
+    return [float(v) for v in (*points.min(axis=0), *points.max(axis=0))]
+
+
+def prepare_edits(teeth):
+    """
+    Normalize an edited tooth list (response format plus "edited" marks) for
+    re-inference. Returns (teeth, reclassify, locked): copies of the teeth, indices
+    of the teeth that need a new status, and the number of clinician-labelled teeth.
+    Raises ValueError for malformed teeth.
+    """
+    prepared, reclassify = [], []
+    locked = 0
+    for i, tooth in enumerate(teeth):
+        if not isinstance(tooth, dict) or not isinstance(tooth.get("fdi"), str):
+            raise ValueError(f"Tooth {i} needs an 'fdi' label.")
+        contour = tooth.get("contour")
+        if not isinstance(contour, list) or len(contour) < 3:
+            raise ValueError(f"Tooth {i} needs a contour of at least 3 points.")
+        kinds = edit_kinds(tooth)
+
+        tooth = dict(tooth)
+        if "fdi" in kinds:
+            locked += 1
+            tooth["confidence_fdi"] = CLINICIAN_CONFIDENCE
+        elif "fdi_original" in tooth:
+            # Undo the previous heuristic correction; the heuristic runs again
+            tooth["fdi"] = tooth["fdi_original"]
+        tooth.pop("fdi_original", None)
+        tooth.pop("corrected_by_heuristic", None)
+        tooth["confidence_fdi"] = float(tooth.get("confidence_fdi", CLINICIAN_CONFIDENCE))
+
+        if "contour" in kinds or "bbox" not in tooth:
+            tooth["bbox"] = bbox_from_contour(contour)
+        if "contour" in kinds or "status" not in tooth:
+            tooth.pop("status", None)
+            reclassify.append(i)
+        prepared.append(tooth)
+    return prepared, reclassify, locked
+
+
+def teeth_extent(teeth):
+    """(height, width) covered by the teeth boxes; stands in for the image shape when no image is loaded."""
+    if not teeth:
+        return (0, 0)
+    boxes = np.asarray([t["bbox"] for t in teeth], dtype=np.float64)
+    return (int(np.ceil(boxes[:, 3].max())), int(np.ceil(boxes[:, 2].max())))
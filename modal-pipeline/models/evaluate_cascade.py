@@ -0,0 +1,113 @@
+import os
+import time
+
+import modal
+
+from config import app, dental_image, volume, FDI_LABELS, YOLO_DATASET_PATH
+
+# ==============================================================================
+# MODEL CASCADE EVALUATION
+# ==============================================================================
+# Runs every scan of a YOLO dataset split through the full model alone and through
+# the cascade (cascade.py), and reports the escalation rate, the reasons, the mean
+# latency of both and the saving, plus the FDI label accuracy of both against the
+# ground-truth polygons. Tune the bounds until the accuracy delta is acceptable,
+# then enable FDI_CASCADE in inference.py.
+
+
+def parse_bounds(text):
+    """'min_teeth=24,max_corrections=1' -> {"min_teeth": 24.0, "max_corrections": 1.0}."""
+    bounds = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        key, _, value = part.partition("=")
+        bounds[key.strip()] = float(value)
+    return bounds
+
+
+def evaluate_scans(paths, label_dir, full_predictor, cascade_predictor):
+    """Per-scan records for cascade_report: tier, reasons, latencies and label accuracy."""
+    from cascade import label_accuracy, read_yolo_labels
+    from inference import _decode_image, _run_prediction_core
+
+    records = []
+    for path in paths:
+        with open(path, "rb") as f:
+            image = _decode_image(f.read())
+        if image is None:
+            print(f"Skipping unreadable image: {path}")
+            continue
+
+        t0 = time.perf_counter()
+        full = _run_prediction_core(image, predictor=full_predictor)
+        t1 = time.perf_counter()
+        cascaded = _run_prediction_core(image, predictor=cascade_predictor)
+        t2 = time.perf_counter()
+
+        record = {
+            "image": os.path.basename(path),
+            "tier": cascaded["cascade"]["tier"],
+            "reasons": cascaded["cascade"]["reasons"],
+            "full_s": t1 - t0,
+            "cascade_s": t2 - t1,
+        }
+        label_path = os.path.join(label_dir, os.path.splitext(os.path.basename(path))[0] + ".txt")
+        if os.path.exists(label_path):
+            height, width = image.shape[:2]
+            gt_labels, gt_boxes = read_yolo_labels(label_path, width, height)
+            record["full_accuracy"] = label_accuracy(full["teeth"], gt_labels, gt_boxes, FDI_LABELS)
+            record["cascade_accuracy"] = label_accuracy(cascaded["teeth"], gt_labels, gt_boxes, FDI_LABELS)
+        records.append(record)
+    return records
+
+
+@app.function(image=dental_image, volumes={"/data": volume}, gpu="T4", timeout=3600)
+def evaluate_cascade(split: str = "test", bounds: str = "", limit: int = 0):
+    """Escalation rate and latency saving of the cascade on a split of the YOLO dataset."""
+    from cascade import cascade_report, resolve_bounds
+    from inference import FDI_FAST_MODEL_PATH, FDI_MODEL_PATH, IMAGE_EXTENSIONS, DentalPredictor
+
+    for path in (FDI_MODEL_PATH, FDI_FAST_MODEL_PATH):
+        if not os.path.exists(path):
+            raise RuntimeError(f"FDI model not found at {path}. Train it with train.py first.")
+    image_dir = f"{YOLO_DATASET_PATH}/images/{split}"
+    if not os.path.exists(image_dir):
+        raise RuntimeError(f"Split not found at {image_dir}. Run data_preparation.py first.")
+
+    cascade_bounds = resolve_bounds(parse_bounds(bounds))
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir) if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if limit:
+        paths = paths[:limit]
+
+    full_predictor = DentalPredictor()
+    cascade_predictor = DentalPredictor(cascade=True, cascade_bounds=cascade_bounds)
+    print(f"Evaluating the cascade on {len(paths)} {split} scans with bounds {cascade_bounds}...")
+
+    records = evaluate_scans(paths, f"{YOLO_DATASET_PATH}/labels/{split}", full_predictor, cascade_predictor)
+    report = cascade_report(records)
+    print(
+        f"Escalated {report['escalated']}/{report['scans']} scans ({report['escalation_rate']:.1%}), "
+        f"reasons {report['reasons']}"
+    )
+    print(
+        f"Mean latency: full {report['mean_full_ms']:.1f} ms, cascade {report['mean_cascade_ms']:.1f} ms "
+        f"({report['latency_saving']:+.1%} saved)"
+    )
+    if "accuracy_delta" in report:
+        print(
+            f"FDI label accuracy: full {report['full_accuracy']:.4f}, "
+            f"cascade {report['cascade_accuracy']:.4f} ({report['accuracy_delta']:+.4f})"
+        )
+    return {"split": split, "bounds": cascade_bounds, "report": report, "scans": records}
+
+
+@app.local_entrypoint()
+def main(split: str = "test", bounds: str = "", limit: int = 0):
+    print("Evaluating the FDI model cascade in the cloud...")
+    result = evaluate_cascade.remote(split=split, bounds=bounds, limit=limit)
+    print(f"Result: {result['report']}")
+
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,109 @@
+import os
+import time
+
+import modal
+
+from config import app, dental_image, volume, STATUS_DATASET_PATH
+
+# ==============================================================================
+# STATUS CLASSIFIER PRECISION EVALUATION
+# ==============================================================================
+# Runs the status classifier in every precision mode (precision.py) over a split of
+# the status dataset and reports, per mode: accuracy, accuracy delta and agreement
+# with fp32, and per-crop latency. Pick the cheapest mode that keeps agreement with
+# fp32 and set STATUS_PRECISION in inference.py accordingly.
+
+
+def evaluate_modes(model, crops, labels, modes, calibration_crops=None, batch_size=32):
+    """Evaluate an fp32 status model in each precision mode on (crops, labels)."""
+    import numpy as np
+
+    from inference import _classify_crops, _crops_to_tensor
+    from precision import apply_precision
+
+    labels = np.asarray(labels)
+    results = {}
+    reference = None
+    for mode in ["fp32"] + [m for m in modes if m != "fp32"]:
+        t0 = time.perf_counter()
+        mode_model = apply_precision(model, mode, calibration_crops, _crops_to_tensor)
+        prepare_s = time.perf_counter() - t0
+
+        _classify_crops(crops[:batch_size], mode_model)  # warmup
+        preds, confs = [], []
+        t0 = time.perf_counter()
+        for start in range(0, len(crops), batch_size):
+            pred, conf = _classify_crops(crops[start:start + batch_size], mode_model)
+            preds.extend(pred)
+            confs.extend(conf)
+        elapsed = time.perf_counter() - t0
+
+        preds, confs = np.asarray(preds), np.asarray(confs)
+        if reference is None:
+            reference = (preds, confs)
+        accuracy = float((preds == labels).mean()) if len(labels) else 0.0
+        results[mode] = {
+            "accuracy": accuracy,
+            "accuracy_delta": accuracy - results["fp32"]["accuracy"] if "fp32" in results else 0.0,
+            "agreement_with_fp32": float((preds == reference[0]).mean()) if len(preds) else 1.0,
+            "mean_confidence_diff": float(np.abs(confs - reference[1]).mean()) if len(confs) else 0.0,
+            "per_crop_ms": 1000 * elapsed / max(len(crops), 1),
+            "prepare_s": prepare_s,
+        }
+    return {mode: results[mode] for mode in results if mode in modes}
+
+
+@app.function(image=dental_image, volumes={"/data": volume}, cpu=4, timeout=3600)
+def evaluate_precision(
+    modes: str = "fp32,bf16,int8-dynamic,int8-static",
+    split: str = "test",
+    threads: int = 4,
+    batch_size: int = 32,
+):
+    """Compare the status classifier precision modes on a split of the status dataset."""
+    import torch
+
+    from inference import STATUS_MODEL_PATH, _load_status_classifier
+    from precision import CALIBRATION_SAMPLES, CALIBRATION_SPLIT, PRECISIONS, load_crops
+
+    modes = [m.strip() for m in modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in PRECISIONS]
+    if unknown:
+        raise ValueError(f"Unknown precision modes: {unknown}. Expected any of {PRECISIONS}.")
+
+    model = _load_status_classifier(STATUS_MODEL_PATH)
+    if model is None:
+        raise RuntimeError(f"Status classifier not found at {STATUS_MODEL_PATH}. Run train_status.py first.")
+    split_dir = f"{STATUS_DATASET_PATH}/{split}"
+    if not os.path.exists(split_dir):
+        raise RuntimeError(f"Status split not found at {split_dir}. Run data_preparation.py first.")
+
+    torch.set_num_threads(threads)
+    crops, labels = load_crops(split_dir)
+    calibration_crops = None
+    if "int8-static" in modes:
+        calibration_crops, _ = load_crops(f"{STATUS_DATASET_PATH}/{CALIBRATION_SPLIT}", limit=CALIBRATION_SAMPLES)
+    print(f"Evaluating {modes} on {len(crops)} {split} crops ({threads} threads)...")
+
+    results = evaluate_modes(model, crops, labels, modes, calibration_crops, batch_size)
+    for mode, r in results.items():
+        print(
+            f"{mode:>13}: acc {r['accuracy']:.4f} ({r['accuracy_delta']:+.4f}), "
+            f"agreement {r['agreement_with_fp32']:.4f}, {r['per_crop_ms']:.2f} ms/crop"
+        )
+    return {"split": split, "n_crops": len(crops), "threads": threads, "modes": results}
+
+
+@app.local_entrypoint()
+def main(
+    modes: str = "fp32,bf16,int8-dynamic,int8-static",
+    split: str = "test",
+    threads: int = 4,
+):
+    print("Evaluating status classifier precision modes in the cloud...")
+    result = evaluate_precision.remote(modes=modes, split=split, threads=threads)
+    print(f"Result: {result}")
+
+
+if __name__ == "__main__":
+    app.run()
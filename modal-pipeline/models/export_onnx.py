@@ -0,0 +1,73 @@
+import os
+import modal
+
+from config import app, dental_image, volume
+
+# ==============================================================================
+# ONNX EXPORT
+# ==============================================================================
+# Writes the trained YOLO11-seg weights and the ResNet18 status classifier to ONNX
+# next to their PyTorch checkpoints, for the CPU backend in onnx_backend.py.
+# Both graphs use dynamic batch (and for YOLO dynamic H/W) axes.
+
+ONNX_OPSET = 17
+
+
+def export_fdi_model(weights_path, imgsz=640):
+    """Export YOLO11-seg weights to ONNX; returns the .onnx path (next to the weights)."""
+    from ultralytics import YOLO
+
+    model = YOLO(weights_path)
+    return model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True, opset=ONNX_OPSET)
+
+
+def export_status_classifier(model, onnx_path):
+    """Export a loaded status classifier (eval mode, CPU) to ONNX with a dynamic batch axis."""
+    import torch
+
+    dummy = torch.zeros(1, 3, 224, 224)
+    torch.onnx.export(
+        model,
+        dummy,
+        onnx_path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=ONNX_OPSET,
+        dynamo=False,  # TorchScript exporter: no onnxscript dependency
+    )
+    return onnx_path
+
+
+@app.function(image=dental_image, volumes={"/data": volume}, timeout=1800)
+def export_onnx():
+    """Export both trained models to ONNX on the volume."""
+    from inference import FDI_MODEL_PATH, FDI_ONNX_PATH, STATUS_MODEL_PATH, STATUS_ONNX_PATH, _load_status_classifier
+
+    if not os.path.exists(FDI_MODEL_PATH):
+        raise RuntimeError(f"FDI model not found at {FDI_MODEL_PATH}. Run train.py first.")
+
+    exported = {"fdi_model": export_fdi_model(FDI_MODEL_PATH)}
+    print(f"FDI model exported to: {exported['fdi_model']}")
+
+    status_model = _load_status_classifier(STATUS_MODEL_PATH)
+    if status_model is not None:
+        exported["status_model"] = export_status_classifier(status_model, STATUS_ONNX_PATH)
+        print(f"Status classifier exported to: {exported['status_model']}")
+    else:
+        print(f"Warning: status classifier not found at {STATUS_MODEL_PATH}. Skipping.")
+
+    volume.commit()
+    exported["expected_fdi_path"] = FDI_ONNX_PATH
+    return exported
+
+
+@app.local_entrypoint()
+def main():
+    print("Exporting models to ONNX in the cloud...")
+    result = export_onnx.remote()
+    print(f"Result: {result}")
+
+
+if __name__ == "__main__":
+    app.run()
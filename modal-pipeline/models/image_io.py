@@ -0,0 +1,95 @@
+import struct
+import time
+
+import cv2
+import numpy as np
+
+# ==============================================================================
+# IMAGE INGESTION
+# ==============================================================================
+# Uploaded panoramics are decoded once. The full-resolution array is only used for
+# the status crops, and it stays single-channel when the file is grayscale (PNG
+# color type 0/4, single-component JPEG), which is a third of the memory of a BGR
+# decode. YOLO gets a copy reduced with INTER_AREA to exactly the size its
+# letterbox would produce (long side = imgsz), so the letterbox has nothing left to
+# resize. Contours and boxes come back in the reduced image and are scaled to
+# original-image coordinates with `scale`.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_GRAY_TYPES = (0, 4)  # grayscale, grayscale + alpha
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def is_grayscale_source(data):
+    """True if the PNG/JPEG header declares a single-channel image; False otherwise or when unknown."""
+    data = bytes(data[:65536])
+    if data.startswith(PNG_SIGNATURE) and len(data) >= 26:
+        return data[25] in _PNG_GRAY_TYPES  # IHDR color type
+
+    if data.startswith(b"\xff\xd8"):
+        pos = 2
+        while pos + 4 <= len(data):
+            if data[pos] != 0xFF:
+                return False
+            marker = data[pos + 1]
+            if marker == 0xFF:  # fill byte
+                pos += 1
+                continue
+            length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+            if marker in _JPEG_SOF_MARKERS:
+                return pos + 9 < len(data) and data[pos + 9] == 1  # number of components
+            pos += 2 + length
+    return False
+
+
+def inference_size(height, width, imgsz):
+    """(width, height) of the letterboxed image before padding; never larger than the input."""
+    r = min(imgsz / height, imgsz / width, 1.0)
+    return int(round(width * r)), int(round(height * r))
+
+
+class IngestedImage:
+    """
+    A decoded upload: `full` (original resolution, HxW or HxWx3 uint8) for crops,
+    `inference` (reduced BGR) for YOLO, and `scale` = (sx, sy) from inference to
+    original coordinates. `shape` is the original (H, W, 3), as for a BGR decode.
+    """
+
+    def __init__(self, full, imgsz, stats=None):
+        t0 = time.perf_counter()
+        h, w = full.shape[:2]
+        size = inference_size(h, w, imgsz)
+        small = full if size == (w, h) else cv2.resize(full, size, interpolation=cv2.INTER_AREA)
+        self.inference = cv2.cvtColor(small, cv2.COLOR_GRAY2BGR) if small.ndim == 2 else small
+        self.full = full
+        self.shape = (h, w, 3)
+        self.scale = (w / size[0], h / size[1])
+        self.stats = dict(stats or {})
+        self.stats.update({
+            "resize_ms": 1000 * (time.perf_counter() - t0),
+            "grayscale": full.ndim == 2,
+            "full_bytes": full.nbytes,
+            "inference_bytes": self.inference.nbytes,
+            "inference_shape": list(self.inference.shape[:2]),
+        })
+
+
+def decode_full(data, keep_gray=True):
+    """Full-resolution array of image bytes (single channel for grayscale files), or None."""
+    gray = keep_gray and is_grayscale_source(data)
+    buf = np.frombuffer(data, np.uint8)
+    return cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR)
+
+
+def decode_image(data, imgsz, keep_gray=True):
+    """Decode image bytes into an IngestedImage; returns None if they cannot be decoded."""
+    t0 = time.perf_counter()
+    full = decode_full(data, keep_gray)
+    if full is None:
+        return None
+    return IngestedImage(full, imgsz, {"decode_ms": 1000 * (time.perf_counter() - t0)})
+
+
+def ingest_array(img_array, imgsz):
+    """IngestedImage from an already decoded BGR or grayscale array."""
+    return IngestedImage(np.asarray(img_array), imgsz)
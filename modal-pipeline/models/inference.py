@@ -1,7 +1,8 @@
 import os
 import modal
 
-from config import app, dental_image, volume, MODELS_DIR, FDI_LABELS, STATUS_LABELS
+from config import app, dental_image, volume, metrics_store, DATA_DIR, MODELS_DIR, STATUS_DATASET_PATH, FDI_LABELS, STATUS_LABELS
+from latency_metrics import LatencyRecorder, StageTimer
 
 # ==============================================================================
 # DUAL-MODEL INFERENCE
@@ -12,23 +13,53 @@ from config import app, dental_image, volume, MODELS_DIR, FDI_LABELS, STATUS_LAB
 
 FDI_MODEL_PATH = f"{MODELS_DIR}/dental_fdi_segmentation/weights/best.pt"
 STATUS_MODEL_PATH = f"{MODELS_DIR}/dental_status_classifier/best_status_classifier.pth"
+FDI_FAST_MODEL_PATH = f"{MODELS_DIR}/dental_fdi_segmentation_fast/weights/best.pt"  # cascade.py
+FDI_ONNX_PATH = f"{MODELS_DIR}/dental_fdi_segmentation/weights/best.onnx"
+STATUS_ONNX_PATH = f"{MODELS_DIR}/dental_status_classifier/best_status_classifier.onnx"
+BACKENDS = ("torch", "onnx")
+CROP_ENGINES = ("polygon", "device")  # cv2 per-polygon crops, or batched crops from YOLO's mask tensor (mask_crops.py)
 NUM_STATUS_CLASSES = 7
-
-
-def _load_status_classifier():
-    """Load the trained status classifier."""
+STATUS_BATCH_SIZE = 32
+STATUS_PRECISION = "fp32"  # see precision.py; pick with evaluate_precision.py
+IMAGE_BATCH_SIZE = 8
+FDI_CONF = 0.25
+FDI_IMGSZ = 640
+RESULT_CACHE_DIR = f"{DATA_DIR}/cache/predictions"
+CACHE_MAINTENANCE_INTERVAL_S = 300.0  # prune the disk tiers, commit and reload the volume
+REDUCED_DECODE = True  # uploads: YOLO on a reduced copy, crops from the full image (image_io.py)
+FDI_CASCADE = False  # fast YOLO first, full YOLO only for escalated scans (cascade.py)
+METRICS_PUBLISH_INTERVAL_S = 15.0
+METRICS_STALE_S = 3600.0
+STATUS_MEAN = [0.485, 0.456, 0.406]
+STATUS_STD = [0.229, 0.224, 0.225]
+
+
+def _load_status_classifier(model_path=STATUS_MODEL_PATH, precision="fp32", calibration_dir=None):
+    """
+    Load the trained status classifier in the given precision (see precision.py).
+    int8-static calibrates on crops from `calibration_dir` (default: the train split).
+    """
     import torch
     from torchvision import models
 
-    if not os.path.exists(STATUS_MODEL_PATH):
+    if not os.path.exists(model_path):
         return None
 
     model = models.resnet18(weights=None)
     num_ftrs = model.fc.in_features
     model.fc = torch.nn.Linear(num_ftrs, NUM_STATUS_CLASSES)
-    model.load_state_dict(torch.load(STATUS_MODEL_PATH, map_location="cpu"))
+    model.load_state_dict(torch.load(model_path, map_location="cpu"))
     model.eval()
-    return model
+    if precision == "fp32":
+        return model
+
+    from precision import CALIBRATION_SAMPLES, CALIBRATION_SPLIT, apply_precision, load_crops
+
+    calibration_crops = None
+    if precision == "int8-static":
+        calibration_dir = calibration_dir or f"{STATUS_DATASET_PATH}/{CALIBRATION_SPLIT}"
+        calibration_crops, _ = load_crops(calibration_dir, limit=CALIBRATION_SAMPLES)
+    return apply_precision(model, precision, calibration_crops, _crops_to_tensor)
 
 
 def _status_transform():
@@ -36,51 +67,31 @@ def _status_transform():
     return transforms.Compose([
         transforms.Resize((224, 224)),
         transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        transforms.Normalize(STATUS_MEAN, STATUS_STD),
     ])
 
 
 def _masked_crop_from_points(image, points, padding_ratio=0.15):
-    """Square crop with mask based on a polygon."""
+    """Square crop with mask based on a polygon; BGR even for a single-channel image."""
     import cv2
-    import numpy as np
-
-    h, w = image.shape[:2]
-    pts = np.array(points, dtype=np.int32)
-
-    mask = np.zeros((h, w), dtype=np.uint8)
-    cv2.fillPoly(mask, [pts], 255)
-    masked = cv2.bitwise_and(image, image, mask=mask)
-
-    xs = [p[0] for p in points]
-    ys = [p[1] for p in points]
-    x1, y1, x2, y2 = min(xs), min(ys), max(xs), max(ys)
-
-    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-    size = max(x2 - x1, y2 - y1) * (1 + padding_ratio)
-
-    nx1 = max(0, int(cx - size / 2))
-    ny1 = max(0, int(cy - size / 2))
-    nx2 = min(w, int(cx + size / 2))
-    ny2 = min(h, int(cy + size / 2))
-
-    crop = masked[ny1:ny2, nx1:nx2]
-    if crop.size == 0:
-        return None
-    crop = cv2.resize(crop, (224, 224), interpolation=cv2.INTER_AREA)
+    from crops import masked_tooth_crop
+    crop = masked_tooth_crop(image, points, padding_ratio)
+    if crop is not None and crop.ndim == 2:
+        crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
     return crop
 
 
-def _predict_status(crop, model):
+def _predict_status(crop, model, transform=None):
     """Predict the status of one tooth from a crop."""
     import cv2
     import torch
     from PIL import Image
 
     if model is None or crop is None:
-        return {"status_id": -1, "status_name": "unknown", "confidence": 0.0}
+        return _unknown_status()
 
-    transform = _status_transform()
+    if transform is None:
+        transform = _status_transform()
     pil = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
     tensor = transform(pil).unsqueeze(0)
 
@@ -97,6 +108,79 @@ def _predict_status(crop, model):
     }
 
 
+def _unknown_status():
+    return {"status_id": -1, "status_name": "unknown", "confidence": 0.0}
+
+
+def _crops_to_tensor(crops):
+    """
+    Stack 224x224 BGR crops into a normalized NCHW tensor.
+    Equivalent to _status_transform() applied per crop, without the PIL round trip.
+    """
+    import numpy as np
+    import torch
+
+    rgb = np.ascontiguousarray(np.stack(crops)[..., ::-1])
+    tensor = torch.from_numpy(rgb).permute(0, 3, 1, 2).float().div(255)
+    mean = torch.tensor(STATUS_MEAN).view(1, 3, 1, 1)
+    std = torch.tensor(STATUS_STD).view(1, 3, 1, 1)
+    return tensor.sub_(mean).div_(std)
+
+
+def _model_device(model):
+    import torch
+    params = list(model.parameters())
+    return params[0].device if params else torch.device("cpu")
+
+
+def _classify_crops(crops, model):
+    """
+    Return (status ids, confidences) for a list of crops with a torch or ONNX classifier.
+    Crops are 224x224 BGR arrays, or (3, 224, 224) tensors from mask_crops.py, which are
+    normalized on their device.
+    """
+    if hasattr(model, "classify"):
+        return model.classify(crops)
+
+    import torch
+
+    if isinstance(crops[0], torch.Tensor):
+        from mask_crops import normalize_crops
+        tensor = normalize_crops(torch.stack(crops), STATUS_MEAN, STATUS_STD).to(_model_device(model))
+    else:
+        tensor = _crops_to_tensor(crops).to(_model_device(model))
+    with torch.no_grad():
+        outputs = model(tensor)
+        probs = torch.softmax(outputs, dim=1)
+        conf, pred = torch.max(probs, 1)
+    return pred.tolist(), conf.tolist()
+
+
+def _predict_status_batch(crops, model, max_batch_size=STATUS_BATCH_SIZE):
+    """
+    Predict the status of many teeth with batched forward passes.
+    Returns one status dict per crop, in input order; None crops get "unknown".
+    Status ids match _predict_status; confidences agree up to float32 rounding (~1e-6).
+    """
+    statuses = [_unknown_status() for _ in crops]
+    if model is None:
+        return statuses
+
+    valid = [i for i, crop in enumerate(crops) if crop is not None]
+    for start in range(0, len(valid), max_batch_size):
+        chunk = valid[start:start + max_batch_size]
+        pred, conf = _classify_crops([crops[i] for i in chunk], model)
+
+        for i, status_id, confidence in zip(chunk, pred, conf):
+            statuses[i] = {
+                "status_id": int(status_id),
+                "status_name": STATUS_LABELS.get(int(status_id), "unknown"),
+                "confidence": float(confidence),
+            }
+
+    return statuses
+
+
 def _bbox_iou(a, b):
     """Compute Intersection over Union of two bounding boxes [x1, y1, x2, y2]."""
     x1 = max(a[0], b[0])
@@ -118,12 +202,100 @@ def _tooth_center(detection):
     return ((bbox[0] + bbox[2]) / 2.0, (bbox[1] + bbox[3]) / 2.0)
 
 
-def _remove_overlapping(detections, iou_threshold=0.65):
+def _bbox_iou_matrix(boxes):
+    """
+    Pairwise IoU of an (n, 4) array of [x1, y1, x2, y2] boxes.
+    Same float64 arithmetic as _bbox_iou, so values match it exactly.
+    """
+    import numpy as np
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+
+    inter = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = area[:, None] + area[None, :] - inter
+
+    iou = np.zeros_like(inter)
+    np.divide(inter, union, out=iou, where=union > 0)
+    return iou
+
+
+def _mask_iou_matrix(detections, scale=0.125):
+    """
+    Pairwise IoU of detection contours, rasterized on a grid downscaled by `scale`.
+    Tilted neighbouring teeth often have overlapping boxes but disjoint masks.
+    """
+    import cv2
+    import numpy as np
+
+    boxes = np.array([d["bbox"] for d in detections], dtype=np.float64)
+    width = int(np.ceil(boxes[:, 2].max() * scale)) + 1
+    height = int(np.ceil(boxes[:, 3].max() * scale)) + 1
+
+    masks = np.zeros((len(detections), height, width), dtype=np.uint8)
+    for i, det in enumerate(detections):
+        contour = det.get("contour")
+        if contour is not None and len(contour) >= 3:
+            pts = np.round(np.asarray(contour, dtype=np.float64) * scale).astype(np.int32)
+            cv2.fillPoly(masks[i], [pts], 1)
+        else:
+            bx1, by1, bx2, by2 = np.round(boxes[i] * scale).astype(np.int32)
+            masks[i, by1:by2 + 1, bx1:bx2 + 1] = 1
+
+    flat = masks.reshape(len(detections), -1).astype(np.float32)
+    inter = flat @ flat.T
+    area = np.diag(inter)
+    union = area[:, None] + area[None, :] - inter
+
+    iou = np.zeros_like(inter)
+    np.divide(inter, union, out=iou, where=union > 0)
+    return iou
+
+
+def _remove_overlapping(detections, iou_threshold=0.65, mode="bbox", mask_scale=0.125):
     """
     Remove lower-confidence overlapping predictions.
     This handles the case where the same physical tooth receives multiple
     FDI number predictions.
+
+    The IoU matrix is computed at once with NumPy; greedy suppression keeps the
+    same order and tie behaviour as _remove_overlapping_reference.
+    mode="mask" compares low-resolution rasterized contours instead of boxes.
     """
+    import numpy as np
+
+    if not detections:
+        return detections
+
+    # Stable sort: ties keep their input order, as in the reference implementation.
+    order = sorted(range(len(detections)), key=lambda i: detections[i]["confidence_fdi"], reverse=True)
+    sorted_dets = [detections[i] for i in order]
+
+    if mode == "mask":
+        iou = _mask_iou_matrix(sorted_dets, mask_scale)
+    elif mode == "bbox":
+        iou = _bbox_iou_matrix([d["bbox"] for d in sorted_dets])
+    else:
+        raise ValueError(f"Unknown overlap mode: {mode}")
+
+    overlaps = iou > iou_threshold
+    suppressed = np.zeros(len(sorted_dets), dtype=bool)
+    kept = []
+    for i in range(len(sorted_dets)):
+        if suppressed[i]:
+            continue
+        kept.append(sorted_dets[i])
+        suppressed |= overlaps[i]
+
+    return kept
+
+
+def _remove_overlapping_reference(detections, iou_threshold=0.65):
+    """Pure-Python reference for _remove_overlapping (bbox mode)."""
     if not detections:
         return detections
 
@@ -159,20 +331,120 @@ def _split_jaws(detections, h_orig):
     return upper, lower
 
 
-def _match_to_expected(detections, expected_sequence):
+# Expected FDI sequences from left to right in the panoramic image
+UPPER_EXPECTED = ["18", "17", "16", "15", "14", "13", "12", "11",
+                  "21", "22", "23", "24", "25", "26", "27", "28"]
+LOWER_EXPECTED = ["41", "42", "43", "44", "45", "46", "47", "48",
+                  "38", "37", "36", "35", "34", "33", "32", "31"]
+
+ALIGN_GAP_COST = 0.5
+ALIGN_MISMATCH_COST = 1.0
+ALIGN_MATCH_COST = 0.0
+
+
+def _align_jaws(
+    jaws,
+    expected_sequences,
+    gap_cost=ALIGN_GAP_COST,
+    mismatch_cost=ALIGN_MISMATCH_COST,
+    match_cost=ALIGN_MATCH_COST,
+    confidence_weight=0.0,
+):
+    """
+    Align many jaws with their expected FDI sequences in one call.
+
+    Same dynamic program as _match_to_expected_reference (diagonal = match/mismatch,
+    horizontal = gap for a missing tooth), filled one row at a time for all jaws at
+    once: within a row the gap chain is a running minimum, so each row is a few NumPy
+    operations. Backtracking also runs for all jaws together.
+
+    With confidence_weight > 0 a mismatch costs mismatch_cost * (1 + confidence_weight * conf),
+    so confident YOLO labels are harder to overrule.
+
+    Returns one list of expected labels per jaw, one label per detection.
+    """
+    import numpy as np
+
+    batch = len(jaws)
+    if batch == 0:
+        return []
+
+    lengths = np.array([len(j) for j in jaws], dtype=np.int64)
+    seq_lengths = np.array([len(e) for e in expected_sequences], dtype=np.int64)
+    n = int(lengths.max())
+    m = int(seq_lengths.max())
+    if n == 0:
+        return [[] for _ in jaws]
+
+    # Encode labels as integers; padding uses codes that never match (-1 vs -2).
+    codes = {}
+    fdi = np.full((batch, n), -1, dtype=np.int64)
+    conf = np.zeros((batch, n), dtype=np.float64)
+    expected = np.full((batch, m), -2, dtype=np.int64)
+    for b, (dets, seq) in enumerate(zip(jaws, expected_sequences)):
+        for i, det in enumerate(dets):
+            fdi[b, i] = codes.setdefault(det["fdi"], len(codes))
+            conf[b, i] = det.get("confidence_fdi", 0.0)
+        for j, label in enumerate(seq):
+            expected[b, j] = codes.setdefault(label, len(codes))
+
+    mismatch = mismatch_cost * (1.0 + confidence_weight * conf) if confidence_weight else np.full_like(conf, mismatch_cost)
+    cost = np.where(fdi[:, :, None] == expected[:, None, :], match_cost, mismatch[:, :, None])
+
+    # Forward pass: keep only the previous row and a "came from the diagonal" flag per cell.
+    steps = np.arange(m + 1, dtype=np.float64) * gap_cost
+    prev = np.broadcast_to(steps, (batch, m + 1)).copy()
+    from_diag = np.zeros((batch, n + 1, m + 1), dtype=bool)
+    for i in range(1, n + 1):
+        diag = np.full((batch, m + 1), np.inf)
+        diag[:, 1:] = prev[:, :-1] + cost[:, i - 1, :]
+        row = np.minimum.accumulate(diag - steps, axis=1) + steps
+        # Ties prefer the diagonal, as in the reference backtracking.
+        from_diag[:, i, 1:] = diag[:, 1:] <= row[:, :-1] + gap_cost
+        prev = row
+
+    # Backtrack all jaws together, starting at (len(jaw), len(expected)).
+    assigned = np.full((batch, n), -1, dtype=np.int64)
+    i = lengths.copy()
+    j = seq_lengths.copy()
+    rows = np.arange(batch)
+    for _ in range(n + m):
+        active = (i > 0) & (j > 0)
+        if not active.any():
+            break
+        take = active & from_diag[rows, i, j]
+        assigned[rows[take], i[take] - 1] = expected[rows[take], j[take] - 1]
+        i = np.where(take, i - 1, i)
+        j = np.where(active, j - 1, j)
+
+    labels = {code: label for label, code in codes.items()}
+    return [
+        [labels[int(assigned[b, k])] if assigned[b, k] >= 0 else det["fdi"] for k, det in enumerate(dets)]
+        for b, dets in enumerate(jaws)
+    ]
+
+
+def _match_to_expected(detections, expected_sequence, **costs):
     """
     Match detections to the expected FDI sequence using dynamic programming.
     Allows gaps for missing teeth.
     Returns a list of expected FDI labels, one per detection.
     """
+    if not detections:
+        return []
+    return _align_jaws([detections], [expected_sequence], **costs)[0]
+
+
+def _match_to_expected_reference(detections, expected_sequence):
+    """Pure-Python reference for _match_to_expected (cell-by-cell DP table)."""
     if not detections:
         return []
 
     n = len(detections)
     m = len(expected_sequence)
-    gap_cost = 0.5
-    mismatch_cost = 1.0
-    match_cost = 0.0
+    gap_cost = ALIGN_GAP_COST
+    mismatch_cost = ALIGN_MISMATCH_COST
+    match_cost = ALIGN_MATCH_COST
 
     # dp[i][j] = minimum cost to align first i detections with first j expected labels
     dp = [[float("inf")] * (m + 1) for _ in range(n + 1)]
@@ -181,7 +453,7 @@ def _match_to_expected(detections, expected_sequence):
     for i in range(n + 1):
         for j in range(m + 1):
             if i > 0 and j > 0:
-                cost = match_cost if detections[i - 1]["fdi"] == expected[j - 1] else mismatch_cost
+                cost = match_cost if detections[i - 1]["fdi"] == expected_sequence[j - 1] else mismatch_cost
                 dp[i][j] = min(dp[i][j], dp[i - 1][j - 1] + cost)
             if j > 0:
                 dp[i][j] = min(dp[i][j], dp[i][j - 1] + gap_cost)
@@ -190,16 +462,16 @@ def _match_to_expected(detections, expected_sequence):
     assignments = [None] * n
     i, j = n, m
     while i > 0 and j > 0:
-        cost = match_cost if detections[i - 1]["fdi"] == expected[j - 1] else mismatch_cost
+        cost = match_cost if detections[i - 1]["fdi"] == expected_sequence[j - 1] else mismatch_cost
         if dp[i][j] == dp[i - 1][j - 1] + cost:
-            assignments[i - 1] = expected[j - 1]
+            assignments[i - 1] = expected_sequence[j - 1]
             i -= 1
             j -= 1
         elif dp[i][j] == dp[i][j - 1] + gap_cost:
             j -= 1
         else:
             # Fallback: align with current expected label
-            assignments[i - 1] = expected[j - 1]
+            assignments[i - 1] = expected_sequence[j - 1]
             i -= 1
             j -= 1
 
@@ -210,22 +482,32 @@ def _match_to_expected(detections, expected_sequence):
     return assignments
 
 
-def _apply_fdi_heuristic(detections, h_orig, w_orig, iou_threshold=0.65, confidence_threshold=0.7):
+def _apply_fdi_heuristic(
+    detections,
+    h_orig,
+    w_orig,
+    iou_threshold=0.65,
+    confidence_threshold=0.7,
+    overlap_mode="bbox",
+    confidence_weight=0.0,
+):
     """
     Apply FDI numbering correction heuristic.
 
     Steps:
-    1. Remove overlapping predictions (duplicate FDI assignments for the same tooth).
+    1. Remove overlapping predictions (duplicate FDI assignments for the same tooth),
+       by bounding box or, with overlap_mode="mask", by low-resolution contour IoU.
     2. Split detections into upper and lower jaw by median y-coordinate.
     3. Sort each jaw by x-coordinate.
-    4. Align detections with the expected FDI sequence, allowing gaps for missing teeth.
+    4. Align detections with the expected FDI sequence, allowing gaps for missing teeth
+       (both jaws in one call; confidence_weight makes confident labels costlier to change).
     5. Reassign low-confidence labels that break the expected sequence.
     """
     if not detections:
         return detections
 
     # 1. Remove overlapping predictions
-    detections = _remove_overlapping(detections, iou_threshold)
+    detections = _remove_overlapping(detections, iou_threshold, mode=overlap_mode)
 
     # Separate supernumerary teeth (91) from the adult FDI sequence
     adult = [d for d in detections if d["fdi"] != "91"]
@@ -238,22 +520,13 @@ def _apply_fdi_heuristic(detections, h_orig, w_orig, iou_threshold=0.65, confide
     upper = sorted(upper, key=lambda d: _tooth_center(d)[0])
     lower = sorted(lower, key=lambda d: _tooth_center(d)[0])
 
-    # 4. Expected FDI sequences from left to right in the panoramic image
-    upper_expected = ["18", "17", "16", "15", "14", "13", "12", "11",
-                      "21", "22", "23", "24", "25", "26", "27", "28"]
-    lower_expected = ["41", "42", "43", "44", "45", "46", "47", "48",
-                      "38", "37", "36", "35", "34", "33", "32", "31"]
-
-    # 5. Match and correct
-    upper_expected_labels = _match_to_expected(upper, upper_expected)
-    for det, expected in zip(upper, upper_expected_labels):
-        if det["fdi"] != expected and det["confidence_fdi"] < confidence_threshold:
-            det["fdi_original"] = det["fdi"]
-            det["fdi"] = expected
-            det["corrected_by_heuristic"] = True
+    # 4. Align both jaws with their expected FDI sequences in one call
+    upper_expected_labels, lower_expected_labels = _align_jaws(
+        [upper, lower], [UPPER_EXPECTED, LOWER_EXPECTED], confidence_weight=confidence_weight
+    )
 
-    lower_expected_labels = _match_to_expected(lower, lower_expected)
-    for det, expected in zip(lower, lower_expected_labels):
+    # 5. Reassign low-confidence labels that break the sequence
+    for det, expected in zip(upper + lower, upper_expected_labels + lower_expected_labels):
         if det["fdi"] != expected and det["confidence_fdi"] < confidence_threshold:
             det["fdi_original"] = det["fdi"]
             det["fdi"] = expected
@@ -263,105 +536,1140 @@ def _apply_fdi_heuristic(detections, h_orig, w_orig, iou_threshold=0.65, confide
     return upper + lower + supernumerary
 
 
-def _run_prediction_core(img_array, use_heuristic=True):
-    """Internal prediction logic."""
-    import cv2
-    import numpy as np
-    from ultralytics import YOLO
+# ==============================================================================
+# WARM PREDICTOR
+# ==============================================================================
+# Loading YOLO and ResNet18 from the volume dominates per-scan latency, so both
+# models are loaded and warmed up once per container and reused for every request.
+
+class DentalPredictor:
+    """
+    Long-lived holder for the FDI segmentation model and the status classifier.
+    Works as a plain Python object and backs the PredictorService Modal class.
+    With cascade=True a fast FDI model answers first and the full one only when the
+    scan is escalated (cascade.py).
+    """
 
-    h_orig, w_orig = img_array.shape[:2]
+    def __init__(
+        self,
+        fdi_model_path=None,
+        status_model_path=None,
+        status_batch_size=STATUS_BATCH_SIZE,
+        cache=None,
+        backend="torch",
+        threads=None,
+        status_precision=STATUS_PRECISION,
+        warmup=True,
+        crop_engine="polygon",
+        cascade=False,
+        fast_fdi_model_path=FDI_FAST_MODEL_PATH,
+        cascade_bounds=None,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}. Expected one of {BACKENDS}.")
+        if backend == "onnx" and status_precision != "fp32":
+            raise ValueError("status_precision applies to the torch backend only.")
+        if crop_engine not in CROP_ENGINES:
+            raise ValueError(f"Unknown crop_engine: {crop_engine}. Expected one of {CROP_ENGINES}.")
+        if backend == "onnx" and crop_engine != "polygon":
+            raise ValueError("crop_engine='device' needs the torch backend (YOLO mask tensors).")
+        if backend == "onnx" and cascade:
+            raise ValueError("cascade needs the torch backend.")
+        if fdi_model_path is None:
+            if backend == "onnx":
+                fdi_model_path = FDI_ONNX_PATH
+            else:
+                fdi_model_path = FDI_MODEL_PATH if os.path.exists(FDI_MODEL_PATH) else "yolo11x-seg.pt"
+        if status_model_path is None:
+            status_model_path = STATUS_ONNX_PATH if backend == "onnx" else STATUS_MODEL_PATH
+        self.fdi_model_path = fdi_model_path
+        self.status_model_path = status_model_path
+        self.status_batch_size = status_batch_size
+        self.cache = cache
+        self.backend = backend
+        self.threads = threads
+        self.status_precision = status_precision
+        self.crop_engine = crop_engine
+        self.cascade = cascade
+        self.fast_fdi_model_path = fast_fdi_model_path
+        self.cascade_bounds = None
+        self.fast_fdi_model = None
+        if cascade:
+            from cascade import resolve_bounds
+            self.cascade_bounds = resolve_bounds(cascade_bounds)
+        self.fdi_model = None
+        self.status_model = None
+        self.status_transform = None
+        self.load_stats = {}
+        self.latency = LatencyRecorder()
+        self._published_requests = 0
+
+        self._load()
+        if warmup:
+            self._warmup()
+
+        print(
+            f"Predictor ready ({backend}): load {self.load_stats['load_s']:.2f}s, "
+            f"warmup {self.load_stats.get('warmup_s', 0.0):.2f}s"
+        )
+
+    def _load(self):
+        import time
+        from result_cache import model_version
+
+        t0 = time.perf_counter()
+        if self.backend == "onnx":
+            from onnx_backend import OnnxSegmenter, OnnxStatusClassifier
+
+            self.fdi_model = OnnxSegmenter(self.fdi_model_path, self.threads)
+            t1 = time.perf_counter()
+            if os.path.exists(self.status_model_path):
+                self.status_model = OnnxStatusClassifier(self.status_model_path, STATUS_MEAN, STATUS_STD, self.threads)
+        else:
+            from ultralytics import YOLO
+
+            if self.threads:
+                import torch
+                torch.set_num_threads(self.threads)
+            self.fdi_model = YOLO(self.fdi_model_path)
+            if self.cascade:
+                self.fast_fdi_model = YOLO(self.fast_fdi_model_path)
+            t1 = time.perf_counter()
+            self.status_model = _load_status_classifier(self.status_model_path, self.status_precision)
+            self.status_transform = _status_transform()
+            if self.crop_engine == "device" and self.status_model is not None and self.status_precision == "fp32":
+                import torch
+                if torch.cuda.is_available():
+                    # Device crops never leave the GPU, so the classifier runs there too
+                    self.status_model.to("cuda")
+        t2 = time.perf_counter()
+
+        self.load_stats["fdi_model_load_s"] = t1 - t0
+        self.load_stats["status_model_load_s"] = t2 - t1
+        self.load_stats["load_s"] = t2 - t0
+        self.model_version = model_version(self.fdi_model_path, self.status_model_path)
+        if self.status_precision != "fp32":
+            self.model_version += f"-{self.status_precision}"
+        if self.crop_engine != "polygon":
+            self.model_version += f"-{self.crop_engine}-crops"
+        if self.cascade:
+            bounds = ",".join(f"{self.cascade_bounds[k]}" for k in sorted(self.cascade_bounds))
+            self.model_version += f"-cascade-{model_version(self.fast_fdi_model_path)}-{bounds}"
+
+    def _warmup(self):
+        """Run one dummy pass through both networks to trigger lazy initialization."""
+        import time
+        import numpy as np
+
+        t0 = time.perf_counter()
+        dummy = np.zeros((FDI_IMGSZ, FDI_IMGSZ, 3), dtype=np.uint8)
+        self.fdi_model.predict(dummy, conf=FDI_CONF, verbose=False, imgsz=FDI_IMGSZ)
+        if self.fast_fdi_model is not None:
+            self.fast_fdi_model.predict(dummy, conf=FDI_CONF, verbose=False, imgsz=FDI_IMGSZ)
+        _predict_status_batch([np.zeros((224, 224, 3), dtype=np.uint8)], self.status_model)
+        self.load_stats["warmup_s"] = time.perf_counter() - t0
+
+    def _cache_key(self, img_array, use_heuristic):
+        from image_io import IngestedImage
+        from result_cache import cache_key
+        if isinstance(img_array, IngestedImage):
+            # YOLO saw the reduced copy, so results can differ from a full-resolution array
+            return cache_key(img_array.full, f"{self.model_version}|reduced", use_heuristic)
+        return cache_key(img_array, self.model_version, use_heuristic)
+
+    def predict(self, img_array, use_heuristic=True, debug=False, timer=None):
+        """
+        Predict one image. Without a `timer` the request is timed and recorded here; a
+        caller that passes its own timer (to add decode/serialization) records it itself.
+        With debug=True the stage timings are added to the result under "timings".
+        """
+        own_timer = timer is None
+        timer = timer or StageTimer()
+        if self.cache is None:
+            result = _run_prediction_core(img_array, use_heuristic=use_heuristic, predictor=self, timer=timer)
+        else:
+            key = self._cache_key(img_array, use_heuristic)
+            result, tier = self.cache.get(key)
+            if result is None:
+                result = _run_prediction_core(img_array, use_heuristic=use_heuristic, predictor=self, timer=timer)
+                self.cache.put(key, result)
+            else:
+                timer.count("cache_hits")
+            result["cache"] = {"hit": tier is not None, "tier": tier}
+
+        if own_timer:
+            self.record(timer)
+        if debug:
+            result["timings"] = timer.as_dict()
+        return result
+
+    def predict_batch(self, images, use_heuristic=True, batch_size=IMAGE_BATCH_SIZE, debug=False, timer=None):
+        """Predict several images; timings cover the whole batch (see predict)."""
+        own_timer = timer is None
+        timer = timer or StageTimer()
+        if self.cache is None:
+            outputs = _run_batch_prediction_core(
+                images, use_heuristic=use_heuristic, predictor=self, batch_size=batch_size, timer=timer
+            )
+        else:
+            keys = [self._cache_key(img, use_heuristic) for img in images]
+            lookups = [self.cache.get(key) for key in keys]
+            misses = [idx for idx, (result, _) in enumerate(lookups) if result is None]
+            timer.count("cache_hits", len(images) - len(misses))
+
+            computed = _run_batch_prediction_core(
+                [images[idx] for idx in misses], use_heuristic=use_heuristic, predictor=self,
+                batch_size=batch_size, timer=timer,
+            )
+            for idx, result in zip(misses, computed):
+                self.cache.put(keys[idx], result)
+                lookups[idx] = (result, None)
+
+            outputs = []
+            for result, tier in lookups:
+                result["cache"] = {"hit": tier is not None, "tier": tier}
+                outputs.append(result)
+
+        if own_timer:
+            self.record(timer)
+        if debug:
+            timings = timer.as_dict()
+            for result in outputs:
+                result["timings"] = timings
+        return outputs
+
+    def reinfer(self, teeth, image=None, use_heuristic=True, debug=False, timer=None):
+        """
+        Re-run the status classifier for the edited teeth and the FDI heuristic for the
+        chart (edits.py); `image` is the full-resolution scan, or a callable returning it
+        that is only called when a tooth needs a new crop. Raises ValueError for
+        malformed teeth. Edited charts are not cached.
+        """
+        own_timer = timer is None
+        timer = timer or StageTimer()
+        result = _reinfer_core(teeth, image, predictor=self, use_heuristic=use_heuristic, timer=timer)
+        if own_timer:
+            self.record(timer)
+        if debug:
+            result["timings"] = timer.as_dict()
+        return result
+
+    def record(self, timer):
+        """Add a finished request to the rolling latency windows."""
+        self.latency.observe(timer)
+
+    def start_metrics_publisher(self, store, key, interval_s=METRICS_PUBLISH_INTERVAL_S):
+        """
+        Copy the latency snapshot to a shared modal.Dict every `interval_s` seconds from a
+        daemon thread, so the metrics endpoint can merge all containers without a request
+        ever waiting on the Dict.
+        """
+        import threading
+        import time
+
+        def publish():
+            while True:
+                time.sleep(interval_s)
+                snapshot = self.latency.snapshot()
+                requests = snapshot["counters"].get("requests", 0)
+                if requests == self._published_requests:
+                    continue
+                try:
+                    store.put(key, snapshot)
+                    self._published_requests = requests
+                except Exception as e:
+                    print(f"Could not publish latency metrics: {e}")
+
+        threading.Thread(target=publish, daemon=True, name="metrics-publisher").start()
+
+
+_PREDICTORS = {}
+_CACHE_MAINTENANCE = None
+
+
+def _disk_stores():
+    """Stores with a disk tier on the volume in this container."""
+    stores = [p.cache for p in _PREDICTORS.values() if p.cache is not None]
+    if _UPLOAD_STORE is not None:
+        stores.append(_UPLOAD_STORE)
+    return stores
+
+
+def _start_cache_maintenance(interval_s=CACHE_MAINTENANCE_INTERVAL_S):
+    """
+    Every `interval_s` seconds, from a daemon thread: bound the disk tiers (prune_disk),
+    commit this container's cache writes to the volume and reload it, so containers see
+    each other's entries.
+    """
+    import threading
+    import time
+
+    global _CACHE_MAINTENANCE
+    if _CACHE_MAINTENANCE is not None:
+        return
+
+    def maintain():
+        while True:
+            time.sleep(interval_s)
+            try:
+                for store in _disk_stores():
+                    store.prune_disk()
+                volume.commit()
+                volume.reload()
+            except Exception as e:
+                print(f"Cache maintenance failed: {e}")
+
+    _CACHE_MAINTENANCE = threading.Thread(target=maintain, daemon=True, name="cache-maintenance")
+    _CACHE_MAINTENANCE.start()
+
+
+def get_predictor(backend="torch", threads=None):
+    """Return the per-container predictor for a backend, loading it on first use."""
+    if backend not in _PREDICTORS:
+        from result_cache import ResultCache
+        predictor = DentalPredictor(
+            cache=ResultCache(disk_dir=RESULT_CACHE_DIR), backend=backend, threads=threads,
+            cascade=FDI_CASCADE and backend == "torch",
+        )
+        container = os.environ.get("MODAL_TASK_ID", f"local-{os.getpid()}")
+        predictor.start_metrics_publisher(metrics_store, f"{container}:{backend}")
+        _PREDICTORS[backend] = predictor
+        _start_cache_maintenance()
+    return _PREDICTORS[backend]
+
+
+def _model_inputs(image):
+    """(YOLO input, full-resolution image for crops, (sx, sy) from YOLO input to original coordinates)."""
+    from image_io import IngestedImage
+    if isinstance(image, IngestedImage):
+        return image.inference, image.full, image.scale
+    return image, image, (1.0, 1.0)
+
+
+def _device_crops(result, img_array, scale):
+    """Masked crops of all teeth from YOLO's mask tensor (mask_crops.py); tensors, None for empty windows."""
+    import torch
+    from mask_crops import mask_transform, masked_crops
 
-    # 1. Load FDI segmentation model
-    model_path = FDI_MODEL_PATH if os.path.exists(FDI_MODEL_PATH) else "yolo11x-seg.pt"
-    model = YOLO(model_path)
-    status_model = _load_status_classifier()
+    masks = result.masks.data
+    boxes = result.boxes.xyxy.to(masks.device).float() * torch.tensor(scale * 2, device=masks.device)
+    image = torch.from_numpy(img_array).to(masks.device)
+    transform = mask_transform(masks.shape[1:], result.orig_shape, scale)
+    crops, valid = masked_crops(image, masks, boxes, transform)
+    return [crop if ok else None for crop, ok in zip(crops, valid.tolist())]
 
-    # 2. Run segmentation
-    results = model.predict(img_array, conf=0.25, verbose=False, imgsz=640)
-    result = results[0]
 
+def _result_crops(result, img_array, timer=None, scale=(1.0, 1.0), crop_engine="polygon"):
+    """Masked status crops of one YOLO result (None for empty windows), timed as crop_extraction."""
     if result.boxes is None or len(result.boxes) == 0:
-        return {"teeth": [], "count": 0}
+        return []
+    timer = timer or StageTimer()
+    with timer.measure("crop_extraction"):
+        if crop_engine == "device" and result.masks is not None:
+            return _device_crops(result, img_array, scale)
+        masks = result.masks.xy if result.masks is not None else []
+        if scale != (1.0, 1.0):
+            masks = [mask * scale for mask in masks]
+        return [_masked_crop_from_points(img_array, mask) for mask in masks]
+
 
+def _detections_from_result(result, img_array, timer=None, scale=(1.0, 1.0), crop_engine="polygon", with_crops=True):
+    """
+    Convert one YOLO result into detection dicts and their masked status crops.
+    `scale` maps the coordinates of the image YOLO saw to `img_array`. With
+    with_crops=False the crops are left for _result_crops (an empty list is returned).
+    """
     detections = []
+    crops = []
+
+    if result.boxes is None or len(result.boxes) == 0:
+        return detections, crops
+
+    timer = timer or StageTimer()
     boxes = result.boxes
-    masks = result.masks.xy if result.masks is not None else []
+    with timer.measure("mask_to_contour"):
+        masks = result.masks.xy if result.masks is not None else []
+        if scale != (1.0, 1.0):
+            masks = [mask * scale for mask in masks]
+        contours = [[[float(p[0]), float(p[1])] for p in mask] for mask in masks]
+
+    # Masked crops for status
+    if with_crops:
+        crops = _result_crops(result, img_array, timer, scale, crop_engine)
 
-    for i, mask in enumerate(masks):
+    for i, contour in enumerate(contours):
         cls_id = int(boxes.cls[i].item())
         conf = float(boxes.conf[i].item())
         fdi_label = FDI_LABELS[cls_id] if 0 <= cls_id < len(FDI_LABELS) else "unknown"
 
         bx1, by1, bx2, by2 = boxes.xyxy[i]
         bbox = [
-            float(bx1.item()),
-            float(by1.item()),
-            float(bx2.item()),
-            float(by2.item()),
+            float(bx1.item()) * scale[0],
+            float(by1.item()) * scale[1],
+            float(bx2.item()) * scale[0],
+            float(by2.item()) * scale[1],
         ]
 
-        contour = [[float(p[0]), float(p[1])] for p in mask]
-
-        # Masked crop for status
-        crop = _masked_crop_from_points(img_array, mask)
-        status = _predict_status(crop, status_model)
-
         detections.append({
             "fdi": fdi_label,
             "confidence_fdi": conf,
             "bbox": bbox,
             "contour": contour,
-            "status": status,
         })
 
+    return detections, crops
+
+
+def _finalize_detections(detections, statuses, img_shape, use_heuristic, timer=None):
+    """Attach status predictions, run the FDI heuristic and build the response."""
+    timer = timer or StageTimer()
+    if not detections:
+        timer.add_scan(teeth=0)
+        return {"teeth": [], "count": 0}
+
+    for det, status in zip(detections, statuses):
+        det["status"] = status
+
     if use_heuristic:
-        detections = _apply_fdi_heuristic(detections, h_orig, w_orig)
+        h_orig, w_orig = img_shape[:2]
+        with timer.measure("heuristic"):
+            detections = _apply_fdi_heuristic(detections, h_orig, w_orig)
 
+    corrections = sum(1 for det in detections if det.get("corrected_by_heuristic"))
+    timer.add_scan(teeth=len(detections), heuristic_corrections=corrections)
     return {"teeth": detections, "count": len(detections)}
 
 
+def _cascade_gate(detections, img_shape, use_heuristic, bounds, timer):
+    """Scan summary of the fast tier's detections (after the heuristic, on copies) and its escalation reasons."""
+    from cascade import escalation_reasons, scan_summary
+
+    with timer.measure("cascade_gate"):
+        gated = [dict(det) for det in detections]
+        if use_heuristic and gated:
+            gated = _apply_fdi_heuristic(gated, *img_shape[:2])
+        summary = scan_summary(gated)
+    return summary, escalation_reasons(summary, bounds)
+
+
+def _letterbox_size(shape, imgsz=FDI_IMGSZ):
+    """(width, height) YOLO's letterbox resizes an image of `shape` to, before padding."""
+    h, w = shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    return round(w * r), round(h * r)
+
+
+def _shared_letterbox_inputs(inputs):
+    """
+    _model_inputs tuples where YOLO images of different sizes but the same letterbox
+    size (e.g. 3000x1500 and 2400x1200 scans) are resized to it up front, with the
+    letterbox's own interpolation, so _segment_batch can put them in one call; `scale`
+    includes the resize. Images with a different aspect ratio still get calls of their own.
+    """
+    import cv2
+
+    shapes = {}
+    for yolo_input, _, _ in inputs:
+        shapes.setdefault(_letterbox_size(yolo_input.shape), set()).add(yolo_input.shape)
+
+    shared = []
+    for yolo_input, full_image, scale in inputs:
+        size = _letterbox_size(yolo_input.shape)
+        h, w = yolo_input.shape[:2]
+        if len(shapes[size]) > 1 and (w, h) != size:
+            yolo_input = cv2.resize(yolo_input, size, interpolation=cv2.INTER_LINEAR)
+            scale = (scale[0] * w / size[0], scale[1] * h / size[1])
+        shared.append((yolo_input, full_image, scale))
+    return shared
+
+
+def _segment_batch(model, inputs, indices, batch_size, timer):
+    """
+    YOLO results for inputs[idx] (_model_inputs tuples), as {idx: result}. Images of the
+    same size are batched together so YOLO keeps the minimal rectangular letterbox
+    instead of padding every image to a square (see _shared_letterbox_inputs).
+    """
+    by_shape = {}
+    for idx in indices:
+        by_shape.setdefault(inputs[idx][0].shape, []).append(idx)
+
+    results = {}
+    for group in by_shape.values():
+        for start in range(0, len(group), batch_size):
+            chunk = group[start:start + batch_size]
+            with timer.measure("yolo_predict"):
+                outputs = model.predict([inputs[idx][0] for idx in chunk], conf=FDI_CONF, verbose=False, imgsz=FDI_IMGSZ)
+            results.update(zip(chunk, outputs))
+    return results
+
+
+def _segment_images(
+    images, inputs, predictor, use_heuristic=True, batch_size=IMAGE_BATCH_SIZE, timer=None, with_crops=True
+):
+    """
+    Segment images into (YOLO result, detections, crops, cascade info) per image, in
+    input order. Without cascade the info is None. In cascade mode the fast model
+    segments every image and the full model re-segments only the escalated ones; the
+    result and crops are those of the tier that answers. With with_crops=False the
+    crops are left for _result_crops.
+    """
+    timer = timer or StageTimer()
+    indices = range(len(images))
+    if len(inputs) > 1:
+        inputs = _shared_letterbox_inputs(inputs)
+    if not predictor.cascade:
+        results = _segment_batch(predictor.fdi_model, inputs, indices, batch_size, timer)
+        segmented = []
+        for idx in indices:
+            _, full_image, scale = inputs[idx]
+            detections, crops = _detections_from_result(
+                results[idx], full_image, timer, scale, predictor.crop_engine, with_crops
+            )
+            segmented.append((results[idx], detections, crops, None))
+        return segmented
+
+    results = _segment_batch(predictor.fast_fdi_model, inputs, indices, batch_size, timer)
+    detections, infos = {}, {}
+    for idx in indices:
+        _, full_image, scale = inputs[idx]
+        detections[idx], _ = _detections_from_result(results[idx], full_image, timer, scale, with_crops=False)
+        summary, reasons = _cascade_gate(detections[idx], images[idx].shape, use_heuristic,
+                                         predictor.cascade_bounds, timer)
+        infos[idx] = {"tier": "full" if reasons else "fast", "reasons": reasons, "fast": summary}
+
+    escalated = [idx for idx in indices if infos[idx]["tier"] == "full"]
+    timer.count("cascade_escalations", len(escalated))
+    if escalated:
+        full_results = _segment_batch(predictor.fdi_model, inputs, escalated, batch_size, timer)
+        for idx in escalated:
+            _, full_image, scale = inputs[idx]
+            results[idx] = full_results[idx]
+            detections[idx], _ = _detections_from_result(results[idx], full_image, timer, scale, with_crops=False)
+
+    segmented = []
+    for idx in indices:
+        _, full_image, scale = inputs[idx]
+        crops = _result_crops(results[idx], full_image, timer, scale, predictor.crop_engine) if with_crops else []
+        segmented.append((results[idx], detections[idx], crops, infos[idx]))
+    return segmented
+
+
+def _finalize_with_tier(detections, statuses, img_shape, use_heuristic, timer, cascade_info):
+    result = _finalize_detections(detections, statuses, img_shape, use_heuristic, timer)
+    if cascade_info is not None:
+        result["cascade"] = cascade_info
+    return result
+
+
+def _run_prediction_core(img_array, use_heuristic=True, predictor=None, timer=None):
+    """Internal prediction logic."""
+    timer = timer or StageTimer()
+
+    # 1. Reuse the loaded models
+    if predictor is None:
+        with timer.measure("model_load"):
+            predictor = get_predictor()
+
+    # 2. Run segmentation (fast tier first in cascade mode)
+    [(_, detections, crops, cascade_info)] = _segment_images(
+        [img_array], [_model_inputs(img_array)], predictor, use_heuristic, timer=timer
+    )
+
+    # 3. Classify the status of all teeth in one batch
+    with timer.measure("status_classification"):
+        statuses = _predict_status_batch(crops, predictor.status_model, predictor.status_batch_size)
+
+    return _finalize_with_tier(detections, statuses, img_array.shape, use_heuristic, timer, cascade_info)
+
+
+def _run_batch_prediction_core(
+    images, use_heuristic=True, predictor=None, batch_size=IMAGE_BATCH_SIZE, timer=None
+):
+    """
+    Predict several images at once.
+    YOLO runs on up to `batch_size` images per call. Images share a call when they
+    letterbox to the same size (same aspect ratio); other sizes get calls of their own.
+    The status crops of all images are pooled into shared classifier batches.
+    Returns one result per input image, in input order.
+    """
+    timer = timer or StageTimer()
+    if predictor is None:
+        with timer.measure("model_load"):
+            predictor = get_predictor()
+
+    # 1. Segmentation in image batches
+    inputs = [_model_inputs(image) for image in images]
+    per_image = _segment_images(images, inputs, predictor, use_heuristic, batch_size, timer)
+
+    # 2. Status classification over the pooled crops
+    pooled_crops = [crop for _, _, crops, _ in per_image for crop in crops]
+    with timer.measure("status_classification"):
+        statuses = _predict_status_batch(pooled_crops, predictor.status_model, predictor.status_batch_size)
+
+    # 3. Split statuses back per image and finalize
+    outputs = []
+    offset = 0
+    for img_array, (_, detections, crops, cascade_info) in zip(images, per_image):
+        image_statuses = statuses[offset:offset + len(crops)]
+        offset += len(crops)
+        outputs.append(_finalize_with_tier(detections, image_statuses, img_array.shape, use_heuristic, timer,
+                                           cascade_info))
+
+    return outputs
+
+
+# ==============================================================================
+# CLINICIAN EDITS
+# ==============================================================================
+# A clinician's corrections to a chart are merged without running YOLO again: only
+# reshaped or added teeth get a new crop and status, clinician labels are locked, and
+# the FDI heuristic renumbers the rest (edits.py). The scan is looked up by the
+# X-Image-Id that api_predict returned, so an edit does not upload it again. Uploads
+# reach the volume only with ?keep=1, and the cache maintenance thread bounds them.
+
+UPLOAD_DIR = f"{DATA_DIR}/cache/uploads"
+
+_UPLOAD_STORE = None
+
+
+def get_upload_store():
+    """Return the per-container UploadStore behind X-Image-Id."""
+    global _UPLOAD_STORE
+    if _UPLOAD_STORE is None:
+        from edits import UploadStore
+        _UPLOAD_STORE = UploadStore(disk_dir=UPLOAD_DIR)
+        _start_cache_maintenance()
+    return _UPLOAD_STORE
+
+
+def _reinfer_core(teeth, image=None, predictor=None, use_heuristic=True, timer=None):
+    """Internal re-inference logic; see DentalPredictor.reinfer."""
+    import numpy as np
+    from edits import prepare_edits, teeth_extent
+
+    timer = timer or StageTimer()
+    teeth, reclassify, locked = prepare_edits(teeth)
+    timer.count("reinferences")
+
+    if reclassify:
+        if callable(image):
+            image = image()
+        if image is None:
+            raise ValueError("Edited contours need the image to classify the teeth.")
+        image = getattr(image, "full", image)
+        if predictor is None:
+            with timer.measure("model_load"):
+                predictor = get_predictor()
+
+        with timer.measure("crop_extraction"):
+            crops = [
+                _masked_crop_from_points(image, np.asarray(teeth[i]["contour"], dtype=np.float32))
+                for i in reclassify
+            ]
+        with timer.measure("status_classification"):
+            statuses = _predict_status_batch(crops, predictor.status_model, predictor.status_batch_size)
+        for i, status in zip(reclassify, statuses):
+            teeth[i]["status"] = status
+        timer.count("reclassified_teeth", len(reclassify))
+
+    if use_heuristic and teeth:
+        img_shape = image.shape if image is not None and not callable(image) else teeth_extent(teeth)
+        with timer.measure("heuristic"):
+            teeth = _apply_fdi_heuristic(teeth, *img_shape[:2])
+
+    corrections = sum(1 for tooth in teeth if tooth.get("corrected_by_heuristic"))
+    timer.count("heuristic_corrections", corrections)
+    return {
+        "teeth": teeth,
+        "count": len(teeth),
+        "reinference": {"reclassified": len(reclassify), "locked": locked, "heuristic_corrections": corrections},
+    }
+
+
+# ==============================================================================
+# PIPELINED PREDICTION
+# ==============================================================================
+# For streams of files (archive backfills), the prediction of one image is split into
+# decode -> segmentation -> crops -> status + heuristic stages that run on their own
+# threads (pipeline.py), so YOLO segments the next image while the classifier and the
+# heuristic finish the previous one and the decoder reads ahead. Each image keeps its
+# own StageTimer and is recorded like a single request.
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+PIPELINE_DECODE_WORKERS = 2
+
+
+def _list_images(directory):
+    """Image files directly inside `directory`, sorted by name."""
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(directory, name))
+    ]
+
+
+def _prediction_pipeline(predictor, use_heuristic=True, debug=False, decode_workers=PIPELINE_DECODE_WORKERS,
+                         queue_size=None):
+    """
+    Pipeline (pipeline.py) from image paths to results, in input order. A cached
+    result skips the model stages. Outputs are result dicts, or StageFailure when a
+    file could not be read or decoded.
+    """
+    from pipeline import PIPELINE_QUEUE_SIZE, Pipeline, Stage
+
+    def decode(path):
+        timer = StageTimer()
+        with open(path, "rb") as f:
+            data = f.read()
+        image = _decode_image(data, timer)
+        if image is None:
+            raise ValueError(f"Could not decode image: {path}")
+        item = {"image": image, "timer": timer, "result": None, "key": None}
+        if predictor.cache is not None:
+            item["key"] = predictor._cache_key(image, use_heuristic)
+            result, tier = predictor.cache.get(item["key"])
+            if result is not None:
+                timer.count("cache_hits")
+                result["cache"] = {"hit": True, "tier": tier}
+                item["result"] = result
+        return item
+
+    def segment(item):
+        if item["result"] is None:
+            item["inputs"] = _model_inputs(item["image"])
+            [(item["yolo"], item["detections"], _, item["cascade"])] = _segment_images(
+                [item["image"]], [item["inputs"]], predictor, use_heuristic, timer=item["timer"], with_crops=False
+            )
+        return item
+
+    def crops(item):
+        if item["result"] is None:
+            _, full_image, scale = item["inputs"]
+            item["crops"] = _result_crops(item.pop("yolo"), full_image, item["timer"], scale, predictor.crop_engine)
+        return item
+
+    def status(item):
+        timer = item["timer"]
+        result = item["result"]
+        if result is None:
+            with timer.measure("status_classification"):
+                statuses = _predict_status_batch(item["crops"], predictor.status_model, predictor.status_batch_size)
+            result = _finalize_with_tier(
+                item["detections"], statuses, item["image"].shape, use_heuristic, timer, item["cascade"]
+            )
+            if predictor.cache is not None:
+                predictor.cache.put(item["key"], result)
+                result["cache"] = {"hit": False, "tier": None}
+        predictor.record(timer)
+        if debug:
+            result["timings"] = _debug_timings(timer, item["image"])
+        return result
+
+    return Pipeline(
+        [
+            Stage("decode", decode, workers=decode_workers),
+            Stage("segmentation", segment),
+            Stage("crops", crops),
+            Stage("status", status),
+        ],
+        queue_size=queue_size or PIPELINE_QUEUE_SIZE,
+    )
+
+
 @app.function(
     image=dental_image,
     volumes={"/data": volume},
     gpu="T4"
 )
-def run_prediction(img_array):
+def run_prediction(img_array, debug: bool = False):
     """Modal wrapper for prediction logic."""
     import numpy as np
-    return _run_prediction_core(np.asarray(img_array))
+    return get_predictor().predict(np.asarray(img_array), debug=debug)
+
+
+@app.function(image=dental_image, volumes={"/data": volume}, cpu=4)
+def run_prediction_cpu(img_array, threads: int = 4, debug: bool = False):
+    """CPU-only prediction on ONNX Runtime (run export_onnx.py first)."""
+    import numpy as np
+    return get_predictor("onnx", threads).predict(np.asarray(img_array), debug=debug)
+
+
+@app.function(image=dental_image, volumes={"/data": volume}, gpu="T4")
+def run_batch_prediction(
+    img_arrays, use_heuristic: bool = True, batch_size: int = IMAGE_BATCH_SIZE, debug: bool = False
+):
+    """Modal wrapper for multi-image prediction; returns one result per image, in order."""
+    import numpy as np
+    images = [np.asarray(img) for img in img_arrays]
+    return get_predictor().predict_batch(images, use_heuristic=use_heuristic, batch_size=batch_size, debug=debug)
+
+
+@app.cls(image=dental_image, volumes={"/data": volume}, gpu="T4")
+class PredictorService:
+    """Modal class that loads and warms both models when the container starts."""
+
+    @modal.enter()
+    def load(self):
+        self.predictor = get_predictor()
+
+    @modal.method()
+    def predict(self, img_array, use_heuristic: bool = True, debug: bool = False):
+        import numpy as np
+        return self.predictor.predict(np.asarray(img_array), use_heuristic=use_heuristic, debug=debug)
+
+    @modal.method()
+    def predict_batch(
+        self, img_arrays, use_heuristic: bool = True, batch_size: int = IMAGE_BATCH_SIZE, debug: bool = False
+    ):
+        import numpy as np
+        images = [np.asarray(img) for img in img_arrays]
+        return self.predictor.predict_batch(images, use_heuristic=use_heuristic, batch_size=batch_size, debug=debug)
+
+    @modal.method()
+    def load_stats(self):
+        """Cold-start timings (model load and warmup, in seconds)."""
+        return dict(self.predictor.load_stats)
+
+    @modal.method()
+    def cache_stats(self):
+        """Result cache hit/miss counters and hit ratio."""
+        return self.predictor.cache.stats() if self.predictor.cache else {}
+
+    @modal.method()
+    def latency_stats(self):
+        """Rolling p50/p95/p99 per stage (seconds), teeth per scan and counters of this container."""
+        from latency_metrics import summarize
+        snapshot = self.predictor.latency.snapshot()
+        return {"summary": summarize(snapshot), "counters": snapshot["counters"]}
 
 
 from fastapi import Request
 
+# Modal may route more inputs to a container than the gate accepts; the excess
+# gets a fast 429 instead of waiting behind a slow scan.
+API_CONCURRENT_INPUTS = 32
+
+_GATE = None
+
+
+def get_gate():
+    """Return the per-container InferenceGate used by the async endpoints."""
+    global _GATE
+    if _GATE is None:
+        from serving import InferenceGate
+        _GATE = InferenceGate()
+    return _GATE
+
+
+def _decode_image(image_data, timer=None):
+    """
+    Decode an upload. With REDUCED_DECODE this is an IngestedImage (image_io.py):
+    grayscale files stay single-channel and YOLO runs on a reduced copy.
+    """
+    import cv2
+    import numpy as np
+    from image_io import decode_image
+    timer = timer or StageTimer()
+    with timer.measure("decode"):
+        if REDUCED_DECODE:
+            return decode_image(image_data, FDI_IMGSZ)
+        nparr = np.frombuffer(image_data, np.uint8)
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def _decode_upload(image_data, timer, name="Upload"):
+    """_decode_image for the endpoints: undecodable bytes are the client's error (400)."""
+    from fastapi import HTTPException
+    image = _decode_image(image_data, timer)
+    if image is None:
+        raise HTTPException(status_code=400, detail=f"{name} could not be decoded as an image.")
+    return image
+
+
+def _debug_timings(timer, image):
+    timings = timer.as_dict()
+    if getattr(image, "stats", None):
+        timings["image"] = image.stats
+    return timings
+
+
+def _debug_requested(params):
+    return params.get("debug", "0").lower() not in ("0", "false", "no")
+
+
+def _keep_requested(params):
+    return params.get("keep", "0").lower() not in ("0", "false", "no")
+
 
 @app.function(image=dental_image, volumes={"/data": volume}, gpu="T4")
+@modal.concurrent(max_inputs=API_CONCURRENT_INPUTS)
 @modal.fastapi_endpoint(method="POST")
 async def api_predict(request: Request):
     """
     API route: send image as binary body and receive JSON.
+    Decode and inference run off the event loop; returns 400 for an undecodable image,
+    429 when saturated, 504 on timeout.
+    Optional query parameters select a compact wire format (see wire_format.py), e.g.
+    ?format=binary&scale=1&simplify=0.5&masks=rle. The X-Payload-Bytes header reports the body size.
+    With ?debug=1 the per-stage timings (latency_metrics.py) come back in the X-Stage-Timings header,
+    and X-Json-Bytes reports the size of the default JSON for comparison.
+    The X-Image-Id header names the upload for later edits (api_reinfer); the scan stays
+    in this container's memory, and with ?keep=1 also on the volume for all containers.
     """
-    import cv2
-    import numpy as np
+    import json
+
+    from edits import upload_id
+    from fastapi import HTTPException, Response
+    from wire_format import encode_response, wire_options_from_query
+
+    try:
+        fmt, options = wire_options_from_query(request.query_params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    debug = _debug_requested(request.query_params)
+    timer = StageTimer()
+    decoded = {}
+
+    def infer(img):
+        decoded["image"] = img
+        with timer.measure("model_load"):
+            predictor = get_predictor()
+        result = predictor.predict(img, timer=timer)
+        with timer.measure("serialization"):
+            encoded = encode_response(result, img.shape, fmt, json_size=debug, **options)
+        predictor.record(timer)
+        get_upload_store().put(image_id, getattr(img, "full", img), image_data if keep else None)
+        return encoded
+
     image_data = await request.body()
-    nparr = np.frombuffer(image_data, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    return _run_prediction_core(img)
+    image_id = upload_id(image_data)
+    keep = _keep_requested(request.query_params)
+    body, media_type, report = await get_gate().run(lambda: _decode_upload(image_data, timer), infer)
+    headers = {"X-Payload-Bytes": str(report["payload_bytes"]), "X-Image-Id": image_id}
+    if debug:
+        headers["X-Json-Bytes"] = str(report["json_bytes"])
+        timings = _debug_timings(timer, decoded.get("image"))
+        headers["X-Stage-Timings"] = json.dumps(timings, separators=(",", ":"))
+    return Response(content=body, media_type=media_type, headers=headers)
 
 
 @app.function(image=dental_image, volumes={"/data": volume}, gpu="T4")
-def predict_cli(image_path: str):
-    """Command-line prediction function."""
-    import cv2
+@modal.concurrent(max_inputs=API_CONCURRENT_INPUTS)
+@modal.fastapi_endpoint(method="POST")
+async def api_predict_batch(request: Request):
+    """
+    API route: send several images as multipart form files (field "images")
+    and receive one result per image, in upload order, with the image ids for api_reinfer.
+    ?keep=1 keeps the uploads on the volume (see api_predict); ?debug=1 adds the batch's
+    stage timings.
+    """
+    from edits import upload_id
+
+    form = await request.form()
+    payloads = [await upload.read() for upload in form.getlist("images")]
+    image_ids = [upload_id(data) for data in payloads]
+    keep = _keep_requested(request.query_params)
+    timer = StageTimer()
+
+    def infer(images):
+        with timer.measure("model_load"):
+            predictor = get_predictor()
+        results = predictor.predict_batch(images, timer=timer)
+        predictor.record(timer)
+        store = get_upload_store()
+        for image_id, data, img in zip(image_ids, payloads, images):
+            store.put(image_id, getattr(img, "full", img), data if keep else None)
+        return results
+
+    results = await get_gate().run(
+        lambda: [_decode_upload(data, timer, f"Image {i}") for i, data in enumerate(payloads)], infer
+    )
+    response = {"results": results, "count": len(results), "image_ids": image_ids}
+    if _debug_requested(request.query_params):
+        response["timings"] = timer.as_dict()
+    return response
+
+
+@app.function(image=dental_image, volumes={"/data": volume}, gpu="T4")
+@modal.concurrent(max_inputs=API_CONCURRENT_INPUTS)
+@modal.fastapi_endpoint(method="POST")
+async def api_reinfer(request: Request):
+    """
+    API route: merge a clinician's edits into a chart without segmenting the scan again.
+    JSON body: {"image_id": X-Image-Id of the scan, or "image": base64 bytes,
+    "teeth": the edited tooth list, "use_heuristic": true}. Teeth carry "edited":
+    ["fdi"], ["contour"] or true (edits.py); only reshaped or new teeth are
+    reclassified, and the scan is only loaded for them. Returns 404 for an unknown
+    image_id and 400 for a malformed request. ?keep=1 keeps an uploaded "image" on the
+    volume (see api_predict); ?debug=1 adds the stage timings.
+    """
+    import base64
+    import binascii
+
+    from edits import is_upload_id, prepare_edits, upload_id
+    from fastapi import HTTPException
+
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON.")
+    if not isinstance(body, dict) or not isinstance(body.get("teeth"), list):
+        raise HTTPException(status_code=400, detail="Body needs a 'teeth' list.")
+    if body.get("image") is None and not is_upload_id(body.get("image_id")):
+        raise HTTPException(status_code=400, detail="Body needs an 'image' or an 'image_id' returned by api_predict.")
+    keep = _keep_requested(request.query_params)
+    timer = StageTimer()
+    request_ids = {"image_id": body.get("image_id")}
+
+    def load_image():
+        try:
+            _, reclassify, _ = prepare_edits(body["teeth"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        store = get_upload_store()
+        if body.get("image") is None:
+            if not reclassify:
+                return None
+            image = store.get(body["image_id"])
+            if image is None:
+                raise HTTPException(status_code=404, detail=f"Unknown image_id: {body['image_id']}")
+            return image
+
+        try:
+            image_data = base64.b64decode(body["image"], validate=True)
+        except (binascii.Error, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="'image' must be base64 image bytes.")
+        request_ids["image_id"] = upload_id(image_data)
+        if not reclassify:
+            store.put(request_ids["image_id"], None, image_data if keep else None)
+            return None
+        image = _decode_upload(image_data, timer, "'image'")
+        store.put(request_ids["image_id"], getattr(image, "full", image), image_data if keep else None)
+        return image
+
+    def infer(image):
+        with timer.measure("model_load"):
+            predictor = get_predictor()
+        try:
+            result = predictor.reinfer(
+                body["teeth"], image, use_heuristic=bool(body.get("use_heuristic", True)), timer=timer
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        predictor.record(timer)
+        return result
+
+    result = await get_gate().run(load_image, infer)
+    result["image_id"] = request_ids["image_id"]
+    if _debug_requested(request.query_params):
+        result["timings"] = timer.as_dict()
+    return result
+
+
+@app.function(image=dental_image)
+@modal.fastapi_endpoint(method="GET")
+def api_metrics(format: str = "prometheus"):
+    """
+    Inference latency metrics of all serving containers: rolling p50/p95/p99 per stage,
+    end-to-end latency and teeth per scan, plus counters. Prometheus text format by
+    default, ?format=json for the same numbers as JSON. Snapshots of containers that
+    have not published for METRICS_STALE_S are dropped.
+    """
+    import time
+
+    from fastapi import HTTPException, Response
+    from latency_metrics import merge_snapshots, prometheus_text, summarize
+
+    if format not in ("prometheus", "json"):
+        raise HTTPException(status_code=400, detail="format must be 'prometheus' or 'json'")
+
+    snapshots = []
+    for key, snapshot in list(metrics_store.items()):
+        if time.time() - snapshot.get("updated", 0) > METRICS_STALE_S:
+            metrics_store.pop(key, None)
+        else:
+            snapshots.append(snapshot)
+    merged = merge_snapshots(snapshots)
+
+    if format == "json":
+        return {"containers": merged["containers"], "summary": summarize(merged), "counters": merged["counters"]}
+    return Response(content=prometheus_text(merged), media_type="text/plain; version=0.0.4")
+
+
+@app.function(image=dental_image, volumes={"/data": volume}, gpu="T4")
+def predict_cli(image_path: str, debug: bool = False, output_path: str = ""):
+    """
+    Command-line prediction function. `image_path` may be a directory: its images are
+    predicted through the staged pipeline, in name order (see _predict_directory).
+    """
     if not os.path.exists(image_path):
         print(f"ERROR: File not found: {image_path}")
         return {"error": "file_not_found"}
-
-    img = cv2.imread(image_path)
-    result = _run_prediction_core(img)
+    if os.path.isdir(image_path):
+        return _predict_directory(image_path, debug=debug, output_path=output_path)
+
+    timer = StageTimer()
+    with open(image_path, "rb") as f:
+        img = _decode_image(f.read(), timer)
+    with timer.measure("model_load"):
+        predictor = get_predictor()
+    result = predictor.predict(img, timer=timer)
+    predictor.record(timer)
+    if debug:
+        result["timings"] = _debug_timings(timer, img)
     print(f"Detected: {result['count']} teeth.")
     return result
 
 
+def _predict_directory(directory, debug=False, output_path="", predictor=None):
+    """
+    Predict every image in `directory` with the staged pipeline. Results are in name
+    order. With `output_path` they are written there as JSON lines while the run
+    progresses (replacing an earlier file), and only the summary is returned; otherwise they are returned
+    under "results". Unreadable files get an "error" entry instead of stopping the run.
+    """
+    import json
+
+    paths = _list_images(directory)
+    if predictor is None:
+        predictor = get_predictor()
+    pipeline = _prediction_pipeline(predictor, debug=debug)
+
+    results = []
+    failures = 0
+    out = open(output_path, "w", encoding="utf-8") if output_path else None
+    try:
+        for index, output in pipeline.run(paths):
+            name = os.path.basename(paths[index])
+            if isinstance(output, dict):
+                entry = {"file": name, **output}
+                print(f"{name}: {output['count']} teeth")
+            else:
+                failures += 1
+                entry = {"file": name, "error": f"{output.stage}: {output.error}"}
+                print(f"ERROR {name}: {entry['error']}")
+            if out is not None:
+                out.write(json.dumps(entry) + "\n")
+                out.flush()
+            else:
+                results.append(entry)
+    finally:
+        if out is not None:
+            out.close()
+
+    stats = pipeline.stats()
+    print(f"Predicted {len(paths) - failures}/{len(paths)} images in {stats['wall_s']:.1f}s")
+    for name, stage in stats["stages"].items():
+        print(f"  {name:<13} utilization {stage['utilization']:6.1%}  queue depth mean "
+              f"{stage['queue_depth_mean']:.1f} / max {stage['queue_depth_max']}")
+    summary = {"count": len(paths), "failures": failures, "pipeline": stats}
+    if output_path:
+        summary["output_path"] = output_path
+    else:
+        summary["results"] = results
+    return summary
+
+
 @app.local_entrypoint()
 def save_detections():
     import json
@@ -0,0 +1,195 @@
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# ==============================================================================
+# INFERENCE LATENCY METRICS
+# ==============================================================================
+# Every prediction is timed per stage (StageTimer). The timings are returned in the
+# response when a request asks for debug output, and each container keeps rolling
+# windows of the last WINDOW values per stage (LatencyRecorder). Containers publish
+# snapshots of their windows to a shared modal.Dict; the metrics endpoint merges the
+# snapshots and renders p50/p95/p99 summaries and counters in Prometheus text format.
+
+STAGES = (
+    "decode",                 # image bytes -> array
+    "model_load",             # get_predictor(); only the first request of a container pays for it
+    "yolo_predict",           # letterbox, forward pass, NMS and mask upsampling
+    "mask_to_contour",        # masks -> polygon lists
+    "cascade_gate",           # cascade mode: heuristic dry run on the fast model's detections
+    "crop_extraction",        # masked status crops
+    "status_classification",
+    "heuristic",              # FDI numbering correction
+    "serialization",          # response encoding
+)
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW = 1024
+METRICS_PREFIX = "dental"
+
+
+class StageTimer:
+    """Wall time per stage and counters of one request."""
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.teeth_per_scan = []
+        self.start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] += seconds
+
+    @contextmanager
+    def measure(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def add_scan(self, teeth, heuristic_corrections=0):
+        """Count one finished scan; batch requests add one per image."""
+        self.teeth_per_scan.append(teeth)
+        self.count("scans")
+        self.count("teeth", teeth)
+        self.count("heuristic_corrections", heuristic_corrections)
+
+    def as_dict(self):
+        """Debug view: stage times in milliseconds, in pipeline order, and the counters."""
+        order = [s for s in STAGES if s in self.stages] + [s for s in self.stages if s not in STAGES]
+        return {
+            "stages_ms": {stage: 1000 * self.stages[stage] for stage in order},
+            "total_ms": 1000 * (time.perf_counter() - self.start),
+            "counters": dict(self.counters),
+        }
+
+
+def _quantile(sorted_values, q):
+    """Nearest-rank quantile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+class LatencyRecorder:
+    """
+    Thread-safe rolling windows of stage latencies (seconds) and teeth per scan,
+    plus cumulative sums/counts and counters since the container started.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _add(self, series, value):
+        self._samples[series].append(value)
+        self._sums[series] += value
+        self._counts[series] += 1
+
+    def observe(self, timer):
+        """Record one finished request."""
+        total = time.perf_counter() - timer.start
+        with self._lock:
+            for stage, seconds in timer.stages.items():
+                self._add(f"stage:{stage}", seconds)
+            self._add("request", total)
+            for teeth in timer.teeth_per_scan:
+                self._add("teeth_per_scan", teeth)
+            self._counters["requests"] += 1
+            for name, value in timer.counters.items():
+                self._counters[name] += value
+
+    def snapshot(self):
+        """Plain-dict copy of the windows, sums and counters (picklable, mergeable)."""
+        with self._lock:
+            return {
+                "samples": {series: list(values) for series, values in self._samples.items()},
+                "sums": dict(self._sums),
+                "counts": dict(self._counts),
+                "counters": dict(self._counters),
+                "updated": time.time(),
+            }
+
+
+def merge_snapshots(snapshots):
+    """Combine the snapshots of several containers into one."""
+    merged = {"samples": defaultdict(list), "sums": defaultdict(float), "counts": defaultdict(int),
+              "counters": defaultdict(int)}
+    for snap in snapshots:
+        for key in ("samples", "sums", "counts", "counters"):
+            for series, value in snap.get(key, {}).items():
+                merged[key][series] += value
+    merged = {key: dict(value) for key, value in merged.items()}
+    merged["containers"] = len(snapshots)
+    return merged
+
+
+def summarize(snapshot):
+    """{series: {"p50", "p95", "p99", "window", "count", "sum"}} from a snapshot."""
+    summary = {}
+    for series, values in snapshot["samples"].items():
+        ordered = sorted(values)
+        summary[series] = {f"p{round(q * 100)}": _quantile(ordered, q) for q in QUANTILES}
+        summary[series].update({
+            "window": len(ordered),
+            "count": snapshot["counts"].get(series, 0),
+            "sum": snapshot["sums"].get(series, 0.0),
+        })
+    return summary
+
+
+def prometheus_text(snapshot, prefix=METRICS_PREFIX):
+    """
+    Render a snapshot in the Prometheus text exposition format (version 0.0.4).
+    Quantiles cover the rolling window; _sum and _count are cumulative.
+    """
+    summary = summarize(snapshot)
+    lines = []
+
+    def emit_summary(name, help_text, series_labels):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} summary")
+        for series, labels in series_labels:
+            stats = summary[series]
+            for q in QUANTILES:
+                value = stats[f"p{round(q * 100)}"]
+                lines.append(f'{name}{{{labels}quantile="{q}"}} {value!r}')
+            base = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"{name}_sum{base} {stats['sum']!r}")
+            lines.append(f"{name}_count{base} {stats['count']}")
+
+    stages = sorted((s for s in summary if s.startswith("stage:")), key=lambda s: _stage_order(s[6:]))
+    if stages:
+        emit_summary(
+            f"{prefix}_stage_seconds",
+            "Inference latency per pipeline stage.",
+            [(s, f'stage="{s[6:]}",') for s in stages],
+        )
+    if "request" in summary:
+        emit_summary(f"{prefix}_request_seconds", "End-to-end prediction latency.", [("request", "")])
+    if "teeth_per_scan" in summary:
+        emit_summary(f"{prefix}_teeth_per_scan", "Teeth detected per scan.", [("teeth_per_scan", "")])
+
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# HELP {metric} Total {name.replace('_', ' ')} since container start.")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    if "containers" in snapshot:
+        lines.append(f"# HELP {prefix}_metrics_containers Containers included in these metrics.")
+        lines.append(f"# TYPE {prefix}_metrics_containers gauge")
+        lines.append(f"{prefix}_metrics_containers {snapshot['containers']}")
+    return "\n".join(lines) + "\n"
+
+
+def _stage_order(stage):
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
@@ -0,0 +1,104 @@
+import torch
+from torchvision.ops import roi_align
+
+from crops import CROP_SIZE
+
+# ==============================================================================
+# DEVICE-SIDE TOOTH CROPS
+# ==============================================================================
+# Alternative to crops.masked_tooth_crop for inference: instead of taking each
+# polygon to the host and rasterizing it with cv2.fillPoly, all teeth of a scan are
+# cropped in one batched roi_align over the image and one over YOLO's own mask
+# tensor (result.masks.data), on the device those tensors live on. The crop window
+# is the one crops.py uses, computed from the box instead of the polygon extents.
+# roi_align averages several samples per output pixel, close to INTER_AREA; the mask
+# is looked up nearest-neighbour at each output pixel, as fillPoly of its traced
+# contour would rasterize it. The crops stay on the
+# device and go straight to the status classifier. They agree with the polygon path
+# up to edge pixels (see benchmarks.py devicecrops). Works on CPU as well.
+
+
+def crop_windows(boxes, height, width, padding_ratio=0.15):
+    """Vectorized crops._crop_window over xyxy boxes: padded square windows clipped to the image."""
+    x1, y1, x2, y2 = boxes.unbind(1)
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    size = torch.maximum(x2 - x1, y2 - y1) * (1 + padding_ratio)
+    # int() in crops.py truncates toward zero
+    return torch.stack([
+        torch.trunc(cx - size / 2).clamp(min=0),
+        torch.trunc(cy - size / 2).clamp(min=0),
+        torch.trunc(cx + size / 2).clamp(max=width),
+        torch.trunc(cy + size / 2).clamp(max=height),
+    ], dim=1)
+
+
+def mask_transform(mask_shape, yolo_shape, scale=(1.0, 1.0)):
+    """
+    (ax, bx, ay, by) mapping original-image coordinates to mask coordinates (m = a * x + b).
+    Masks are in YOLO's letterboxed input of `mask_shape`; `yolo_shape` is the image YOLO
+    was given and `scale` maps its coordinates to the original image (image_io.py).
+    Same letterbox arithmetic as ultralytics.utils.ops.scale_boxes.
+    """
+    mh, mw = mask_shape
+    h0, w0 = yolo_shape
+    gain = min(mh / h0, mw / w0)
+    new_h, new_w = round(h0 * gain), round(w0 * gain)
+    pad_x, pad_y = round((mw - new_w) / 2 - 0.1), round((mh - new_h) / 2 - 0.1)
+    return new_w / w0 / scale[0], pad_x, new_h / h0 / scale[1], pad_y
+
+
+def masked_crops(image, masks, boxes, transform, padding_ratio=0.15, crop_size=CROP_SIZE):
+    """
+    Masked square crops of all teeth in one pass.
+
+    image: (H, W) or (H, W, 3) uint8 tensor (BGR), on the same device as `masks`.
+    masks: (N, Hm, Wm) binary masks from YOLO; boxes: (N, 4) xyxy in image coordinates.
+    transform: mask_transform(...) for these masks.
+    Returns (crops, valid): (N, 3, crop_size, crop_size) float BGR in [0, 255], rounded
+    like a uint8 crop, and a bool mask of teeth whose window is not empty.
+    """
+    n = boxes.shape[0]
+    height, width = image.shape[:2]
+    if n == 0:
+        return torch.zeros(0, 3, crop_size, crop_size, device=image.device), torch.zeros(0, dtype=torch.bool)
+
+    windows = crop_windows(boxes.float(), height, width, padding_ratio)
+    valid = (windows[:, 2] > windows[:, 0]) & (windows[:, 3] > windows[:, 1])
+
+    index = torch.arange(n, device=boxes.device, dtype=torch.float32)[:, None]
+    pixels = image.permute(2, 0, 1) if image.ndim == 3 else image[None]
+    crops = roi_align(
+        pixels[None].float(), torch.cat([torch.zeros_like(index), windows], dim=1),
+        output_size=crop_size, sampling_ratio=-1, aligned=True,
+    )
+
+    inside = _sample_masks(masks, windows, transform, crop_size)
+    crops = crops.mul_(inside[:, None]).round_()
+    if crops.shape[1] == 1:
+        crops = crops.expand(-1, 3, -1, -1)
+    return crops, valid.cpu()
+
+
+def _sample_masks(masks, windows, transform, crop_size):
+    """
+    Nearest-neighbour lookup of each mask at the centres of its crop's output pixels,
+    as (N, crop_size, crop_size) bool. Indexes the mask tensor in place (no float copy
+    of the whole N x Hm x Wm stack).
+    """
+    n, mask_h, mask_w = masks.shape
+    ax, bx, ay, by = transform
+    steps = (torch.arange(crop_size, device=windows.device, dtype=torch.float32) + 0.5) / crop_size
+    x1, y1, x2, y2 = windows.unbind(1)
+    xs = (x1[:, None] + steps * (x2 - x1)[:, None]) * ax + bx
+    ys = (y1[:, None] + steps * (y2 - y1)[:, None]) * ay + by
+    xs = xs.floor().long().clamp_(0, mask_w - 1).to(masks.device)
+    ys = ys.floor().long().clamp_(0, mask_h - 1).to(masks.device)
+    index = torch.arange(n, device=masks.device)[:, None, None]
+    return masks[index, ys[:, :, None], xs[:, None, :]] > 0
+
+
+def normalize_crops(crops, mean, std):
+    """(N, 3, H, W) BGR crops in [0, 255] -> normalized RGB, as inference._crops_to_tensor."""
+    mean = torch.tensor(mean, device=crops.device).view(1, 3, 1, 1)
+    std = torch.tensor(std, device=crops.device).view(1, 3, 1, 1)
+    return crops.flip(1).div(255).sub_(mean).div_(std)
@@ -0,0 +1,221 @@
+import cv2
+import numpy as np
+
+# ==============================================================================
+# ONNX RUNTIME CPU BACKEND
+# ==============================================================================
+# Runs the full pipeline without PyTorch: YOLO11-seg and the ResNet18 status
+# classifier are exported to ONNX (export_onnx.py) and executed on the ONNX Runtime
+# CPU provider with a configurable thread count. Used by on-prem clinics without a GPU.
+#
+# OnnxSegmenter mirrors the Ultralytics predict pipeline (letterbox, per-class NMS,
+# prototype masks, contour extraction), so _run_prediction_core works unchanged.
+# Tolerance vs. the PyTorch path: same FDI labels and status ids; boxes within 1 px;
+# confidences within 1e-3; contours within 1-2 px (when a mask splits into several
+# pieces only the largest contour is kept, where Ultralytics merges them).
+
+LETTERBOX_COLOR = (114, 114, 114)
+NMS_IOU = 0.7
+MAX_DET = 300
+MAX_NMS = 30000
+MAX_WH = 7680  # class offset for per-class NMS, as in Ultralytics
+STRIDE = 32
+
+
+def _session(path, threads):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def _letterbox(image, new_size, auto):
+    """Resize keeping aspect ratio and pad, as Ultralytics LetterBox(center=True)."""
+    h, w = image.shape[:2]
+    r = min(new_size / h, new_size / w)
+    new_unpad = (int(round(w * r)), int(round(h * r)))
+    dw, dh = new_size - new_unpad[0], new_size - new_unpad[1]
+    if auto:
+        dw, dh = dw % STRIDE, dh % STRIDE
+    dw, dh = dw / 2, dh / 2
+
+    if (w, h) != new_unpad:
+        image = cv2.resize(image, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+
+
+def _scale_to_original(input_shape, original_shape):
+    """Return (gain, pad_x, pad_y) mapping letterboxed input coordinates back to the original image."""
+    gain = min(input_shape[0] / original_shape[0], input_shape[1] / original_shape[1])
+    pad_x = round((input_shape[1] - original_shape[1] * gain) / 2 - 0.1)
+    pad_y = round((input_shape[0] - original_shape[0] * gain) / 2 - 0.1)
+    return gain, pad_x, pad_y
+
+
+def _nms(boxes, scores, iou_threshold):
+    """Greedy NMS over xyxy boxes; returns kept indices in descending score order."""
+    order = np.argsort(-scores, kind="stable")
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class _Boxes:
+    """Minimal stand-in for ultralytics Boxes (cls, conf, xyxy as NumPy arrays)."""
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    def __len__(self):
+        return len(self.conf)
+
+
+class _Masks:
+    def __init__(self, xy, data=None):
+        self.xy = xy
+        self.data = data
+
+
+class _Result:
+    def __init__(self, boxes, masks):
+        self.boxes = boxes
+        self.masks = masks
+
+
+class OnnxSegmenter:
+    """YOLO11-seg on ONNX Runtime with a `predict` compatible with the Ultralytics call used in inference."""
+
+    def __init__(self, path, threads=None):
+        self.session = _session(path, threads)
+        self.input_name = self.session.get_inputs()[0].name
+        input_shape = self.session.get_inputs()[0].shape
+        # Dynamic exports accept any H/W, so the minimal rectangular letterbox can be used.
+        self.dynamic = not all(isinstance(d, int) for d in input_shape[2:])
+
+    def predict(self, source, conf=0.25, verbose=False, imgsz=640):
+        images = source if isinstance(source, (list, tuple)) else [source]
+        same_shapes = len({img.shape for img in images}) == 1
+        auto = self.dynamic and same_shapes
+
+        batch = np.stack([_letterbox(img, imgsz, auto) for img in images])
+        batch = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2)).astype(np.float32) / 255.0
+
+        if self.dynamic:
+            preds, protos = self.session.run(None, {self.input_name: batch})
+        else:
+            # Static exports have batch size 1
+            outputs = [self.session.run(None, {self.input_name: batch[i:i + 1]}) for i in range(len(batch))]
+            preds = np.concatenate([o[0] for o in outputs])
+            protos = np.concatenate([o[1] for o in outputs])
+
+        input_shape = batch.shape[2:]
+        return [
+            self._postprocess(preds[i], protos[i], input_shape, images[i].shape[:2], conf)
+            for i in range(len(images))
+        ]
+
+    def _postprocess(self, pred, proto, input_shape, original_shape, conf_threshold):
+        nm = proto.shape[0]
+        pred = pred.T  # (anchors, 4 + nc + nm)
+        nc = pred.shape[1] - 4 - nm
+        scores_all = pred[:, 4:4 + nc]
+
+        cls = scores_all.argmax(1)
+        conf = scores_all[np.arange(len(cls)), cls]
+        candidates = np.nonzero(conf > conf_threshold)[0]
+        if len(candidates) == 0:
+            return _Result(_Boxes(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0)), None)
+
+        candidates = candidates[np.argsort(-conf[candidates], kind="stable")[:MAX_NMS]]
+        xywh = pred[candidates, :4]
+        boxes = np.empty_like(xywh)
+        boxes[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+        boxes[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+        boxes[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+        boxes[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+        conf, cls = conf[candidates], cls[candidates]
+        coefs = pred[candidates, 4 + nc:]
+
+        keep = _nms(boxes + (cls * MAX_WH)[:, None], conf, NMS_IOU)[:MAX_DET]
+        boxes, conf, cls, coefs = boxes[keep], conf[keep], cls[keep], coefs[keep]
+
+        # Prototype masks: upsample logits to the input size, binarize, crop to the box.
+        c, mh, mw = proto.shape
+        logits = (coefs @ proto.reshape(c, -1)).reshape(-1, mh, mw)
+        ih, iw = input_shape
+        masks = np.zeros((len(boxes), ih, iw), dtype=np.uint8)
+        for k in range(len(boxes)):
+            up = cv2.resize(logits[k], (iw, ih), interpolation=cv2.INTER_LINEAR)
+            x1, y1, x2, y2 = boxes[k]
+            cols = np.arange(iw)
+            rows = np.arange(ih)
+            inside = ((rows >= y1) & (rows < y2))[:, None] & ((cols >= x1) & (cols < x2))[None, :]
+            masks[k] = (up > 0) & inside
+
+        has_mask = masks.reshape(len(masks), -1).max(1) > 0
+        boxes, conf, cls, masks = boxes[has_mask], conf[has_mask], cls[has_mask], masks[has_mask]
+
+        gain, pad_x, pad_y = _scale_to_original(input_shape, original_shape)
+        oh, ow = original_shape
+
+        scaled = boxes.copy()
+        scaled[:, [0, 2]] = np.clip((scaled[:, [0, 2]] - pad_x) / gain, 0, ow)
+        scaled[:, [1, 3]] = np.clip((scaled[:, [1, 3]] - pad_y) / gain, 0, oh)
+
+        xy = []
+        for mask in masks:
+            contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+            if contours:
+                pts = max(contours, key=len).reshape(-1, 2).astype(np.float32)
+                pts[:, 0] = np.clip((pts[:, 0] - pad_x) / gain, 0, ow)
+                pts[:, 1] = np.clip((pts[:, 1] - pad_y) / gain, 0, oh)
+            else:
+                pts = np.zeros((0, 2), dtype=np.float32)
+            xy.append(pts)
+
+        return _Result(_Boxes(scaled.astype(np.float32), conf.astype(np.float32), cls), _Masks(xy, masks))
+
+
+def crops_to_array(crops, mean, std):
+    """NumPy equivalent of inference._crops_to_tensor (NCHW float32, normalized)."""
+    rgb = np.stack(crops)[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+    mean = np.asarray(mean, dtype=np.float32).reshape(1, 3, 1, 1)
+    std = np.asarray(std, dtype=np.float32).reshape(1, 3, 1, 1)
+    return np.ascontiguousarray((rgb - mean) / std)
+
+
+class OnnxStatusClassifier:
+    """ResNet18 status classifier on ONNX Runtime; `classify` returns (status ids, confidences)."""
+
+    def __init__(self, path, mean, std, threads=None):
+        self.session = _session(path, threads)
+        self.input_name = self.session.get_inputs()[0].name
+        self.mean = mean
+        self.std = std
+
+    def classify(self, crops):
+        logits = self.session.run(None, {self.input_name: crops_to_array(crops, self.mean, self.std)})[0]
+        logits = logits - logits.max(1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(1, keepdims=True)
+        pred = probs.argmax(1)
+        return pred.tolist(), probs[np.arange(len(pred)), pred].tolist()
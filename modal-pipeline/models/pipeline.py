@@ -0,0 +1,216 @@
+import queue
+import threading
+import time
+
+# ==============================================================================
+# STAGED PIPELINE EXECUTOR
+# ==============================================================================
+# Runs a stream of items through a fixed sequence of stages, each on its own worker
+# thread(s), connected by bounded queues. While the status classifier works on image
+# n, YOLO can already segment image n+1 and the next file is being decoded; the
+# bounded queues stop a fast stage from running ahead and filling memory. Results
+# come out in input order. A stage that raises marks the item as failed and the
+# remaining stages skip it, so one bad file does not stop a backfill. A
+# BaseException (KeyboardInterrupt, SystemExit) in a stage or in the input iterator
+# stops the pipeline and is raised again from run() in the consumer's thread.
+#
+# Per stage, stats() reports busy time, utilization (busy / (wall * workers)) and the
+# depth of its input queue, sampled whenever an item is handed to it. A stage near
+# 100% utilization with a full input queue is the bottleneck.
+
+PIPELINE_QUEUE_SIZE = 4
+_DONE = object()
+_POLL_S = 0.1
+
+
+class Stage:
+    """One pipeline step: fn(payload) -> payload for the next stage, on `workers` threads."""
+
+    def __init__(self, name, fn, workers=1):
+        if workers < 1:
+            raise ValueError(f"Stage {name} needs at least one worker.")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class StageFailure:
+    """Payload of an item whose stage raised; later stages pass it through unchanged."""
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+    def __repr__(self):
+        return f"StageFailure({self.stage!r}, {self.error!r})"
+
+
+class _StageStats:
+    def __init__(self, workers):
+        self.workers = workers
+        self.items = 0
+        self.failures = 0
+        self.busy_s = 0.0
+        self.depth_sum = 0
+        self.depth_samples = 0
+        self.depth_max = 0
+        self.lock = threading.Lock()
+
+    def sample_depth(self, depth):
+        with self.lock:
+            self.depth_sum += depth
+            self.depth_samples += 1
+            self.depth_max = max(self.depth_max, depth)
+
+    def add(self, seconds, failed):
+        with self.lock:
+            self.items += 1
+            self.failures += failed
+            self.busy_s += seconds
+
+
+class Pipeline:
+    """
+    Bounded-queue pipeline over a list of Stages.
+
+        pipeline = Pipeline([Stage("decode", read, workers=2), Stage("model", run)])
+        for index, output in pipeline.run(paths):
+            ...
+
+    run() yields (index, output) in input order; output is a StageFailure when a stage
+    raised for that item. One Pipeline runs one stream at a time.
+    """
+
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self._stats = {}
+        self._wall_s = 0.0
+
+    def run(self, items):
+        """Feed `items` through the stages; generator of (index, output) in input order."""
+        stop = threading.Event()
+        crashed = []
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        queues.append(queue.Queue(maxsize=self.queue_size))
+        self._stats = {stage.name: _StageStats(stage.workers) for stage in self.stages}
+        t0 = time.perf_counter()
+
+        def put(q, item, stats=None):
+            if stats is not None:
+                stats.sample_depth(q.qsize())
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=_POLL_S)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def crash(error):
+            crashed.append(error)
+            stop.set()
+
+        def feed():
+            first = self._stats[self.stages[0].name]
+            try:
+                for index, item in enumerate(items):
+                    if not put(queues[0], (index, item), first):
+                        return
+            except BaseException as e:
+                crash(e)
+            finally:
+                for _ in range(self.stages[0].workers):
+                    put(queues[0], _DONE)
+
+        def work(position, stage, remaining):
+            try:
+                work_loop(position, stage, remaining)
+            except BaseException as e:
+                crash(e)
+
+        def work_loop(position, stage, remaining):
+            inbox, outbox = queues[position], queues[position + 1]
+            stats = self._stats[stage.name]
+            next_stats = self._stats[self.stages[position + 1].name] if position + 1 < len(self.stages) else None
+            next_workers = self.stages[position + 1].workers if position + 1 < len(self.stages) else 1
+            while not stop.is_set():
+                try:
+                    message = inbox.get(timeout=_POLL_S)
+                except queue.Empty:
+                    continue
+                if message is _DONE:
+                    with remaining["lock"]:
+                        remaining["workers"] -= 1
+                        last = remaining["workers"] == 0
+                    if last:
+                        # The last worker of a stage closes the next one
+                        for _ in range(next_workers):
+                            put(outbox, _DONE)
+                    return
+                index, payload = message
+                if not isinstance(payload, StageFailure):
+                    start = time.perf_counter()
+                    try:
+                        payload = stage.fn(payload)
+                    except Exception as e:
+                        payload = StageFailure(stage.name, e)
+                    stats.add(time.perf_counter() - start, isinstance(payload, StageFailure))
+                if not put(outbox, (index, payload), next_stats):
+                    return
+
+        threads = [threading.Thread(target=feed, daemon=True, name="pipeline-feed")]
+        for position, stage in enumerate(self.stages):
+            remaining = {"workers": stage.workers, "lock": threading.Lock()}
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=work, args=(position, stage, remaining), daemon=True,
+                    name=f"pipeline-{stage.name}-{worker}",
+                ))
+        for thread in threads:
+            thread.start()
+
+        # Reorder buffer: workers of a multi-worker stage can finish out of order
+        pending = {}
+        next_index = 0
+        try:
+            while True:
+                try:
+                    message = queues[-1].get(timeout=_POLL_S)
+                except queue.Empty:
+                    if crashed:
+                        raise crashed[0]
+                    continue
+                if message is _DONE:
+                    break
+                index, output = message
+                pending[index] = output
+                while next_index in pending:
+                    yield next_index, pending.pop(next_index)
+                    next_index += 1
+        finally:
+            stop.set()
+            self._wall_s = time.perf_counter() - t0
+            for thread in threads:
+                thread.join()
+
+    def stats(self):
+        """
+        Per stage of the last run: items processed, failures raised there, busy seconds,
+        utilization and input-queue depth.
+        """
+        wall_s = self._wall_s
+        report = {"wall_s": wall_s, "queue_size": self.queue_size, "stages": {}}
+        for name, stats in self._stats.items():
+            report["stages"][name] = {
+                "workers": stats.workers,
+                "items": stats.items,
+                "failures": stats.failures,
+                "busy_s": stats.busy_s,
+                "utilization": stats.busy_s / (wall_s * stats.workers) if wall_s > 0 else 0.0,
+                "queue_depth_mean": stats.depth_sum / stats.depth_samples if stats.depth_samples else 0.0,
+                "queue_depth_max": stats.depth_max,
+            }
+        return report
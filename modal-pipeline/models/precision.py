@@ -0,0 +1,114 @@
+import os
+
+import cv2
+import numpy as np
+
+# ==============================================================================
+# STATUS CLASSIFIER PRECISION MODES
+# ==============================================================================
+# The status classifier can run in a cheaper numeric format than fp32:
+#   fp32         - baseline, the trained weights as they are
+#   bf16         - bfloat16 autocast around the fp32 model
+#   int8-dynamic - dynamic quantization (only the final Linear layer of ResNet18;
+#                  PyTorch has no dynamic quantization for convolutions)
+#   int8-static  - static post-training quantization of the whole network, with
+#                  activation ranges calibrated on crops from the status dataset
+# Quantized models run on the CPU only. All modes return fp32 logits, so the
+# rest of the pipeline does not change.
+
+PRECISIONS = ("fp32", "bf16", "int8-dynamic", "int8-static")
+CALIBRATION_SAMPLES = 256
+CALIBRATION_SPLIT = "train"
+QUANTIZATION_ENGINE = "x86"
+
+
+def load_crops(split_dir, limit=None, seed=0):
+    """
+    Read (crops, labels) from a status dataset split laid out as <split>/<status_id>/*.png.
+    With `limit`, a deterministic random subset across all classes is returned.
+    """
+    paths, labels = [], []
+    for status in sorted(os.listdir(split_dir)):
+        class_dir = os.path.join(split_dir, status)
+        if not os.path.isdir(class_dir):
+            continue
+        for name in sorted(os.listdir(class_dir)):
+            if name.endswith(".png"):
+                paths.append(os.path.join(class_dir, name))
+                labels.append(int(status))
+
+    order = np.arange(len(paths))
+    if limit is not None and limit < len(paths):
+        order = np.sort(np.random.default_rng(seed).choice(len(paths), size=limit, replace=False))
+
+    crops = [cv2.imread(paths[i], cv2.IMREAD_COLOR) for i in order]
+    return crops, [labels[i] for i in order]
+
+
+def _autocast_module(model, dtype):
+    import torch
+
+    class AutocastClassifier(torch.nn.Module):
+        """Runs the wrapped model under autocast and returns fp32 logits."""
+
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, x):
+            device_type = "cuda" if x.is_cuda else "cpu"
+            with torch.autocast(device_type=device_type, dtype=dtype):
+                return self.inner(x).float()
+
+    return AutocastClassifier(model).eval()
+
+
+def _quantize_dynamic(model):
+    import torch
+
+    torch.backends.quantized.engine = QUANTIZATION_ENGINE
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8).eval()
+
+
+def _quantize_static(state_dict, num_classes, calibration_crops, to_tensor, batch_size=32):
+    """Fuse conv/bn/relu, calibrate observers on the crops and convert to int8."""
+    import torch
+    from torchvision.models.quantization import resnet18
+
+    if not calibration_crops:
+        raise ValueError("int8-static needs calibration crops")
+
+    torch.backends.quantized.engine = QUANTIZATION_ENGINE
+    model = resnet18(weights=None, quantize=False)
+    model.fc = torch.nn.Linear(model.fc.in_features, num_classes)
+    model.load_state_dict(state_dict)
+    model.eval()
+    model.fuse_model()
+    model.qconfig = torch.ao.quantization.get_default_qconfig(QUANTIZATION_ENGINE)
+    torch.ao.quantization.prepare(model, inplace=True)
+
+    with torch.no_grad():
+        for start in range(0, len(calibration_crops), batch_size):
+            model(to_tensor(calibration_crops[start:start + batch_size]))
+
+    return torch.ao.quantization.convert(model, inplace=True).eval()
+
+
+def apply_precision(model, precision, calibration_crops=None, to_tensor=None, num_classes=None):
+    """
+    Return a status classifier in the requested precision from an fp32 model (eval mode, CPU).
+    int8-static needs `calibration_crops` (224x224 BGR) and the `to_tensor` preprocessing.
+    """
+    import torch
+
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}. Expected one of {PRECISIONS}.")
+    if precision == "fp32":
+        return model
+    if precision == "bf16":
+        return _autocast_module(model, torch.bfloat16)
+    if precision == "int8-dynamic":
+        return _quantize_dynamic(model)
+
+    num_classes = num_classes or model.fc.out_features
+    return _quantize_static(model.state_dict(), num_classes, calibration_crops, to_tensor)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ==============================================================================
+# PREDICTION RESULT CACHE
+# ==============================================================================
+# Clinicians reopen the same panoramic many times. Results are cached by a hash of
+# the decoded image, the model weight versions and the use_heuristic flag.
+# Two tiers: an in-memory LRU bounded by size, and an optional JSON store on disk.
+# The disk tier is bounded too: prune_disk() drops entries older than the TTL, then
+# the least recently used ones (by mtime; hits touch their file) until it is under
+# its byte and entry caps. It is called periodically off the request path.
+
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+DISK_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DISK_MAX_ENTRIES = 100_000
+DISK_TTL_S = 30 * 24 * 3600
+STALE_TMP_S = 3600
+
+
+def model_version(*paths):
+    """
+    Cheap fingerprint of the model weights: path, size and mtime of each file.
+    Retraining (a new best.pt) changes the fingerprint and invalidates old entries.
+    """
+    parts = []
+    for path in paths:
+        if path and os.path.exists(path):
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_size}:{st.st_mtime_ns}")
+        else:
+            parts.append(f"{path}:missing")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(img_array, version, use_heuristic):
+    """Content address of one prediction request."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{img_array.shape}|{img_array.dtype}|{version}|{bool(use_heuristic)}".encode("utf-8"))
+    h.update(memoryview(img_array).cast("B") if img_array.flags["C_CONTIGUOUS"] else img_array.tobytes())
+    return h.hexdigest()
+
+
+def prune_disk_dir(disk_dir, max_bytes=None, max_entries=None, ttl_s=None, now=None):
+    """
+    Delete files under disk_dir older than ttl_s (by mtime), then the oldest ones until
+    at most max_bytes and max_entries remain. Returns the number of files removed.
+    """
+    now = time.time() if now is None else now
+    files = []
+    for root, _, names in os.walk(disk_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # removed concurrently
+            if ".tmp." in name and now - st.st_mtime < STALE_TMP_S:
+                continue  # a write in progress
+            files.append((st.st_mtime, st.st_size, path))
+    files.sort()
+
+    total_bytes = sum(size for _, size, _ in files)
+    removed = 0
+    for mtime, size, path in files:
+        expired = ttl_s is not None and now - mtime > ttl_s
+        over_bytes = max_bytes is not None and total_bytes > max_bytes
+        over_entries = max_entries is not None and len(files) - removed > max_entries
+        if not (expired or over_bytes or over_entries):
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_bytes -= size
+        removed += 1
+    return removed
+
+
+class ResultCache:
+    """
+    Thread-safe two-tier cache of prediction responses.
+    Entries are stored as JSON text, so every hit returns a fresh copy.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes=DEFAULT_MEMORY_BYTES,
+        disk_dir=None,
+        disk_max_bytes=DISK_MAX_BYTES,
+        disk_max_entries=DISK_MAX_ENTRIES,
+        disk_ttl_s=DISK_TTL_S,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_max_entries = disk_max_entries
+        self.disk_ttl_s = disk_ttl_s
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key, payload):
+        """Insert into the memory tier and evict least-recently-used entries over budget."""
+        size = len(payload)
+        if size > self.max_memory_bytes:
+            return
+        if key in self._entries:
+            self._memory_bytes -= len(self._entries.pop(key))
+        self._entries[key] = payload
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._counters["evictions"] += 1
+
+    def get(self, key):
+        """Return (result, tier) on a hit, (None, None) on a miss."""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return json.loads(payload), "memory"
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        payload = f.read()
+                    result = json.loads(payload)
+                    os.utime(path)  # recently used, for prune_disk
+                except (OSError, ValueError):
+                    result = None
+                if result is not None:
+                    with self._lock:
+                        self._remember(key, payload)
+                        self._counters["disk_hits"] += 1
+                    return result, "disk"
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None, None
+
+    def put(self, key, result):
+        payload = json.dumps(result, separators=(",", ":"))
+        with self._lock:
+            self._remember(key, payload)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+
+    def prune_disk(self):
+        """Bound the disk tier (TTL, then byte and entry caps); returns the number of entries removed."""
+        if not self.disk_dir:
+            return 0
+        removed = prune_disk_dir(self.disk_dir, self.disk_max_bytes, self.disk_max_entries, self.disk_ttl_s)
+        with self._lock:
+            self._counters["disk_evictions"] += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["memory_bytes"] = self._memory_bytes
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_ratio"] = hits / lookups if lookups else 0.0
+        return stats
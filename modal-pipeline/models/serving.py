@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# ==============================================================================
+# ASYNC SERVING
+# ==============================================================================
+# Keeps the FastAPI event loop free: image decode and model inference run on
+# bounded thread pools, the number of accepted requests per container is capped
+# (excess requests get 429) and every request has a timeout (504).
+
+DECODE_WORKERS = 2
+INFERENCE_WORKERS = 1       # the models are shared, so inference runs one request at a time
+MAX_IN_FLIGHT = 8           # running + queued requests per container
+REQUEST_TIMEOUT_S = 120.0
+
+
+class InferenceGate:
+    """
+    Bounded executors with an in-flight limit for async endpoints.
+    A request holds its slot until its work actually finishes in the pool, so a
+    timed-out request still counts against the limit while its thread is busy.
+    """
+
+    def __init__(
+        self,
+        max_in_flight=MAX_IN_FLIGHT,
+        decode_workers=DECODE_WORKERS,
+        inference_workers=INFERENCE_WORKERS,
+        request_timeout_s=REQUEST_TIMEOUT_S,
+    ):
+        self.max_in_flight = max_in_flight
+        self.request_timeout_s = request_timeout_s
+        self.decode_executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        self.inference_executor = ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix="inference")
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def run(self, decode_fn, infer_fn):
+        """
+        Run decode_fn() on the decode pool, then infer_fn(decoded) on the inference pool.
+        Raises HTTPException 429 when the container is saturated and 504 on timeout.
+        """
+        from fastapi import HTTPException
+
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="Too many requests in flight", headers={"Retry-After": "1"})
+
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+
+        def release_when_done(future):
+            # The slot is released from the event loop thread once the pool work is done
+            # (or cancelled while still queued after a timeout).
+            future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+
+        async def work():
+            decode_future = self.decode_executor.submit(decode_fn)
+            try:
+                decoded = await asyncio.wrap_future(decode_future)
+            except BaseException:
+                # A timeout does not stop a running decode: keep the slot until it ends
+                release_when_done(decode_future)
+                raise
+            future = self.inference_executor.submit(infer_fn, decoded)
+            release_when_done(future)
+            return await asyncio.wrap_future(future)
+
+        try:
+            return await asyncio.wait_for(work(), self.request_timeout_s)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise HTTPException(status_code=504, detail="Inference timed out")
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
@@ -1,8 +1,91 @@
 import os
+import time
 import modal
 
 from config import app, dental_image, volume, YOLO_DATASET_PATH, MODELS_DIR
 
+
+def _add_metrics_callbacks(model, run):
+    """
+    Record per-epoch timings of the Ultralytics trainer (training_metrics.py) in
+    <save_dir>/training_metrics.jsonl. `run` receives the MetricsLog once the trainer
+    knows its save_dir.
+    """
+    import torch
+    from training_metrics import MetricsLog, PhaseTimer, peak_memory_mb, reset_peak_memory
+
+    state = {}
+
+    def timed(name, method):
+        def wrapper(*args, **kwargs):
+            with state["timer"].measure(name):
+                return method(*args, **kwargs)
+        return wrapper
+
+    def sync(trainer):
+        if trainer.device.type == "cuda":
+            torch.cuda.synchronize(trainer.device)
+
+    def on_train_start(trainer):
+        run["metrics"] = MetricsLog(str(trainer.save_dir), model="fdi_segmentation", batch_size=trainer.batch_size)
+        # Validation and checkpointing have no start/end callbacks of their own
+        trainer.validate = timed("val", trainer.validate)
+        trainer.save_model = timed("checkpoint", trainer.save_model)
+
+    def on_train_epoch_start(trainer):
+        reset_peak_memory(trainer.device)
+        state["timer"] = PhaseTimer()
+        state["epoch_start"] = state["batch_end"] = time.perf_counter()
+        state["written"] = False
+
+    def on_train_batch_start(trainer):
+        now = time.perf_counter()
+        state["timer"].add("train_data_wait", now - state["batch_end"])
+        state["batch_start"] = now
+
+    def on_train_batch_end(trainer):
+        sync(trainer)
+        state["batch_end"] = time.perf_counter()
+        state["timer"].add("train_compute", state["batch_end"] - state["batch_start"])
+
+    def on_train_epoch_end(trainer):
+        state["train_s"] = time.perf_counter() - state["epoch_start"]
+
+    def on_fit_epoch_end(trainer):
+        # The final validation of best.pt fires this callback once more; it is not an epoch
+        if state.get("written", True):
+            return
+        state["written"] = True
+        samples = len(trainer.train_loader.dataset)
+        record = {
+            "epoch": trainer.epoch + 1,
+            "train_samples": samples,
+            "train_samples_per_s": samples / state["train_s"],
+            "train_s": state["train_s"],
+            "val_s": 0.0,
+            "checkpoint_s": 0.0,
+            **state["timer"].as_dict(),
+            "epoch_s": time.perf_counter() - state["epoch_start"],
+            **peak_memory_mb(trainer.device),
+            "metrics": {k: float(v) for k, v in (trainer.metrics or {}).items()},
+        }
+        run["metrics"].write(record)
+        print(
+            f"Epoch {record['epoch']} took {record['epoch_s']:.1f}s (data wait {record['train_data_wait_s']:.1f}s, "
+            f"compute {record['train_compute_s']:.1f}s, {record['train_samples_per_s']:.1f} images/s)"
+        )
+
+    for event, callback in [
+        ("on_train_start", on_train_start),
+        ("on_train_epoch_start", on_train_epoch_start),
+        ("on_train_batch_start", on_train_batch_start),
+        ("on_train_batch_end", on_train_batch_end),
+        ("on_train_epoch_end", on_train_epoch_end),
+        ("on_fit_epoch_end", on_fit_epoch_end),
+    ]:
+        model.add_callback(event, callback)
+
+
 # IMPORTANT: Run this function with: modal run modal-pipeline/models/train.py
 @app.function(
     image=dental_image,
@@ -10,7 +93,7 @@ from config import app, dental_image, volume, YOLO_DATASET_PATH, MODELS_DIR
     gpu="L40S",
     timeout=28800      # 8 hours max
 )
-def train(epochs: int = 100, batch_size: int = 16, model_size: str = "x"):
+def train(epochs: int = 100, batch_size: int = 16, model_size: str = "x", name: str = "dental_fdi_segmentation"):
     """
     Train a YOLO11-seg model for tooth segmentation and FDI numbering.
 
@@ -18,6 +101,8 @@ def train(epochs: int = 100, batch_size: int = 16, model_size: str = "x"):
         epochs: number of epochs (default 100).
         batch_size: batch size (default 16, adjust based on GPU memory).
         model_size: YOLO11 backbone size: n, s, m, l, x (default x for maximum accuracy).
+        name: run directory under MODELS_DIR. The fast model of the inference cascade
+            (cascade.py) is trained with model_size="n" (or "s") and name="dental_fdi_segmentation_fast".
     """
     from ultralytics import YOLO
     
@@ -31,7 +116,9 @@ def train(epochs: int = 100, batch_size: int = 16, model_size: str = "x"):
     print(f"Starting YOLO11-seg training ({model_name}) for {epochs} epochs...")
     
     model = YOLO(model_name)
-    
+    run = {}
+    _add_metrics_callbacks(model, run)
+
     model.train(
         data=yaml_path,
         epochs=epochs,
@@ -40,7 +127,7 @@ def train(epochs: int = 100, batch_size: int = 16, model_size: str = "x"):
         optimizer="Adam",
         lr0=0.0001,
         project=MODELS_DIR,
-        name="dental_fdi_segmentation",
+        name=name,
         device=0,
         save=True,
         cache=True,
@@ -50,9 +137,16 @@ def train(epochs: int = 100, batch_size: int = 16, model_size: str = "x"):
         mask_ratio=4,
     )
     
+    save_dir = str(model.trainer.save_dir)
+    model_path = f"{save_dir}/weights/best.pt"
     print("FDI segmentation training completed!")
-    print(f"Model saved at: {MODELS_DIR}/dental_fdi_segmentation/weights/best.pt")
+    print(f"Model saved at: {model_path}")
+    t0 = time.perf_counter()
     volume.commit()
+    metrics = run["metrics"]
+    metrics.write({"event": "final_commit", "commit_s": time.perf_counter() - t0})
+    print(f"Training metrics: {metrics.path}")
+    return {"model_path": model_path, "metrics_path": metrics.path, "epochs": metrics.records}
 
 if __name__ == "__main__":
     app.run()
@@ -1,4 +1,6 @@
 import os
+import json
+import time
 from pathlib import Path
 
 import modal
@@ -13,6 +15,10 @@ from config import app, dental_image, volume, STATUS_DATASET_PATH, MODELS_DIR
 
 STATUS_MODEL_DIR = f"{MODELS_DIR}/dental_status_classifier"
 NUM_CLASSES = 7
+DATA_FORMATS = ("packed", "png")
+AUGMENT_MODES = ("batch", "pil")
+STATUS_MEAN = [0.485, 0.456, 0.406]
+STATUS_STD = [0.229, 0.224, 0.225]
 
 
 class InMemoryImageDataset:
@@ -43,6 +49,12 @@ class InMemoryImageDataset:
     def __len__(self):
         return len(self.samples)
 
+    def as_array(self):
+        """All images as one uint8 (N, 224, 224, 3) RGB array, for batched augmentation."""
+        import numpy as np
+
+        return np.stack([np.asarray(img.resize((224, 224)) if img.size != (224, 224) else img) for img in self.samples])
+
     def __getitem__(self, idx):
         img = self.samples[idx]
         label = self.targets[idx]
@@ -62,11 +74,25 @@ def train_status(
     batch_size: int = 32,
     learning_rate: float = 0.001,
     resume: bool = False,
+    data_format: str = "packed",
+    num_workers: int = 4,
+    augment: str = "batch",
+    seed: int = 0,
+    amp: bool = False,
+    channels_last: bool = False,
+    compile_model: bool = False,
 ):
     """
     Train the tooth status classifier on masked tooth crops.
     Saves the best model during training and the final checkpoint at the end.
     Use resume=true to continue training from the last checkpoint.
+    data_format="packed" memory-maps the packed crop arrays written by data_preparation.py
+    (falls back to "png", which decodes every PNG into RAM, when they are missing).
+    augment="batch" keeps crops as uint8 and augments whole batches on the training device
+    (batch_augment.py); augment="pil" is the per-image torchvision pipeline in DataLoader workers.
+    amp=true trains with fp16 autocast and gradient scaling, channels_last=true uses the NHWC
+    memory format and compile_model=true wraps the model in torch.compile. AMP and compile
+    need CUDA and are switched off on CPU.
     """
     import torch
     import torch.nn as nn
@@ -77,6 +103,15 @@ def train_status(
     print("Loading PyTorch dependencies...")
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"Device: {device}")
+    if augment not in AUGMENT_MODES:
+        raise ValueError(f"Unknown augment mode: {augment}. Expected one of {AUGMENT_MODES}.")
+    torch.manual_seed(seed)
+    if device.type != "cuda" and (amp or compile_model):
+        print("AMP and torch.compile need CUDA. Training in fp32 without compile.")
+        amp = compile_model = False
+    training_mode = {"amp": amp, "channels_last": channels_last, "compile": compile_model}
+    print(f"Training mode: {training_mode}")
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
     print(f"Dataset path: {STATUS_DATASET_PATH}")
 
     if not os.path.exists(STATUS_DATASET_PATH):
@@ -89,33 +124,78 @@ def train_status(
             transforms.RandomRotation(10),
             transforms.ColorJitter(brightness=0.2, contrast=0.2),
             transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+            transforms.Normalize(STATUS_MEAN, STATUS_STD),
         ]),
         "val": transforms.Compose([
             transforms.Resize((224, 224)),
             transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+            transforms.Normalize(STATUS_MEAN, STATUS_STD),
         ]),
     }
 
-    print("Building in-memory datasets...")
-    image_datasets = {
-        x: InMemoryImageDataset(os.path.join(STATUS_DATASET_PATH, x), data_transforms[x])
-        for x in ["train", "val"]
-    }
+    from crop_store import PackedCropDataset, has_packed_split
+    from training_metrics import MetricsLog, PhaseTimer, peak_memory_mb, reset_peak_memory
+
+    if data_format not in DATA_FORMATS:
+        raise ValueError(f"Unknown data_format: {data_format}. Expected one of {DATA_FORMATS}.")
+    if data_format == "packed" and not all(has_packed_split(STATUS_DATASET_PATH, x) for x in ["train", "val"]):
+        print("Packed crops not found. Run data_preparation.py to create them. Falling back to PNG.")
+        data_format = "png"
+
+    if data_format == "packed":
+        print("Memory-mapping packed datasets...")
+        image_datasets = {
+            x: PackedCropDataset(STATUS_DATASET_PATH, x, data_transforms[x])
+            for x in ["train", "val"]
+        }
+    else:
+        print("Building in-memory datasets...")
+        image_datasets = {
+            x: InMemoryImageDataset(os.path.join(STATUS_DATASET_PATH, x), data_transforms[x])
+            for x in ["train", "val"]
+        }
     print(f"Dataset sizes: train={len(image_datasets['train'])}, val={len(image_datasets['val'])}")
 
-    print("Building DataLoaders...")
-    dataloaders = {
-        x: DataLoader(
-            image_datasets[x],
-            batch_size=batch_size,
-            shuffle=(x == "train"),
-            num_workers=0,  # data is already in memory, no need for workers
-            pin_memory=True if device.type == "cuda" else False,
-        )
-        for x in ["train", "val"]
-    }
+    if augment == "batch":
+        from batch_augment import ArrayBatchLoader, BatchAugment
+
+        print("Building device-side batch loaders...")
+        arrays = {
+            x: image_datasets[x].images if data_format == "packed" else image_datasets[x].as_array()
+            for x in ["train", "val"]
+        }
+        dataloaders = {
+            x: ArrayBatchLoader(
+                arrays[x], image_datasets[x].targets, batch_size, device, shuffle=(x == "train"), seed=seed
+            )
+            for x in ["train", "val"]
+        }
+        batch_augment = BatchAugment(device, STATUS_MEAN, STATUS_STD, seed=seed)
+    else:
+        print("Building DataLoaders...")
+        dataloaders = {
+            x: DataLoader(
+                image_datasets[x],
+                batch_size=batch_size,
+                shuffle=(x == "train"),
+                # The packed arrays are memory-mapped, so workers share the pages instead of copying them.
+                # PNG data is already in memory, no need for workers.
+                num_workers=num_workers if data_format == "packed" else 0,
+                persistent_workers=data_format == "packed" and num_workers > 0,
+                pin_memory=True if device.type == "cuda" else False,
+                generator=torch.Generator().manual_seed(seed),
+            )
+            for x in ["train", "val"]
+        }
+
+    def batches(phase):
+        """(normalized inputs, labels) on the device for one pass over a phase."""
+        for inputs, labels in dataloaders[phase]:
+            if augment == "batch":
+                inputs = batch_augment(inputs, train=(phase == "train"))
+            else:
+                inputs, labels = inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True)
+            yield inputs.contiguous(memory_format=memory_format), labels
 
     class_counts = [0] * NUM_CLASSES
     for label in image_datasets["train"].targets:
@@ -129,17 +209,21 @@ def train_status(
     model = models.resnet18(weights=models.ResNet18_Weights.DEFAULT)
     num_ftrs = model.fc.in_features
     model.fc = nn.Linear(num_ftrs, NUM_CLASSES)
-    model = model.to(device)
+    model = model.to(device, memory_format=memory_format)
+    # Checkpoints always hold the plain model's state_dict, so compiled and eager runs can resume each other
+    forward_model = torch.compile(model) if compile_model else model
 
     criterion = nn.CrossEntropyLoss(weight=class_weights)
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
     scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=10, gamma=0.1)
+    scaler = torch.amp.GradScaler("cuda", enabled=amp)
 
     start_epoch = 0
     best_acc = 0.0
     Path(STATUS_MODEL_DIR).mkdir(parents=True, exist_ok=True)
     best_model_path = os.path.join(STATUS_MODEL_DIR, "best_status_classifier.pth")
     last_checkpoint_path = os.path.join(STATUS_MODEL_DIR, "last_checkpoint.pth")
+    best_model_info_path = os.path.join(STATUS_MODEL_DIR, "best_status_classifier.json")
 
     if resume and os.path.exists(last_checkpoint_path):
         print(f"Resuming from checkpoint: {last_checkpoint_path}")
@@ -147,12 +231,20 @@ def train_status(
         model.load_state_dict(checkpoint["model_state_dict"])
         optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
         scheduler.load_state_dict(checkpoint["scheduler_state_dict"])
+        if amp and "scaler_state_dict" in checkpoint:
+            scaler.load_state_dict(checkpoint["scaler_state_dict"])
         start_epoch = checkpoint.get("epoch", 0)
         best_acc = checkpoint.get("best_acc", 0.0)
         print(f"Resumed from epoch {start_epoch}, best_acc={best_acc:.4f}")
+        print(f"Checkpoint training mode: {checkpoint.get('training_mode', 'fp32 (not recorded)')}")
 
+    metrics = MetricsLog(STATUS_MODEL_DIR, model="status_classifier", training_mode=training_mode, augment=augment)
     print(f"Starting training from epoch {start_epoch + 1} for {epochs} epochs...")
     for epoch in range(start_epoch, start_epoch + epochs):
+        epoch_start = time.perf_counter()
+        reset_peak_memory(device)
+        timer = PhaseTimer()
+        record = {"epoch": epoch + 1}
         for phase in ["train", "val"]:
             if phase == "train":
                 model.train()
@@ -162,55 +254,100 @@ def train_status(
             running_loss = 0.0
             running_corrects = 0
             total_samples = 0
-
-            for batch_idx, (inputs, labels) in enumerate(dataloaders[phase]):
-                inputs = inputs.to(device)
-                labels = labels.to(device)
-
-                optimizer.zero_grad()
-                with torch.set_grad_enabled(phase == "train"):
-                    outputs = model(inputs)
-                    _, preds = torch.max(outputs, 1)
-                    loss = criterion(outputs, labels)
-
-                    if phase == "train":
-                        loss.backward()
-                        optimizer.step()
-
-                running_loss += loss.item() * inputs.size(0)
-                running_corrects += torch.sum(preds == labels.data)
-                total_samples += labels.size(0)
-
+            phase_start = time.perf_counter()
+
+            batch_iter = iter(batches(phase))
+            while True:
+                with timer.measure(f"{phase}_data_wait"):
+                    batch = next(batch_iter, None)
+                if batch is None:
+                    break
+                inputs, labels = batch
+
+                with timer.measure(f"{phase}_compute"):
+                    optimizer.zero_grad()
+                    with torch.set_grad_enabled(phase == "train"):
+                        with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=amp):
+                            outputs = forward_model(inputs)
+                            loss = criterion(outputs, labels)
+                        _, preds = torch.max(outputs, 1)
+
+                        if phase == "train":
+                            scaler.scale(loss).backward()
+                            scaler.step(optimizer)
+                            scaler.update()
+
+                    # .item() waits for the GPU, so compute time includes the queued kernels
+                    running_loss += loss.item() * inputs.size(0)
+                    running_corrects += torch.sum(preds == labels.data)
+                    total_samples += labels.size(0)
+
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            images_per_s = total_samples / (time.perf_counter() - phase_start)
             epoch_loss = running_loss / total_samples
             epoch_acc = running_corrects.double() / total_samples
-            print(f"Epoch {epoch+1}/{start_epoch + epochs} [{phase}] Loss: {epoch_loss:.4f} Acc: {epoch_acc:.4f}")
+            record.update({
+                f"{phase}_loss": epoch_loss,
+                f"{phase}_acc": float(epoch_acc),
+                f"{phase}_samples": total_samples,
+                f"{phase}_samples_per_s": images_per_s,
+            })
+            print(
+                f"Epoch {epoch+1}/{start_epoch + epochs} [{phase}] Loss: {epoch_loss:.4f} Acc: {epoch_acc:.4f} "
+                f"({images_per_s:.0f} images/s, augment={augment})"
+            )
 
             if phase == "val" and epoch_acc > best_acc:
                 best_acc = epoch_acc
-                torch.save(model.state_dict(), best_model_path)
-                volume.commit()
+                with timer.measure("checkpoint"):
+                    torch.save(model.state_dict(), best_model_path)
+                    # best_status_classifier.pth stays a plain state_dict for inference; its metadata goes next to it
+                    with open(best_model_info_path, "w", encoding="utf-8") as f:
+                        json.dump({"epoch": epoch + 1, "val_acc": float(best_acc), "training_mode": training_mode}, f)
+                with timer.measure("commit"):
+                    volume.commit()
                 print(f"Best model saved with val acc {best_acc:.4f}")
 
         scheduler.step()
 
+        record.update({"checkpoint_s": 0.0, "commit_s": 0.0})
+        record.update(timer.as_dict())
+        record.update({"epoch_s": time.perf_counter() - epoch_start, **peak_memory_mb(device)})
+        metrics.write(record)
+        print(
+            f"Epoch {epoch+1} took {record['epoch_s']:.1f}s "
+            f"(train data wait {record['train_data_wait_s']:.1f}s, compute {record['train_compute_s']:.1f}s), "
+            f"peak GPU memory {record['peak_gpu_mb']:.0f} MB, process peak RSS {record['process_peak_rss_mb']:.0f} MB"
+        )
+
     # Save final checkpoint at the end of the run for potential resume
+    t0 = time.perf_counter()
     torch.save({
         "epoch": start_epoch + epochs,
         "model_state_dict": model.state_dict(),
         "optimizer_state_dict": optimizer.state_dict(),
         "scheduler_state_dict": scheduler.state_dict(),
+        "scaler_state_dict": scaler.state_dict(),
         "best_acc": best_acc,
+        "training_mode": training_mode,
     }, last_checkpoint_path)
+    t1 = time.perf_counter()
     volume.commit()
+    metrics.write({"event": "final_checkpoint", "checkpoint_s": t1 - t0, "commit_s": time.perf_counter() - t1})
     print(f"Final checkpoint saved at epoch {start_epoch + epochs}")
 
     print(f"Training complete. Best val accuracy: {best_acc:.4f}")
     print(f"Best model saved at: {best_model_path}")
     print(f"Last checkpoint saved at: {last_checkpoint_path}")
+    print(f"Training metrics: {metrics.path}")
 
     return {
         "best_val_acc": float(best_acc),
         "model_path": best_model_path,
+        "training_mode": training_mode,
+        "metrics_path": metrics.path,
+        "epochs": metrics.records,
     }
 
 
@@ -220,6 +357,13 @@ def main(
     batch_size: int = 32,
     learning_rate: float = 0.001,
     resume: bool = False,
+    data_format: str = "packed",
+    num_workers: int = 4,
+    augment: str = "batch",
+    seed: int = 0,
+    amp: bool = False,
+    channels_last: bool = False,
+    compile_model: bool = False,
 ):
     print("Starting status classifier training in the cloud...")
     result = train_status.remote(
@@ -227,6 +371,13 @@ def main(
         batch_size=batch_size,
         learning_rate=learning_rate,
         resume=resume,
+        data_format=data_format,
+        num_workers=num_workers,
+        augment=augment,
+        seed=seed,
+        amp=amp,
+        channels_last=channels_last,
+        compile_model=compile_model,
     )
     print(f"Result: {result}")
 
@@ -0,0 +1,76 @@
+import json
+import os
+import resource
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# ==============================================================================
+# TRAINING INSTRUMENTATION
+# ==============================================================================
+# Per-epoch phase timings for train.py and train_status.py, written as JSON lines
+# (training_metrics.jsonl) next to the checkpoints and returned by the functions:
+#   data_wait_s  - time the loop waited for the next batch (I/O, decode, augmentation)
+#   compute_s    - forward/backward/optimizer time, synchronized with the GPU
+#   samples_per_s, checkpoint_s, commit_s, peak_gpu_mb (this epoch),
+#   process_peak_rss_mb (peak RSS since the process started, not per epoch)
+# A run limited by I/O or the CPU shows a large data_wait_s next to a small compute_s.
+
+METRICS_FILENAME = "training_metrics.jsonl"
+
+
+def peak_memory_mb(device=None):
+    """Peak GPU memory allocated since the last reset, and the process lifetime peak RSS, in MB."""
+    import torch
+
+    on_cuda = device is not None and torch.device(device).type == "cuda" and torch.cuda.is_available()
+    peak_gpu = torch.cuda.max_memory_allocated(device) / 2**20 if on_cuda else 0.0
+    process_peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux; never resets
+    return {"peak_gpu_mb": peak_gpu, "process_peak_rss_mb": process_peak_rss}
+
+
+def reset_peak_memory(device=None):
+    import torch
+
+    if device is not None and torch.device(device).type == "cuda" and torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+class PhaseTimer:
+    """Accumulates wall time per named phase."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    def add(self, name, seconds):
+        self.totals[name] += seconds
+
+    @contextmanager
+    def measure(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def as_dict(self, suffix="_s"):
+        return {f"{name}{suffix}": seconds for name, seconds in self.totals.items()}
+
+
+class MetricsLog:
+    """Appends one JSON object per line to <directory>/training_metrics.jsonl and keeps them in memory."""
+
+    def __init__(self, directory, **run_info):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, METRICS_FILENAME)
+        self.run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self.run_info = run_info
+        self.records = []
+
+    def write(self, record):
+        record = {"run_id": self.run_id, "time": datetime.now(timezone.utc).isoformat(), **self.run_info, **record}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        self.records.append(record)
+        return record
@@ -0,0 +1,411 @@
+import json
+import math
+import struct
+
+from config import FDI_LABELS, STATUS_LABELS
+
+# ==============================================================================
+# RESPONSE WIRE FORMATS
+# ==============================================================================
+# Contours as lists of float pairs make responses hundreds of KB. Formats:
+#   json     – today's schema (default).
+#   compact  – JSON with integer-quantized (optionally delta-encoded) polygons,
+#              optional Douglas-Peucker simplification and COCO RLE masks.
+#   binary   – the compact data packed with struct/NumPy (application/octet-stream).
+# decode_compact / decode_binary turn both back into today's schema.
+
+WIRE_FORMATS = ("json", "compact", "binary")
+COMPACT_VERSION = 1
+BINARY_MAGIC = b"DTWB"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+MAX_SCALE = 1000.0  # 1/1000 px grid; coordinates stay far from the int32 limit
+
+_UNKNOWN_FDI = 255
+_TOOTH_CORRECTED = 1
+_TOOTH_HAS_ORIGINAL = 2
+_TOOTH_INT16 = 4
+_TOOTH_HAS_RLE = 8
+
+
+# ------------------------------------------------------------------------------
+# Polygons
+# ------------------------------------------------------------------------------
+
+def simplify_contour(contour, tolerance):
+    """Douglas-Peucker simplification (cv2.approxPolyDP) with `tolerance` in pixels."""
+    import cv2
+    import numpy as np
+
+    pts = np.asarray(contour, dtype=np.float32).reshape(-1, 1, 2)
+    if tolerance <= 0 or len(pts) < 4:
+        return pts.reshape(-1, 2)
+    return cv2.approxPolyDP(pts, tolerance, True).reshape(-1, 2)
+
+
+def quantize_contour(contour, scale=1.0, delta=True):
+    """
+    Round coordinates to a 1/scale pixel grid and flatten to [x0, y0, x1, y1, ...].
+    With delta=True every point after the first is stored as the difference to the previous one.
+    """
+    import numpy as np
+
+    q = np.round(np.asarray(contour, dtype=np.float64).reshape(-1, 2) * scale).astype(np.int64)
+    if delta and len(q) > 1:
+        q[1:] = np.diff(q, axis=0)
+    return q.reshape(-1)
+
+
+def dequantize_contour(values, scale=1.0, delta=True):
+    """Inverse of quantize_contour: back to [[x, y], ...] floats."""
+    import numpy as np
+
+    q = np.asarray(values, dtype=np.int64).reshape(-1, 2)
+    if delta and len(q) > 1:
+        q = np.cumsum(q, axis=0)
+    return (q / scale).tolist()
+
+
+# ------------------------------------------------------------------------------
+# COCO-style RLE masks
+# ------------------------------------------------------------------------------
+
+def rle_encode(contour, height, width):
+    """
+    COCO compressed RLE of a polygon mask (column-major, counts start with background).
+    The polygon is rasterized only inside its bounding box.
+    """
+    import cv2
+    import numpy as np
+
+    pts = np.asarray(contour, dtype=np.float64).reshape(-1, 2).astype(np.int32)
+    x0 = int(np.clip(pts[:, 0].min(), 0, width))
+    y0 = int(np.clip(pts[:, 1].min(), 0, height))
+    x1 = int(np.clip(pts[:, 0].max() + 1, 0, width))
+    y1 = int(np.clip(pts[:, 1].max() + 1, 0, height))
+
+    counts = [height * width]
+    if x1 > x0 and y1 > y0:
+        # Zero rows above and below each ROI column keep runs from crossing columns.
+        padded = np.zeros((y1 - y0 + 2, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(padded[1:-1], [pts - np.array([x0, y0], dtype=np.int32)], 1)
+        flat = padded.ravel(order="F").astype(np.int8)
+        edges = np.diff(flat)
+        starts = np.nonzero(edges == 1)[0] + 1
+        ends = np.nonzero(edges == -1)[0] + 1
+
+        # Flat ROI index -> column-major index in the full image
+        rows = padded.shape[0]
+        starts = (x0 + starts // rows) * height + (y0 + starts % rows - 1)
+        ends = (x0 + ends // rows) * height + (y0 + ends % rows - 1)
+        if len(starts):
+            # Runs touching the bottom of one column and the top of the next are one run.
+            joined = starts[1:] == ends[:-1]
+            starts = np.concatenate([starts[:1], starts[1:][~joined]])
+            ends = np.concatenate([ends[:-1][~joined], ends[-1:]])
+
+            bounds = np.empty(2 * len(starts), dtype=np.int64)
+            bounds[0::2] = starts
+            bounds[1::2] = ends
+            counts = np.diff(np.concatenate([[0], bounds, [height * width]])).tolist()
+            if counts[-1] == 0:
+                counts.pop()
+
+    return {"size": [height, width], "counts": _rle_counts_to_string(counts)}
+
+
+def rle_decode(rle):
+    """Decode a COCO compressed RLE into an (h, w) uint8 mask."""
+    import numpy as np
+
+    height, width = rle["size"]
+    counts = _rle_string_to_counts(rle["counts"])
+    flat = np.zeros(height * width, dtype=np.uint8)
+    pos = 0
+    for k, run in enumerate(counts):
+        if k % 2 == 1:
+            flat[pos:pos + run] = 1
+        pos += run
+    return flat.reshape((width, height)).T
+
+
+def _rle_counts_to_string(counts):
+    """Same LEB128-like encoding as pycocotools rleToString."""
+    chars = []
+    for i, x in enumerate(counts):
+        if i > 2:
+            x -= counts[i - 2]
+        more = True
+        while more:
+            c = x & 0x1F
+            x >>= 5
+            more = (x != -1) if (c & 0x10) else (x != 0)
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def _rle_string_to_counts(s):
+    counts = []
+    p = 0
+    while p < len(s):
+        x = 0
+        k = 0
+        more = True
+        while more:
+            c = ord(s[p]) - 48
+            x |= (c & 0x1F) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and (c & 0x10):
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+# ------------------------------------------------------------------------------
+# Compact JSON
+# ------------------------------------------------------------------------------
+
+def encode_compact(result, image_shape, scale=1.0, delta=True, simplify_tolerance=0.0, rle_masks=False):
+    """Compact JSON form of a prediction result."""
+    height, width = image_shape[:2]
+    teeth = []
+    for tooth in result.get("teeth", []):
+        compact = {k: v for k, v in tooth.items() if k != "contour"}
+        contour = simplify_contour(tooth["contour"], simplify_tolerance) if tooth.get("contour") else []
+        compact["contour_q"] = quantize_contour(contour, scale, delta).tolist() if len(contour) else []
+        if rle_masks and len(contour) >= 3:
+            compact["mask_rle"] = rle_encode(tooth["contour"], height, width)
+        teeth.append(compact)
+
+    encoded = {k: v for k, v in result.items() if k != "teeth"}
+    encoded.update({
+        "format": "compact",
+        "version": COMPACT_VERSION,
+        "scale": scale,
+        "delta": bool(delta),
+        "image_size": [height, width],
+        "teeth": teeth,
+    })
+    return encoded
+
+
+def decode_compact(encoded, keep_masks=False):
+    """Turn a compact JSON response back into today's schema."""
+    scale = encoded["scale"]
+    delta = encoded["delta"]
+    teeth = []
+    for compact in encoded["teeth"]:
+        tooth = {k: v for k, v in compact.items() if k not in ("contour_q", "mask_rle")}
+        tooth["contour"] = dequantize_contour(compact["contour_q"], scale, delta)
+        if keep_masks and "mask_rle" in compact:
+            tooth["mask_rle"] = compact["mask_rle"]
+        teeth.append(_order_tooth(tooth))
+
+    skip = {"format", "version", "scale", "delta", "image_size", "teeth"}
+    result = {"teeth": teeth}
+    result.update({k: v for k, v in encoded.items() if k not in skip})
+    return result
+
+
+def _order_tooth(tooth):
+    """Restore the key order of today's schema."""
+    order = ["fdi", "confidence_fdi", "bbox", "contour", "status"]
+    ordered = {k: tooth[k] for k in order if k in tooth}
+    ordered.update({k: v for k, v in tooth.items() if k not in ordered})
+    return ordered
+
+
+# ------------------------------------------------------------------------------
+# Binary
+# ------------------------------------------------------------------------------
+
+def _fdi_code(label):
+    return FDI_LABELS.index(label) if label in FDI_LABELS else _UNKNOWN_FDI
+
+
+def _fdi_label(code):
+    return FDI_LABELS[code] if code < len(FDI_LABELS) else "unknown"
+
+
+def encode_binary(result, image_shape, scale=1.0, delta=True, simplify_tolerance=0.0, rle_masks=False):
+    """
+    Pack a prediction result into bytes. Per tooth: FDI class indices, float32 confidences
+    and box, status id, and the quantized polygon as int16 (or int32 when it does not fit).
+    Top-level fields other than teeth/count go into a JSON trailer.
+    """
+    import numpy as np
+
+    compact = encode_compact(result, image_shape, scale, delta, simplify_tolerance, rle_masks)
+    height, width = compact["image_size"]
+    parts = [
+        BINARY_MAGIC,
+        struct.pack("<BBfIIH", COMPACT_VERSION, int(bool(delta)), float(scale), height, width, len(compact["teeth"])),
+    ]
+
+    for tooth in compact["teeth"]:
+        coords = np.asarray(tooth["contour_q"], dtype=np.int64)
+        flags = 0
+        if tooth.get("corrected_by_heuristic"):
+            flags |= _TOOTH_CORRECTED
+        if "fdi_original" in tooth:
+            flags |= _TOOTH_HAS_ORIGINAL
+        if len(coords) == 0 or np.abs(coords).max() <= 32767:
+            flags |= _TOOTH_INT16
+        if "mask_rle" in tooth:
+            flags |= _TOOTH_HAS_RLE
+
+        status = tooth.get("status", {})
+        parts.append(struct.pack(
+            "<BBf4fbfBI",
+            _fdi_code(tooth["fdi"]),
+            _fdi_code(tooth.get("fdi_original", "")),
+            tooth["confidence_fdi"],
+            *tooth["bbox"],
+            status.get("status_id", -1),
+            status.get("confidence", 0.0),
+            flags,
+            len(coords) // 2,
+        ))
+        parts.append(coords.astype("<i2" if flags & _TOOTH_INT16 else "<i4").tobytes())
+        if flags & _TOOTH_HAS_RLE:
+            rle = tooth["mask_rle"]["counts"].encode("ascii")
+            parts.append(struct.pack("<I", len(rle)) + rle)
+
+    skip = {"format", "version", "scale", "delta", "image_size", "teeth", "count"}
+    trailer = json.dumps({k: v for k, v in compact.items() if k not in skip}, separators=(",", ":")).encode("utf-8")
+    parts.append(struct.pack("<I", len(trailer)) + trailer)
+    return b"".join(parts)
+
+
+def decode_binary(payload, keep_masks=False):
+    """Turn a binary response back into today's schema."""
+    import numpy as np
+
+    if payload[:4] != BINARY_MAGIC:
+        raise ValueError("Not a binary dental response")
+
+    offset = 4
+    version, delta, scale, height, width, n_teeth = struct.unpack_from("<BBfIIH", payload, offset)
+    offset += struct.calcsize("<BBfIIH")
+    if version != COMPACT_VERSION:
+        raise ValueError(f"Unsupported binary version: {version}")
+
+    tooth_fmt = "<BBf4fbfBI"
+    tooth_size = struct.calcsize(tooth_fmt)
+    teeth = []
+    for _ in range(n_teeth):
+        fdi, fdi_original, conf, bx1, by1, bx2, by2, status_id, status_conf, flags, n_points = struct.unpack_from(
+            tooth_fmt, payload, offset
+        )
+        offset += tooth_size
+
+        dtype = np.dtype("<i2" if flags & _TOOTH_INT16 else "<i4")
+        coords = np.frombuffer(payload, dtype=dtype, count=2 * n_points, offset=offset)
+        offset += coords.nbytes
+
+        tooth = {
+            "fdi": _fdi_label(fdi),
+            "confidence_fdi": conf,
+            "bbox": [bx1, by1, bx2, by2],
+            "contour": dequantize_contour(coords, scale, bool(delta)),
+            "status": {
+                "status_id": status_id,
+                "status_name": STATUS_LABELS.get(status_id, "unknown"),
+                "confidence": status_conf,
+            },
+        }
+        if flags & _TOOTH_HAS_ORIGINAL:
+            tooth["fdi_original"] = _fdi_label(fdi_original)
+        if flags & _TOOTH_CORRECTED:
+            tooth["corrected_by_heuristic"] = True
+
+        if flags & _TOOTH_HAS_RLE:
+            (rle_len,) = struct.unpack_from("<I", payload, offset)
+            offset += 4
+            counts = payload[offset:offset + rle_len].decode("ascii")
+            offset += rle_len
+            if keep_masks:
+                tooth["mask_rle"] = {"size": [height, width], "counts": counts}
+        teeth.append(tooth)
+
+    (trailer_len,) = struct.unpack_from("<I", payload, offset)
+    offset += 4
+    extra = json.loads(payload[offset:offset + trailer_len].decode("utf-8"))
+
+    result = {"teeth": teeth, "count": len(teeth)}
+    result.update(extra)
+    return result
+
+
+# ------------------------------------------------------------------------------
+# Endpoint helpers
+# ------------------------------------------------------------------------------
+
+def _float_param(params, name):
+    """Finite float query parameter; raises ValueError otherwise."""
+    try:
+        value = float(params[name])
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be finite")
+    return value
+
+
+def wire_options_from_query(params):
+    """
+    Read the response format from query parameters:
+    format=json|compact|binary, scale=<float>, delta=true|false, simplify=<px>, masks=rle.
+    Raises ValueError on invalid values.
+    """
+    fmt = params.get("format", "json")
+    if fmt not in WIRE_FORMATS:
+        raise ValueError(f"Unknown response format: {fmt}. Expected one of {WIRE_FORMATS}.")
+
+    options = {}
+    if "scale" in params:
+        options["scale"] = _float_param(params, "scale")
+        if not 0 < options["scale"] <= MAX_SCALE:
+            raise ValueError(f"scale must be in (0, {MAX_SCALE:g}]")
+    if "delta" in params:
+        options["delta"] = params["delta"].lower() not in ("0", "false", "no")
+    if "simplify" in params:
+        options["simplify_tolerance"] = _float_param(params, "simplify")
+        if options["simplify_tolerance"] < 0:
+            raise ValueError("simplify must be zero or positive")
+    if "masks" in params:
+        if params["masks"] != "rle":
+            raise ValueError("masks must be 'rle'")
+        options["rle_masks"] = True
+    return fmt, options
+
+
+def encode_response(result, image_shape, fmt="json", json_size=False, **options):
+    """
+    Serialize a result in the requested format.
+    Returns (body bytes, media type, size report). The report has the size of today's
+    JSON encoding ("json_bytes") for the json format, and for the compact formats only
+    with json_size=True, since it costs a full JSON serialization.
+    """
+    report = {"format": fmt}
+    if fmt == "json":
+        body, media_type = json.dumps(result, separators=(",", ":")).encode("utf-8"), "application/json"
+    elif fmt == "compact":
+        encoded = encode_compact(result, image_shape, **options)
+        body, media_type = json.dumps(encoded, separators=(",", ":")).encode("utf-8"), "application/json"
+    elif fmt == "binary":
+        body, media_type = encode_binary(result, image_shape, **options), BINARY_MEDIA_TYPE
+    else:
+        raise ValueError(f"Unknown response format: {fmt}. Expected one of {WIRE_FORMATS}.")
+
+    report["payload_bytes"] = len(body)
+    if fmt == "json":
+        report["json_bytes"] = len(body)
+    elif json_size:
+        report["json_bytes"] = len(json.dumps(result, separators=(",", ":")).encode("utf-8"))
+    return body, media_type, report
@@ -0,0 +1,78 @@
+import { describe, it, expect } from 'vitest';
+import { decodeBinary, decodeCompact, dequantizeContour } from '../wireFormat';
+
+// Binary response of one tooth, laid out as wire_format.encode_binary packs it
+const binaryResponse = ({ coords, trailer }) => {
+    const trailerBytes = new TextEncoder().encode(JSON.stringify(trailer));
+    const buffer = new ArrayBuffer(20 + 32 + 2 * coords.length + 4 + trailerBytes.length);
+    const view = new DataView(buffer);
+    new Uint8Array(buffer).set(new TextEncoder().encode('DTWB'), 0);
+    view.setUint8(4, 1); // version
+    view.setUint8(5, 1); // delta
+    view.setFloat32(6, 2, true); // scale
+    view.setUint32(10, 100, true);
+    view.setUint32(14, 200, true);
+    view.setUint16(18, 1, true);
+
+    view.setUint8(20, 0); // fdi 11
+    view.setUint8(21, 8); // fdi_original 21
+    view.setFloat32(22, 0.5, true);
+    [1, 2, 3, 4].forEach((v, k) => view.setFloat32(26 + 4 * k, v, true));
+    view.setInt8(42, 3); // status id
+    view.setFloat32(43, 0.25, true);
+    view.setUint8(47, 1 | 2 | 4); // corrected, has original, int16
+    view.setUint32(48, coords.length / 2, true);
+    coords.forEach((v, k) => view.setInt16(52 + 2 * k, v, true));
+
+    const offset = 52 + 2 * coords.length;
+    view.setUint32(offset, trailerBytes.length, true);
+    new Uint8Array(buffer).set(trailerBytes, offset + 4);
+    return buffer;
+};
+
+describe('wireFormat', () => {
+    it('dequantizeContour undoes delta encoding and scale', () => {
+        expect(dequantizeContour([10, 20, 2, -4, 6, 0], 2, true)).toEqual([[5, 10], [6, 8], [9, 8]]);
+        expect(dequantizeContour([10, 20, 2, -4], 1, false)).toEqual([[10, 20], [2, -4]]);
+    });
+
+    it('decodeCompact restores the default schema', () => {
+        const result = decodeCompact({
+            format: 'compact',
+            version: 1,
+            scale: 1,
+            delta: true,
+            image_size: [100, 200],
+            teeth: [{ fdi: '11', confidence_fdi: 0.9, bbox: [1, 2, 3, 4], contour_q: [1, 2, 1, 1, 0, 1], mask_rle: {} }],
+            count: 1,
+            model_version: 'v1',
+        });
+        expect(result).toEqual({
+            teeth: [{ fdi: '11', confidence_fdi: 0.9, bbox: [1, 2, 3, 4], contour: [[1, 2], [2, 3], [2, 4]] }],
+            count: 1,
+            model_version: 'v1',
+        });
+        expect(Object.keys(result.teeth[0])).toEqual(['fdi', 'confidence_fdi', 'bbox', 'contour']);
+    });
+
+    it('decodeBinary restores the default schema', () => {
+        const result = decodeBinary(binaryResponse({ coords: [20, 40, 2, 0, 0, 2], trailer: { model_version: 'v1' } }));
+        expect(result).toEqual({
+            teeth: [{
+                fdi: '11',
+                confidence_fdi: 0.5,
+                bbox: [1, 2, 3, 4],
+                contour: [[10, 20], [11, 20], [11, 21]],
+                status: { status_id: 3, status_name: 'Tooth with crown', confidence: 0.25 },
+                fdi_original: '21',
+                corrected_by_heuristic: true,
+            }],
+            count: 1,
+            model_version: 'v1',
+        });
+    });
+
+    it('decodeBinary rejects other payloads', () => {
+        expect(() => decodeBinary(new ArrayBuffer(24))).toThrow('Not a binary dental response');
+    });
+});
@@ -1,19 +1,46 @@
+import { decodeResponse } from './wireFormat';
+
+const PREDICT_URL = () => import.meta.env.VITE_AI_PREDICT_URL;
+
 /**
- * AI Service handles communication with Modal AI endpoints 
+ * AI Service handles communication with Modal AI endpoints
  * and local inference result management.
  */
 export const aiService = {
     /**
      * Loads the static detections.json file generated by the Modal pipeline.
+     * The file may be in the default or the compact format.
      */
     getDetections: async () => {
         try {
             const response = await fetch('/detections.json');
             if (!response.ok) throw new Error('Detections file not found');
-            return await response.json();
+            return await decodeResponse(response);
         } catch (error) {
             console.error('[AI Service] Failed to fetch detections', error);
             throw error;
         }
+    },
+
+    /**
+     * Sends a scan (Blob/File) to the Modal api_predict endpoint (VITE_AI_PREDICT_URL).
+     * The response is requested in the binary wire format and decoded back to the
+     * default teeth schema; imageId names the upload for later edits.
+     */
+    predictScan: async (image, { format = 'binary', simplify } = {}) => {
+        const url = PREDICT_URL();
+        if (!url) throw new Error('VITE_AI_PREDICT_URL is not configured');
+
+        const params = new URLSearchParams({ format });
+        if (simplify !== undefined) params.set('simplify', String(simplify));
+        try {
+            const response = await fetch(`${url}?${params}`, { method: 'POST', body: image });
+            if (!response.ok) throw new Error(`Prediction failed (${response.status})`);
+            const result = await decodeResponse(response);
+            return { ...result, imageId: response.headers.get('X-Image-Id') };
+        } catch (error) {
+            console.error('[AI Service] Failed to predict scan', error);
+            throw error;
+        }
     }
 };
@@ -0,0 +1,167 @@
+/**
+ * Decoders for the compact response formats of the Modal api_predict endpoint
+ * (modal-pipeline/models/wire_format.py). Both map back to the default teeth schema:
+ * { teeth: [{ fdi, confidence_fdi, bbox, contour, status, ... }], count, ... }.
+ */
+
+// Same order as FDI_LABELS / STATUS_LABELS in modal-pipeline/models/config.py
+export const FDI_LABELS = [
+    '11', '12', '13', '14', '15', '16', '17', '18',
+    '21', '22', '23', '24', '25', '26', '27', '28',
+    '31', '32', '33', '34', '35', '36', '37', '38',
+    '41', '42', '43', '44', '45', '46', '47', '48',
+    '91',
+];
+
+export const STATUS_LABELS = {
+    0: 'Tooth without anomalies',
+    1: 'Tooth with fillings',
+    2: 'Tooth with RCT',
+    3: 'Tooth with crown',
+    4: 'Tooth with caries',
+    5: 'Residual root',
+    6: 'Tooth with RCT and crown',
+};
+
+export const COMPACT_VERSION = 1;
+export const BINARY_MEDIA_TYPE = 'application/octet-stream';
+
+const BINARY_MAGIC = 'DTWB';
+const TOOTH_CORRECTED = 1;
+const TOOTH_HAS_ORIGINAL = 2;
+const TOOTH_INT16 = 4;
+const TOOTH_HAS_RLE = 8;
+const TOOTH_KEY_ORDER = ['fdi', 'confidence_fdi', 'bbox', 'contour', 'status'];
+const COMPACT_KEYS = ['format', 'version', 'scale', 'delta', 'image_size', 'teeth'];
+
+/**
+ * Flat quantized coordinates [x0, y0, x1, y1, ...] back to [[x, y], ...] pixels.
+ */
+export const dequantizeContour = (values, scale = 1, delta = true) => {
+    const points = [];
+    let x = 0;
+    let y = 0;
+    for (let i = 0; i + 1 < values.length; i += 2) {
+        x = delta ? x + values[i] : values[i];
+        y = delta ? y + values[i + 1] : values[i + 1];
+        points.push([x / scale, y / scale]);
+    }
+    return points;
+};
+
+const orderTooth = (tooth) => {
+    const ordered = {};
+    TOOTH_KEY_ORDER.forEach((key) => {
+        if (key in tooth) ordered[key] = tooth[key];
+    });
+    return { ...ordered, ...tooth };
+};
+
+const fdiLabel = (code) => (code < FDI_LABELS.length ? FDI_LABELS[code] : 'unknown');
+
+/**
+ * Compact JSON response (?format=compact) -> default schema.
+ */
+export const decodeCompact = (encoded, { keepMasks = false } = {}) => {
+    if (encoded.version !== COMPACT_VERSION) {
+        throw new Error(`Unsupported compact version: ${encoded.version}`);
+    }
+    const teeth = encoded.teeth.map(({ contour_q: contourQ, mask_rle: maskRle, ...rest }) => {
+        const tooth = { ...rest, contour: dequantizeContour(contourQ, encoded.scale, encoded.delta) };
+        if (keepMasks && maskRle) tooth.mask_rle = maskRle;
+        return orderTooth(tooth);
+    });
+
+    const result = { teeth };
+    Object.entries(encoded).forEach(([key, value]) => {
+        if (!COMPACT_KEYS.includes(key)) result[key] = value;
+    });
+    return result;
+};
+
+/**
+ * Binary response (?format=binary, an ArrayBuffer) -> default schema.
+ */
+export const decodeBinary = (buffer, { keepMasks = false } = {}) => {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    const text = new TextDecoder();
+    if (text.decode(bytes.subarray(0, 4)) !== BINARY_MAGIC) {
+        throw new Error('Not a binary dental response');
+    }
+
+    // Header "<BBfIIH": version, delta, scale, height, width, tooth count
+    const version = view.getUint8(4);
+    if (version !== COMPACT_VERSION) {
+        throw new Error(`Unsupported binary version: ${version}`);
+    }
+    const delta = view.getUint8(5) !== 0;
+    const scale = view.getFloat32(6, true);
+    const height = view.getUint32(10, true);
+    const width = view.getUint32(14, true);
+    const count = view.getUint16(18, true);
+    let offset = 20;
+
+    const teeth = [];
+    for (let t = 0; t < count; t += 1) {
+        // Tooth "<BBf4fbfBI": fdi, fdi_original, confidence, box, status id/confidence, flags, points
+        const fdi = view.getUint8(offset);
+        const fdiOriginal = view.getUint8(offset + 1);
+        const confidence = view.getFloat32(offset + 2, true);
+        const bbox = [0, 1, 2, 3].map((k) => view.getFloat32(offset + 6 + 4 * k, true));
+        const statusId = view.getInt8(offset + 22);
+        const statusConfidence = view.getFloat32(offset + 23, true);
+        const flags = view.getUint8(offset + 27);
+        const points = view.getUint32(offset + 28, true);
+        offset += 32;
+
+        const size = flags & TOOTH_INT16 ? 2 : 4;
+        const coords = new Array(2 * points);
+        for (let k = 0; k < coords.length; k += 1) {
+            coords[k] = size === 2 ? view.getInt16(offset + 2 * k, true) : view.getInt32(offset + 4 * k, true);
+        }
+        offset += size * coords.length;
+
+        const tooth = {
+            fdi: fdiLabel(fdi),
+            confidence_fdi: confidence,
+            bbox,
+            contour: dequantizeContour(coords, scale, delta),
+            status: {
+                status_id: statusId,
+                status_name: STATUS_LABELS[statusId] ?? 'unknown',
+                confidence: statusConfidence,
+            },
+        };
+        if (flags & TOOTH_HAS_ORIGINAL) tooth.fdi_original = fdiLabel(fdiOriginal);
+        if (flags & TOOTH_CORRECTED) tooth.corrected_by_heuristic = true;
+
+        if (flags & TOOTH_HAS_RLE) {
+            const length = view.getUint32(offset, true);
+            offset += 4;
+            if (keepMasks) {
+                const counts = text.decode(bytes.subarray(offset, offset + length));
+                tooth.mask_rle = { size: [height, width], counts };
+            }
+            offset += length;
+        }
+        teeth.push(tooth);
+    }
+
+    const trailerLength = view.getUint32(offset, true);
+    offset += 4;
+    const extra = JSON.parse(text.decode(bytes.subarray(offset, offset + trailerLength)));
+    return { teeth, count: teeth.length, ...extra };
+};
+
+/**
+ * Decode a fetch Response in any of the wire formats (json, compact, binary).
+ */
+export const decodeResponse = async (response, options) => {
+    const contentType = response.headers.get('Content-Type') || '';
+    if (contentType.startsWith(BINARY_MEDIA_TYPE)) {
+        return decodeBinary(await response.arrayBuffer(), options);
+    }
+    const body = await response.json();
+    return body && body.format === 'compact' ? decodeCompact(body, options) : body;
+};